@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the session / auth / messages queries are counted too
+    'customer.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,9 +54,12 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'TROOBA.urls'
 
+# No 'loaders' option: Django then wraps the app-directory loader in the cached loader, so each
+# template is parsed once per process (and reloaded on change while DEBUG is on).
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render time reported to the request metrics
+        'BACKEND': 'customer.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -133,4 +138,89 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
\ No newline at end of file
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Gemini forecast calls: parallel requests per page load, shared per-process quota, per-call timeout (s)
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 4))
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", 50))
+GEMINI_TIMEOUT = int(os.getenv("GEMINI_TIMEOUT", 60))
+
+# Persistent Gemini response cache: entry lifetime in seconds (0 = never expires) and max rows kept (LRU)
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 5000))
+
+# Multi-SKU forecast requests: prompt token budget per request and max SKUs per request
+GEMINI_BATCH_TOKEN_BUDGET = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", 24000))
+GEMINI_BATCH_MAX_ITEMS = int(os.getenv("GEMINI_BATCH_MAX_ITEMS", 25))
+
+# Prophet backend (manage.py fit_prophet_models): worker processes (0 = one per CPU) and holidays country
+PROPHET_MAX_WORKERS = int(os.getenv("PROPHET_MAX_WORKERS", 0))
+PROPHET_HOLIDAY_COUNTRY = os.getenv("PROPHET_HOLIDAY_COUNTRY", "IN")
+
+# Background jobs (manage.py run_workers): queue poll interval, heartbeat period, the
+# silence (s) after which a running job is considered abandoned and requeued, and how often
+# each worker looks for such jobs
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 2))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("JOB_HEARTBEAT_SECONDS", 30))
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 300))
+JOB_REQUEUE_INTERVAL = int(os.getenv("JOB_REQUEUE_INTERVAL", 60))
+JOB_WORKER_PROCESSES = int(os.getenv("JOB_WORKER_PROCESSES", 1))
+JOB_WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", 2))
+
+# Shared Gemini HTTP client: connect timeout (s), retries on connection errors / 429 / 5xx, pooled connections
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", 5))
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", 2))
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", 2 * GEMINI_MAX_CONCURRENCY))
+
+# Shared cache: single-flight locks and results for concurrent identical requests must be visible
+# to every process (the table is created by migration customer.0015)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "trooba_cache",
+    },
+    # Rendered template fragments: per process, so hundreds of lookups per page cost no queries.
+    # Their keys carry a data version, so processes never serve each other stale markup.
+    "fragments": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "trooba_fragments",
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("FRAGMENT_CACHE_ENTRIES", 5000))},
+    },
+}
+
+# Single-flight: lock lifetime (longest expected computation), how long followers wait for the
+# leader before computing themselves, and how long a result stays available to those followers (s)
+SINGLE_FLIGHT_LOCK_SECONDS = int(os.getenv("SINGLE_FLIGHT_LOCK_SECONDS", 180))
+SINGLE_FLIGHT_WAIT_SECONDS = int(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", 120))
+SINGLE_FLIGHT_RESULT_SECONDS = int(os.getenv("SINGLE_FLIGHT_RESULT_SECONDS", 30))
+
+# Prompt registry: how often (s) each process checks whether a Prompt was edited elsewhere
+PROMPT_REGISTRY_CHECK_SECONDS = float(os.getenv("PROMPT_REGISTRY_CHECK_SECONDS", 5))
+
+# Item snapshots (workflow state referenced from the session): lifetime since last use, and how
+# often saving one may enqueue a purge of the expired ones (s)
+ITEM_SNAPSHOT_TTL_SECONDS = int(os.getenv("ITEM_SNAPSHOT_TTL_SECONDS", 7 * 24 * 3600))
+ITEM_SNAPSHOT_PURGE_INTERVAL_SECONDS = int(os.getenv("ITEM_SNAPSHOT_PURGE_INTERVAL_SECONDS", 3600))
+
+# Top-items dashboard: largest ?top= accepted, N above which the page renders lean (no per-SKU
+# detail blocks) unless ?lean=0, and how long rendered per-SKU fragments are kept (s)
+TOP_ITEMS_MAX = int(os.getenv("TOP_ITEMS_MAX", 500))
+TOP_ITEMS_LEAN_AFTER = int(os.getenv("TOP_ITEMS_LEAN_AFTER", 50))
+TOP_ITEM_FRAGMENT_SECONDS = int(os.getenv("TOP_ITEM_FRAGMENT_SECONDS", 3600))
+
+# SKU charts: rendered images are kept here (one file per SKU, range and data version), drawn by
+# this many worker processes (0 = in the request), each render allowed this long (s)
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", str(BASE_DIR / "chart_cache"))
+CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", 2))
+CHART_RENDER_TIMEOUT_SECONDS = int(os.getenv("CHART_RENDER_TIMEOUT_SECONDS", 60))
+# Pruning of that directory: images older than this (s) go, then the oldest until the rest fits
+# the size cap (bytes); a render enqueues at most one purge per interval (s)
+CHART_CACHE_MAX_AGE_SECONDS = int(os.getenv("CHART_CACHE_MAX_AGE_SECONDS", 7 * 24 * 3600))
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+CHART_CACHE_PURGE_INTERVAL_SECONDS = int(os.getenv("CHART_CACHE_PURGE_INTERVAL_SECONDS", 3600))
+
+# Request metrics: report query / HTTP / render numbers in response headers, samples kept per view
+# for the /metrics/ endpoint, and the query count per request or job that logs an N+1 warning
+METRICS_HEADERS = DEBUG
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", 200))
+METRICS_QUERY_WARNING = int(os.getenv("METRICS_QUERY_WARNING", 100))
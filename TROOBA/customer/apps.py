@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CustomerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'customer'
+
+    def ready(self):
+        # Prompt change signals
+        from . import prompts  # noqa: F401
@@ -0,0 +1,181 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+from django.db import connections
+from django.db.models import Max, Min
+
+from .forecasting import FORECAST_METHODS, baseline_forecast, monthly_sales_cube
+from .models import OrderLineItem, ProductVariant
+
+logger = logging.getLogger(__name__)
+
+
+def prophet_monthly(history, horizon):
+    """Prophet on monthly totals, one fit per SKU (slow; for comparison against the fast baselines)."""
+    import pandas as pd
+    from prophet import Prophet
+
+    logging.getLogger("cmdstanpy").disabled = True
+    months = pd.date_range("2000-01-01", periods=history.shape[1], freq="MS")
+    forecasts = np.zeros((len(history), horizon))
+    for i, series in enumerate(history):
+        if np.count_nonzero(series) < 2:
+            forecasts[i] = series[-1]
+            continue
+        model = Prophet(yearly_seasonality=history.shape[1] >= 24, weekly_seasonality=False, daily_seasonality=False)
+        model.fit(pd.DataFrame({"ds": months, "y": series}))
+        future = model.make_future_dataframe(periods=horizon, freq="MS", include_history=False)
+        forecasts[i] = model.predict(future)["yhat"].to_numpy()
+    return np.clip(forecasts, 0, None)
+
+
+# name -> fn(history[n_skus, n_months], horizon) -> [n_skus, horizon]
+BACKTEST_BACKENDS = {name: partial(baseline_forecast, method=name) for name in FORECAST_METHODS}
+BACKTEST_BACKENDS["prophet"] = prophet_monthly
+
+
+def _forecast_at_cutoff(task):
+    method, cutoff, history, horizon = task
+    return method, cutoff, BACKTEST_BACKENDS[method](history, horizon)
+
+
+def accuracy_metrics(forecast, actual, groups=None, n_groups=None):
+    """MAPE / WAPE / bias in percent, computed per group in one pass.
+
+    forecast, actual: flat arrays with one cell per (cutoff, SKU, horizon step)
+    groups: group index of each cell (None = a single group)
+    MAPE skips cells that sold nothing; WAPE and bias are relative to total actual units.
+    """
+    error = forecast - actual
+    abs_error = np.abs(error)
+    nonzero = actual > 0
+    ape = np.where(nonzero, abs_error / np.where(nonzero, actual, 1), 0.0)
+    if groups is None:
+        groups = np.zeros(len(actual), dtype=np.int64)
+        n_groups = 1
+
+    def total(values):
+        out = np.zeros(n_groups)
+        np.add.at(out, groups, values)
+        return out
+
+    actual_sum = total(actual)
+    nonzero_count = total(nonzero.astype(float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "cells": total(np.ones_like(actual)),
+            "actual": actual_sum,
+            "forecast": total(forecast),
+            "mape": np.where(nonzero_count > 0, 100 * total(ape) / nonzero_count, np.nan),
+            "wape": np.where(actual_sum > 0, 100 * total(abs_error) / actual_sum, np.nan),
+            "bias": np.where(actual_sum > 0, 100 * total(error) / actual_sum, np.nan),
+        }
+
+
+def _cutoff_index(months, cutoff, default):
+    """Position of a requested cutoff month; a month outside the sales history is an error, not the default."""
+    if cutoff is None:
+        return default
+    if cutoff not in months:
+        raise ValueError(f"Cutoff {cutoff} is not a month of the sales history ({months[0]} .. {months[-1]})")
+    return months.index(cutoff)
+
+
+def run_backtest(methods, horizon=3, history_months=24, first_cutoff=None, last_cutoff=None, every=1,
+                 max_workers=None):
+    """Replays each method at every cutoff month and scores it against what actually sold.
+
+    A cutoff "YYYY-MM" forecasts that month onwards from the `history_months` before it.
+    Cutoffs run in parallel processes on one in-memory sales cube. Returns
+    {"cutoffs": [...], "results": {method: {"sku"|"category"|"horizon"|"overall": rows}}}.
+    """
+    unknown = [m for m in methods if m not in BACKTEST_BACKENDS]
+    if unknown:
+        raise ValueError(f"Unknown backtest methods {unknown}, choose from {sorted(BACKTEST_BACKENDS)}")
+
+    # Step 1: the whole sales history as one [variant, month] matrix
+    bounds = OrderLineItem.objects.aggregate(first=Min("order__order_date"), last=Max("order__order_date"))
+    if not bounds["first"]:
+        raise ValueError("No orders to backtest on")
+    start = datetime(bounds["first"].year, bounds["first"].month, 1)
+    last = bounds["last"]
+    # The last month only counts once it is complete
+    end = datetime(last.year, last.month, 1)
+    ids, months, matrix = monthly_sales_cube(start, end)
+    if not len(ids) or len(months) < 2:
+        raise ValueError("Not enough sales history to backtest")
+
+    # Step 2: cutoffs that have a full horizon of actuals after them
+    first_index = _cutoff_index(months, first_cutoff, 1)
+    last_index = _cutoff_index(months, last_cutoff, len(months) - horizon)
+    cutoffs = list(range(max(1, first_index), min(last_index, len(months) - horizon) + 1, max(1, every)))
+    if not cutoffs:
+        raise ValueError("No cutoff leaves a full horizon of actual sales; use a shorter --horizon")
+
+    tasks = [
+        (method, cutoff, matrix[:, max(0, cutoff - history_months):cutoff], horizon)
+        for method in methods
+        for cutoff in cutoffs
+    ]
+    logger.info(f"Backtest: {len(ids)} SKUs, {len(cutoffs)} cutoffs, {len(methods)} methods")
+
+    # Step 3: forecasts in worker processes (fork keeps the cube and Django setup; no DB use in workers)
+    connections.close_all()
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    forecasts = {method: np.zeros((len(cutoffs), len(ids), horizon)) for method in methods}
+    cutoff_position = {cutoff: i for i, cutoff in enumerate(cutoffs)}
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        for method, cutoff, forecast in pool.map(_forecast_at_cutoff, tasks, chunksize=max(1, len(tasks) // 64)):
+            forecasts[method][cutoff_position[cutoff]] = forecast
+
+    actual = np.stack([matrix[:, cutoff:cutoff + horizon] for cutoff in cutoffs])  # [cutoff, sku, horizon]
+
+    # Step 4: labels for grouping
+    variants = {
+        variant_id: (sku or str(variant_id), product_type or "(none)")
+        for variant_id, sku, product_type in ProductVariant.objects.filter(id__in=ids.tolist())
+        .values_list("id", "sku", "product__product_type")
+    }
+    sku_labels = [variants.get(v, (str(v), "(none)"))[0] for v in ids.tolist()]
+    categories = sorted({variants.get(v, ("", "(none)"))[1] for v in ids.tolist()})
+    category_index = {c: i for i, c in enumerate(categories)}
+    sku_category = np.array([category_index[variants.get(v, ("", "(none)"))[1]] for v in ids.tolist()])
+
+    shape = actual.shape
+    sku_cells = np.broadcast_to(np.arange(shape[1])[None, :, None], shape).ravel()
+    category_cells = sku_category[sku_cells]
+    horizon_cells = np.broadcast_to(np.arange(shape[2])[None, None, :], shape).ravel()
+    flat_actual = actual.ravel()
+
+    results = {}
+    for method in methods:
+        flat_forecast = forecasts[method].ravel()
+        results[method] = {
+            "overall": _rows(["all"], accuracy_metrics(flat_forecast, flat_actual)),
+            "horizon": _rows(
+                [f"h{h + 1}" for h in range(horizon)],
+                accuracy_metrics(flat_forecast, flat_actual, horizon_cells, horizon),
+            ),
+            "category": _rows(categories, accuracy_metrics(flat_forecast, flat_actual, category_cells, len(categories))),
+            "sku": _rows(sku_labels, accuracy_metrics(flat_forecast, flat_actual, sku_cells, len(sku_labels))),
+        }
+    return {"cutoffs": [months[c] for c in cutoffs], "horizon": horizon, "results": results}
+
+
+def _rows(keys, metrics):
+    return [
+        {
+            "key": key,
+            "cells": int(metrics["cells"][i]),
+            "actual": float(metrics["actual"][i]),
+            "forecast": round(float(metrics["forecast"][i]), 1),
+            "mape": None if np.isnan(metrics["mape"][i]) else round(float(metrics["mape"][i]), 2),
+            "wape": None if np.isnan(metrics["wape"][i]) else round(float(metrics["wape"][i]), 2),
+            "bias": None if np.isnan(metrics["bias"][i]) else round(float(metrics["bias"][i]), 2),
+        }
+        for i, key in enumerate(keys)
+    ]
@@ -0,0 +1,51 @@
+"""Chart drawing, kept free of Django imports so the render pool's processes start light.
+
+Everything here takes a plain spec dict and returns image bytes.
+"""
+import io
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+from matplotlib.figure import Figure  # noqa: E402
+
+CONTENT_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+ACTUAL_COLOR = "#4361ee"
+PREDICTED_COLOR = "#f59e0b"
+
+
+def render_chart(spec):
+    """spec: {"title", "months": [...], "actual": [...], "predicted": [...] or None, "format": "png"|"svg"}.
+
+    Actual units are drawn as bars, predictions as a line over the same months (None = no value).
+    """
+    months = spec["months"]
+    positions = list(range(len(months)))
+
+    # Figure without pyplot: no global state, so concurrent renders cannot interfere
+    figure = Figure(figsize=(8, 3.2), dpi=100)
+    axes = figure.subplots()
+    axes.bar(
+        [p for p, v in zip(positions, spec["actual"]) if v is not None],
+        [v for v in spec["actual"] if v is not None],
+        color=ACTUAL_COLOR, label="Actual",
+    )
+    if spec.get("predicted"):
+        points = [(p, v) for p, v in zip(positions, spec["predicted"]) if v is not None]
+        axes.plot([p for p, _ in points], [v for _, v in points], color=PREDICTED_COLOR,
+                  marker="o", linewidth=2, label="Predicted")
+        axes.legend(frameon=False, loc="upper left")
+
+    axes.set_title(spec["title"], fontsize=11, loc="left")
+    axes.set_xticks(positions)
+    axes.set_xticklabels(months, rotation=45, ha="right", fontsize=8)
+    axes.set_ylabel("Units")
+    axes.spines[["top", "right"]].set_visible(False)
+    axes.grid(axis="y", alpha=0.3)
+    figure.tight_layout()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=spec["format"])
+    return buffer.getvalue()
@@ -0,0 +1,160 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .chart_render import render_chart
+from .features import FEATURE_HISTORY_MONTHS, feature_for_sku, feature_version
+from .forecast_runs import latest_run, run_predictions
+from .forecasting import DEFAULT_METHOD, FORECAST_METHODS, add_months
+from .jobs import enqueue
+from .single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+CHART_KINDS = ("history", "forecast")
+
+# Held in the cache while a purge job is due, so renders enqueue at most one per interval
+PURGE_KEY = "charts:purge_scheduled"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def chart_spec(kind, sku, months=12, method=None):
+    """(cache key, render spec) for a chart, or None when there is no data for the SKU / forecast.
+
+    The key covers the SKU, range, method and the data version, so it doubles as the ETag and
+    changes exactly when the chart would look different. Raises ValueError for a bad kind/method.
+    """
+    if kind not in CHART_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(CHART_KINDS)}")
+    months = max(1, min(months, FEATURE_HISTORY_MONTHS))
+    feature = feature_for_sku(sku)
+    if feature is None:
+        return None
+
+    # Step 1: actual units for the last `months` months, from the feature store
+    values = feature.monthly_sales[-months:]
+    first = add_months(feature.history_start, len(feature.monthly_sales) - len(values))
+    actual = {add_months(first, i): units for i, units in enumerate(values)}
+    version = feature_version(feature)
+    title = f"{sku}: units sold per month"
+    predicted = None
+
+    # Step 2: predictions of the latest stored run, with the reference month's actual units
+    if kind == "forecast":
+        method = method or DEFAULT_METHOD
+        if method not in FORECAST_METHODS and method != "prophet":
+            raise ValueError(f"method must be one of {sorted(FORECAST_METHODS) + ['prophet']}")
+        run = latest_run(method)
+        if run is None:
+            return None
+        by_month = run_predictions(run, [feature.variant_id]).get(feature.variant_id, {})
+        reference_key = f"{feature.reference_date.year:04d}-{feature.reference_date.month:02d}"
+        actual[reference_key] = feature.reference_month_sales
+        predicted = {month: round(p["predicted"], 1) for month, p in by_month.items()}
+        version += f":run{run.id}"
+        title = f"{sku}: {method.replace('_', ' ')} forecast vs actual"
+
+    axis = sorted(set(actual) | set(predicted or {}))
+    spec = {
+        "title": title,
+        "months": axis,
+        "actual": [actual.get(m) for m in axis],
+        "predicted": [predicted.get(m) for m in axis] if predicted is not None else None,
+    }
+    key = hashlib.sha1(f"{kind}|{sku}|{months}|{method}|{version}".encode()).hexdigest()
+    return key, spec
+
+
+def chart_path(key, fmt):
+    return Path(settings.CHART_CACHE_DIR) / key[:2] / f"{key}.{fmt}"
+
+
+def cached_chart(key, spec, fmt):
+    """Image bytes from the disk cache, rendering (once across concurrent requests) on a miss."""
+    path = chart_path(key, fmt)
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+
+    def render():
+        image = _render({**spec, "format": fmt})
+        # Written under a temporary name and renamed, so readers never see half a file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        temporary.write_bytes(image)
+        os.replace(temporary, path)
+        _schedule_purge()
+        return image
+
+    return single_flight(f"chart:{key}:{fmt}", render)
+
+
+def _render(spec):
+    global _pool
+    if settings.CHART_RENDER_WORKERS <= 0:
+        return render_chart(spec)
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the workers must not inherit the server's threads or database connections
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.CHART_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        pool = _pool
+    try:
+        return pool.submit(render_chart, spec).result(timeout=settings.CHART_RENDER_TIMEOUT_SECONDS)
+    except BrokenProcessPool:
+        logger.warning("Chart render pool broke, rendering in process")
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        return render_chart(spec)
+
+
+def purge_chart_cache():
+    """Deletes images rendered more than CHART_CACHE_MAX_AGE_SECONDS ago (older data versions are
+    never read again), then the oldest ones until the rest fits CHART_CACHE_MAX_BYTES.
+
+    Returns how many files went. Temporary files are only removed once they are that old
+    (a render may still be writing one).
+    """
+    cutoff = time.time() - settings.CHART_CACHE_MAX_AGE_SECONDS
+    files = []
+    for path in Path(settings.CHART_CACHE_DIR).glob("*/*"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if path.suffix != ".tmp" or stat.st_mtime < cutoff:
+            files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+
+    total = sum(size for _, size, _ in files)
+    deleted = 0
+    for mtime, size, path in files:
+        if mtime >= cutoff and total <= settings.CHART_CACHE_MAX_BYTES:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        deleted += 1
+    if deleted:
+        logger.info(f"Purged {deleted} cached chart images")
+    return deleted
+
+
+def _schedule_purge():
+    if not cache.add(PURGE_KEY, 1, settings.CHART_CACHE_PURGE_INTERVAL_SECONDS):
+        return
+    enqueue("purge_chart_cache", unique=True)
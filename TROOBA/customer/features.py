@@ -0,0 +1,211 @@
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils.timezone import make_aware
+
+from .forecasting import REFERENCE_DATE, add_months, monthly_sales_cube
+from .jobs import enqueue
+from .models import OrderLineItem, ProductVariant, SkuFeature
+from .promotions import promotion_summaries
+
+logger = logging.getLogger(__name__)
+
+# Months of monthly history kept per SKU (enough for the statistical forecasters' default window)
+FEATURE_HISTORY_MONTHS = 24
+
+# A bogus variant with exactly this 12-month total has always been left out of the top-SKU lists
+EXCLUDED_TOP_TOTAL = 46349
+
+# Columns the ranked SKU list can be sorted by (each has an index with reference_date in front)
+RANK_FIELDS = ("sales_12m", "sales_last_30_days", "sales_last_7_days", "price", "sku")
+
+
+class FeatureStoreNotReady(Exception):
+    """Raised by reads while the store has no rows for the reference date; `job` is the refresh filling it."""
+
+    def __init__(self, job):
+        super().__init__("SKU features are being built, try again shortly")
+        self.job = job
+
+
+def _month_start(month_key):
+    return datetime(int(month_key[:4]), int(month_key[5:]), 1)
+
+
+def refresh_sku_features(variant_ids=None, reference_date=REFERENCE_DATE):
+    """Recomputes the SkuFeature rows of `variant_ids` (None = every variant) in bulk.
+
+    Sales come from one monthly aggregate and one last-7/30-day aggregate, promotions from the
+    cached summaries; rows are replaced in one transaction. Variants without a SKU or without
+    sales in the window get no row. Returns the number of rows written.
+    """
+    reference_key = f"{reference_date.year:04d}-{reference_date.month:02d}"
+    history_start = add_months(reference_key, -FEATURE_HISTORY_MONTHS)
+
+    # Step 1: monthly units for the history window plus the reference month
+    ids, months, matrix = monthly_sales_cube(
+        _month_start(history_start), _month_start(add_months(reference_key, 1)), variant_ids
+    )
+    history, reference_month = matrix[:, :-1], matrix[:, -1]
+
+    # Step 2: last 7 / 30 days before the reference date
+    reference = make_aware(reference_date)
+    recent_qs = OrderLineItem.objects.filter(
+        order__order_date__gte=reference - timedelta(days=30),
+        order__order_date__lt=reference,
+        variant_id__in=ids.tolist(),
+    )
+    recent = {
+        row["variant_id"]: row
+        for row in recent_qs.values("variant_id").annotate(
+            last_30=Sum("quantity"),
+            last_7=Sum("quantity", filter=Q(order__order_date__gte=reference - timedelta(days=7))),
+        ).order_by()
+    }
+
+    # Step 3: descriptive fields and promotions
+    variants = {
+        row["id"]: row
+        for row in ProductVariant.objects.filter(id__in=ids.tolist())
+        .exclude(sku__isnull=True).exclude(sku="")
+        .values(
+            "id", "shopify_id", "sku", "title", "price", "created_at", "product_id",
+            "product__title", "product__product_type", "product__vendor",
+        )
+    }
+    promos = promotion_summaries([v["shopify_id"] for v in variants.values()])
+
+    sales_12m = history[:, -12:].sum(axis=1)
+    rows = []
+    for i, variant_id in enumerate(ids.tolist()):
+        variant = variants.get(variant_id)
+        if not variant:
+            continue
+        row = recent.get(variant_id, {})
+        rows.append(SkuFeature(
+            variant_id=variant_id,
+            product_id=variant["product_id"],
+            sku=variant["sku"],
+            product_title=variant["product__title"] or "",
+            variant_title=variant["title"] or "",
+            product_type=variant["product__product_type"],
+            vendor=variant["product__vendor"],
+            price=variant["price"] or 0,
+            created_at=variant["created_at"],
+            reference_date=reference_date.date(),
+            history_start=history_start,
+            monthly_sales=history[i].astype(int).tolist(),
+            sales_12m=int(sales_12m[i]),
+            sales_last_7_days=row.get("last_7") or 0,
+            sales_last_30_days=row.get("last_30") or 0,
+            reference_month_sales=int(reference_month[i]),
+            promo_summary=promos.get(variant["shopify_id"], {}),
+        ))
+
+    # Step 4: replace the rows in one go
+    with transaction.atomic():
+        stale = SkuFeature.objects.all()
+        if variant_ids is not None:
+            stale = stale.filter(variant_id__in=list(variant_ids))
+        stale.delete()
+        SkuFeature.objects.bulk_create(rows, batch_size=1000)
+    logger.info(f"Refreshed {len(rows)} SKU feature rows")
+    return len(rows)
+
+
+def features_ready(reference_date=REFERENCE_DATE):
+    return SkuFeature.objects.filter(reference_date=reference_date.date()).exists()
+
+
+def ensure_sku_features(reference_date=REFERENCE_DATE):
+    """Raises FeatureStoreNotReady until the store has rows for the reference date.
+
+    Reads never build the store themselves: a full build takes a while and every concurrent first
+    request would start its own. They all share one queued refresh job instead.
+    """
+    if not features_ready(reference_date):
+        raise FeatureStoreNotReady(enqueue("refresh_sku_features", unique=True))
+
+
+def top_features(limit=10, reference_date=REFERENCE_DATE):
+    """The `limit` best-selling SKUs of the last 12 months, with product and variant, in one query.
+
+    Raises FeatureStoreNotReady before the first build, like ranked_features and feature_for_sku.
+    """
+    ensure_sku_features(reference_date)
+    return list(
+        SkuFeature.objects.filter(reference_date=reference_date.date())
+        .exclude(sales_12m=EXCLUDED_TOP_TOTAL)
+        .select_related("variant__product")
+        .order_by("-sales_12m", "variant_id")[:limit]
+    )
+
+
+def ranked_features(fields, sort="-sales_12m", after=None, limit=50, reference_date=REFERENCE_DATE):
+    """One keyset page of the ranked SKU list as dicts with `fields` (plus variant_id and the sort column).
+
+    sort: a RANK_FIELDS name, "-" for descending; ties are broken by variant_id. after: the
+    (sort value, variant_id) of the last row of the previous page, so each page is one index range
+    scan however deep it is. The same SKUs as top_features are left out.
+    """
+    field = sort.lstrip("-")
+    if field not in RANK_FIELDS:
+        raise ValueError(f"sort must be one of {', '.join(RANK_FIELDS)} (prefix - for descending)")
+    descending = sort.startswith("-")
+
+    ensure_sku_features(reference_date)
+    qs = SkuFeature.objects.filter(reference_date=reference_date.date()).exclude(sales_12m=EXCLUDED_TOP_TOTAL)
+    if after is not None:
+        value, variant_id = after
+        beyond = Q(**{f"{field}__lt" if descending else f"{field}__gt": value})
+        qs = qs.filter(beyond | Q(**{field: value, "variant_id__gt": variant_id}))
+    columns = list(dict.fromkeys(["variant_id", field, *fields]))
+    return list(qs.order_by(sort, "variant_id").values(*columns)[:limit])
+
+
+def feature_version(feature):
+    """Changes whenever the row is rebuilt; caches of anything derived from a feature key on it."""
+    return f"{feature.reference_date}:{feature.updated_at.timestamp()}"
+
+
+def feature_for_sku(sku, reference_date=REFERENCE_DATE):
+    """The SkuFeature of a SKU (the first variant if several share it), or None."""
+    ensure_sku_features(reference_date)
+    return (
+        SkuFeature.objects.filter(reference_date=reference_date.date(), sku=sku)
+        .order_by("variant_id").first()
+    )
+
+
+def sales_by_month(feature, months=12):
+    """{"YYYY-MM": units} for the last `months` months with sales (months without sales are left out)."""
+    values = feature.monthly_sales[-months:]
+    first = add_months(feature.history_start, len(feature.monthly_sales) - len(values))
+    return {add_months(first, i): units for i, units in enumerate(values) if units}
+
+
+def feature_history(history_months, reference_date=REFERENCE_DATE, variant_ids=None):
+    """(variant_ids, months, matrix) from the store, shaped like monthly_sales_cube's result.
+
+    None when the store cannot serve the request (other reference date or a longer window),
+    so callers fall back to the database aggregate.
+    """
+    if history_months > FEATURE_HISTORY_MONTHS:
+        return None
+    qs = SkuFeature.objects.filter(reference_date=reference_date.date())
+    if variant_ids is not None:
+        qs = qs.filter(variant_id__in=list(variant_ids))
+    rows = list(qs.order_by("variant_id").values_list("variant_id", "history_start", "monthly_sales"))
+    if not rows:
+        return None
+    reference_key = f"{reference_date.year:04d}-{reference_date.month:02d}"
+    start = add_months(reference_key, -history_months)
+    months = [add_months(start, i) for i in range(history_months)]
+    matrix = np.array([sales[-history_months:] for _, _, sales in rows], dtype=float).reshape(len(rows), -1)
+    # Same membership as the aggregate: only variants that sold something in the window
+    sold = matrix.sum(axis=1) > 0
+    ids = np.array([variant_id for variant_id, _, _ in rows], dtype=np.int64)
+    return ids[sold], months, matrix[sold]
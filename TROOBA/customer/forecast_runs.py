@@ -0,0 +1,108 @@
+import logging
+from datetime import date
+
+from django.db import transaction
+
+from .forecasting import FORECAST_METHODS, REFERENCE_DATE, add_months, forecast_catalog
+from .models import ForecastRun, ProductVariant, SalesPrediction
+from .prophet_backend import stored_forecasts
+
+logger = logging.getLogger(__name__)
+
+SAVE_BATCH_SIZE = 1000
+
+
+def month_start(month_key):
+    return date(int(month_key[:4]), int(month_key[5:7]), 1)
+
+
+def month_offset(from_key, to_key):
+    return (int(to_key[:4]) - int(from_key[:4])) * 12 + int(to_key[5:7]) - int(from_key[5:7])
+
+
+def save_forecast_run(method, rows, reference_date=REFERENCE_DATE, horizon=1):
+    """Bulk-writes one forecast run.
+
+    rows: [{"variant_id", "product_id", "month": "YYYY-MM", "predicted_sales", "reason"}]
+    The run and its predictions commit together, so readers never see a partial run.
+    """
+    reference = reference_date.date() if hasattr(reference_date, "date") else reference_date
+    reference_key = f"{reference.year:04d}-{reference.month:02d}"
+    with transaction.atomic():
+        run = ForecastRun.objects.create(
+            method=method,
+            reference_date=reference,
+            horizon=horizon,
+            sku_count=len({row["variant_id"] for row in rows}),
+        )
+        SalesPrediction.objects.bulk_create(
+            (
+                SalesPrediction(
+                    run=run,
+                    product_id=row["product_id"],
+                    variant_id=row["variant_id"],
+                    date=month_start(row["month"]),
+                    horizon=month_offset(reference_key, row["month"]) + 1,
+                    predicted_sales=row["predicted_sales"],
+                    reason=row.get("reason") or "",
+                )
+                for row in rows
+            ),
+            batch_size=SAVE_BATCH_SIZE,
+        )
+    logger.info(f"Saved {method} forecast run {run.id}: {len(rows)} predictions")
+    return run
+
+
+def latest_run(method, reference_date=REFERENCE_DATE):
+    reference = reference_date.date() if hasattr(reference_date, "date") else reference_date
+    return (
+        ForecastRun.objects
+        .filter(method=method, reference_date=reference)
+        .order_by("-created_at", "-id")
+        .first()
+    )
+
+
+def run_predictions(run, variant_ids=None):
+    """{variant_id: {"YYYY-MM": {"predicted": units, "reason": text}}} in one indexed query."""
+    qs = SalesPrediction.objects.filter(run=run)
+    if variant_ids is not None:
+        qs = qs.filter(variant_id__in=variant_ids)
+    result = {}
+    for variant_id, day, predicted, reason in qs.values_list("variant_id", "date", "predicted_sales", "reason"):
+        result.setdefault(variant_id, {})[day.strftime("%Y-%m")] = {"predicted": predicted, "reason": reason}
+    return result
+
+
+def run_catalog_forecast(method, horizon=1, reference_date=REFERENCE_DATE):
+    """Forecasts every SKU with a statistical method (or the stored Prophet fits) and saves the run."""
+    if method == "prophet":
+        by_sku = stored_forecasts()
+        reason = "Prophet"
+    elif method in FORECAST_METHODS:
+        by_sku = forecast_catalog(horizon=horizon, method=method, reference_date=reference_date)
+        reason = f"Statistical baseline ({method.replace('_', ' ')})"
+    else:
+        raise ValueError(f"Unknown forecast method {method!r}")
+
+    reference_key = f"{reference_date.year:04d}-{reference_date.month:02d}"
+    months = {add_months(reference_key, h) for h in range(horizon)}
+    variants = {}
+    for variant_id, sku, product_id in (
+        ProductVariant.objects.filter(sku__in=list(by_sku)).values_list("id", "sku", "product_id")
+    ):
+        variants.setdefault(sku, (variant_id, product_id))
+
+    rows = [
+        {
+            "variant_id": variants[sku][0],
+            "product_id": variants[sku][1],
+            "month": month,
+            "predicted_sales": units,
+            "reason": reason,
+        }
+        for sku, by_month in by_sku.items() if sku in variants
+        for month, units in by_month.items() if month in months
+    ]
+    return save_forecast_run(method, rows, reference_date, horizon)
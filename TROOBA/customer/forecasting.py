@@ -0,0 +1,151 @@
+import logging
+from datetime import datetime
+
+import numpy as np
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils.timezone import make_aware
+
+from .models import OrderLineItem, ProductVariant
+
+logger = logging.getLogger(__name__)
+
+# Same "today" the forecast views use: history up to June 2025, forecasting July 2025 onwards
+REFERENCE_DATE = datetime(2025, 7, 1)
+
+
+def month_keys(start, end):
+    """['YYYY-MM', ...] for every month in [start, end)."""
+    keys = []
+    year, month = start.year, start.month
+    while (year, month) < (end.year, end.month):
+        keys.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+
+def add_months(month_key, n):
+    year, month = map(int, month_key.split("-"))
+    total = year * 12 + month - 1 + n
+    return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+
+def monthly_sales_cube(start, end, variant_ids=None):
+    """Units sold per variant per month, aggregated in the DB.
+
+    Returns (variant_ids, months, matrix) where matrix[i, j] is the quantity of
+    variant_ids[i] sold in months[j]. Variants without sales in the range are absent.
+    """
+    months = month_keys(start, end)
+    qs = OrderLineItem.objects.filter(
+        order__order_date__gte=make_aware(start),
+        order__order_date__lt=make_aware(end),
+        variant__isnull=False,
+    )
+    if variant_ids is not None:
+        qs = qs.filter(variant_id__in=variant_ids)
+    rows = list(
+        qs.annotate(month=TruncMonth("order__order_date"))
+        .values_list("variant_id", "month")
+        .annotate(qty=Sum("quantity"))
+        .order_by()
+    )
+
+    ids = np.array(sorted({r[0] for r in rows}), dtype=np.int64)
+    matrix = np.zeros((len(ids), len(months)), dtype=float)
+    if rows:
+        month_index = {m: i for i, m in enumerate(months)}
+        variant_col = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        month_col = np.fromiter((month_index[r[1].strftime("%Y-%m")] for r in rows), dtype=np.int64, count=len(rows))
+        qty_col = np.fromiter((r[2] or 0 for r in rows), dtype=float, count=len(rows))
+        np.add.at(matrix, (np.searchsorted(ids, variant_col), month_col), qty_col)
+    return ids, months, matrix
+
+
+# ---------------------------------------------------------------------------
+# Forecast methods. Each takes history[n_skus, n_months] and returns [n_skus, horizon].
+
+def seasonal_naive(history, horizon, season=12):
+    """Same month last year; falls back to the last observed month with < 1 season of history."""
+    n_months = history.shape[1]
+    if n_months < season:
+        return np.repeat(history[:, -1:], horizon, axis=1)
+    steps = np.arange(horizon)
+    return history[:, n_months - season + (steps % season)]
+
+
+def exponential_smoothing(history, horizon, alpha=0.3, beta=0.1):
+    """Holt's linear exponential smoothing, run for all SKUs at once (beta=0 gives simple smoothing)."""
+    level = history[:, 0].copy()
+    trend = np.zeros(len(history)) if history.shape[1] < 2 else history[:, 1] - history[:, 0]
+    for t in range(1, history.shape[1]):
+        previous_level = level
+        level = alpha * history[:, t] + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous_level) + (1 - beta) * trend
+    steps = np.arange(1, horizon + 1)
+    return level[:, None] + trend[:, None] * steps[None, :]
+
+
+def moving_average_trend(history, horizon, window=3):
+    """Least-squares line through the last `window` months, extrapolated."""
+    window = min(window, history.shape[1])
+    recent = history[:, -window:]
+    x = np.arange(window, dtype=float)
+    x_centered = x - x.mean()
+    denominator = (x_centered ** 2).sum()
+    slope = (recent @ x_centered) / denominator if denominator else np.zeros(len(history))
+    mean = recent.mean(axis=1)
+    steps = np.arange(1, horizon + 1)
+    # Line evaluated at x = window - 1 + step
+    return mean[:, None] + slope[:, None] * (x[-1] - x.mean() + steps)[None, :]
+
+
+FORECAST_METHODS = {
+    "seasonal_naive": seasonal_naive,
+    "exponential_smoothing": exponential_smoothing,
+    "moving_average": moving_average_trend,
+}
+DEFAULT_METHOD = "exponential_smoothing"
+
+
+def baseline_forecast(history, horizon=1, method=DEFAULT_METHOD):
+    """Non-negative unit forecasts [n_skus, horizon] from monthly history."""
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Unknown forecast method {method!r}, choose from {sorted(FORECAST_METHODS)}")
+    history = np.asarray(history, dtype=float)
+    if history.ndim != 2 or history.shape[1] == 0 or history.shape[0] == 0:
+        return np.zeros((history.shape[0] if history.ndim == 2 else 0, horizon))
+    return np.clip(FORECAST_METHODS[method](history, horizon), 0, None)
+
+
+def forecast_catalog(horizon=1, method=DEFAULT_METHOD, history_months=24, reference_date=REFERENCE_DATE,
+                     variant_ids=None):
+    """Baseline forecast for every SKU with sales in the last `history_months` months.
+
+    History comes from the SKU feature store when it covers the window, else from the orders.
+
+    Returns {sku: {"YYYY-MM": units, ...}} for the `horizon` months from reference_date.
+    """
+    # Imported here: customer.features builds on this module
+    from .features import feature_history
+
+    cube = feature_history(history_months, reference_date, variant_ids)
+    if cube is None:
+        start_key = add_months(f"{reference_date.year:04d}-{reference_date.month:02d}", -history_months)
+        start = datetime(int(start_key[:4]), int(start_key[5:]), 1)
+        cube = monthly_sales_cube(start, reference_date, variant_ids)
+    ids, months, history = cube
+    forecasts = np.rint(baseline_forecast(history, horizon, method)).astype(int)
+
+    skus = dict(
+        ProductVariant.objects.filter(id__in=ids.tolist())
+        .exclude(sku__isnull=True).exclude(sku="")
+        .values_list("id", "sku")
+    )
+    target_months = [add_months(months[-1], h + 1) for h in range(horizon)] if months else []
+    result = {}
+    for variant_id, row in zip(ids.tolist(), forecasts.tolist()):
+        sku = skus.get(variant_id)
+        if sku:
+            result[sku] = dict(zip(target_months, row))
+    return result
@@ -0,0 +1,486 @@
+import contextvars
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.db import DatabaseError, IntegrityError, connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .instrumentation import measure
+from .models import LLMResponseCache
+from .single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = "gemini-2.0-flash"
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+
+# Deterministic settings used for the forecast prompts
+FORECAST_GENERATION_CONFIG = {
+    "temperature": 0.0,
+    "topK": 1,
+    "topP": 0.9,
+}
+
+
+class RateLimiter:
+    """Allows at most `per_minute` calls in any 60 second window, shared by all threads."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.per_minute:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= 60:
+                    self._calls.popleft()
+                if len(self._calls) < self.per_minute:
+                    self._calls.append(now)
+                    return
+                wait = 60 - (now - self._calls[0])
+            time.sleep(wait)
+
+
+# One limiter per process so concurrent page loads share the quota
+rate_limiter = RateLimiter(settings.GEMINI_REQUESTS_PER_MINUTE)
+
+
+class GeminiClient:
+    """REST client for the Gemini API over one keep-alive connection pool.
+
+    Every call shares the pool, the (connect, read) timeouts and the retry policy:
+    connection errors, 429 and 5xx are retried with exponential backoff, honouring Retry-After.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, connect_timeout, read_timeout, retries, pool_size):
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            backoff_factor=1,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset({"POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+
+    def _post(self, model, method, payload, api_key, **kwargs):
+        with measure("http"):
+            return self.session.post(
+                f"{GEMINI_API_BASE}/models/{model}:{method}",
+                headers={"X-goog-api-key": api_key},
+                data=json.dumps(payload),
+                timeout=self.timeout,
+                **kwargs,
+            )
+
+    @staticmethod
+    def _payload(prompt_text, generation_config):
+        payload = {"contents": [{"parts": [{"text": prompt_text}]}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return payload
+
+    def generate(self, prompt_text, api_key, model=GEMINI_MODEL, generation_config=None):
+        """generateContent; returns the response text. Raises on failure."""
+        response = self._post(model, "generateContent", self._payload(prompt_text, generation_config), api_key)
+        response.raise_for_status()
+        data = response.json()
+        return data['candidates'][0]['content']['parts'][0]['text'].strip()
+
+    def stream(self, prompt_text, api_key, model=GEMINI_MODEL, generation_config=None):
+        """streamGenerateContent over server-sent events; yields text chunks as they arrive."""
+        response = self._post(
+            model, "streamGenerateContent", self._payload(prompt_text, generation_config), api_key,
+            params={"alt": "sse"}, stream=True,
+        )
+        with response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):].strip())
+                for candidate in event.get("candidates") or []:
+                    for part in (candidate.get("content") or {}).get("parts") or []:
+                        if part.get("text"):
+                            yield part["text"]
+
+
+# Shared by every view, job and command in the process
+client = GeminiClient(
+    connect_timeout=settings.GEMINI_CONNECT_TIMEOUT,
+    read_timeout=settings.GEMINI_TIMEOUT,
+    retries=settings.GEMINI_RETRIES,
+    pool_size=settings.GEMINI_POOL_SIZE,
+)
+
+
+def prompt_cache_key(model, generation_config, prompt_text):
+    raw = json.dumps(
+        {"model": model, "config": generation_config or {}, "prompt": prompt_text},
+        sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_cached_response(key):
+    now = timezone.now()
+    entry = (
+        LLMResponseCache.objects
+        .filter(key=key)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+        .only("id", "response")
+        .first()
+    )
+    if entry is None:
+        return None
+    LLMResponseCache.objects.filter(id=entry.id).update(last_used_at=now, hits=F("hits") + 1)
+    return entry.response
+
+
+def store_response(key, model, response_text):
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.LLM_CACHE_TTL) if settings.LLM_CACHE_TTL else None
+    try:
+        LLMResponseCache.objects.update_or_create(
+            key=key,
+            defaults={"model": model, "response": response_text, "last_used_at": now, "expires_at": expires_at},
+        )
+    except IntegrityError:
+        # Another worker stored the same prompt first; its answer is just as good
+        return
+    evict_responses()
+
+
+def forget_response(prompt_text, generation_config=None):
+    """Removes a cached answer that turned out to be unusable (e.g. not valid JSON)."""
+    key = prompt_cache_key(GEMINI_MODEL, generation_config, prompt_text)
+    LLMResponseCache.objects.filter(key=key).delete()
+
+
+def evict_responses():
+    """Drops expired entries, then the least recently used ones beyond LLM_CACHE_MAX_ENTRIES."""
+    LLMResponseCache.objects.filter(expires_at__lte=timezone.now()).delete()
+    excess = LLMResponseCache.objects.count() - settings.LLM_CACHE_MAX_ENTRIES
+    if excess > 0:
+        stale_ids = list(
+            LLMResponseCache.objects.order_by("last_used_at").values_list("id", flat=True)[:excess]
+        )
+        LLMResponseCache.objects.filter(id__in=stale_ids).delete()
+
+
+def call_gemini(prompt_text, api_key, generation_config=None, use_cache=True, model=GEMINI_MODEL):
+    """Sends one generateContent request and returns the response text. Raises on failure.
+
+    Identical (model, generation config, prompt) requests are answered from
+    LLMResponseCache, and concurrent ones share a single call; failures are never cached.
+    """
+    key = prompt_cache_key(model, generation_config, prompt_text)
+    if not use_cache:
+        rate_limiter.acquire()
+        return client.generate(prompt_text, api_key, model, generation_config)
+
+    def lookup():
+        try:
+            return get_cached_response(key)
+        except DatabaseError as e:
+            logger.warning(f"LLM cache lookup failed: {e}")
+            return None
+
+    def generate():
+        # The previous leader may have stored it while we queued for the lock
+        cached = lookup()
+        if cached is not None:
+            return cached
+        rate_limiter.acquire()
+        text = client.generate(prompt_text, api_key, model, generation_config)
+        try:
+            store_response(key, model, text)
+        except DatabaseError as e:
+            # The cache is best effort, a failed write must not lose the answer
+            logger.warning(f"LLM cache write failed: {e}")
+        return text
+
+    cached = lookup()
+    if cached is not None:
+        return cached
+    # Identical prompts in flight at the same time (other requests, other workers) share one upstream call
+    return single_flight(f"gemini:{key}", generate)
+
+
+def run_concurrently(fn, items, on_error, max_workers=None):
+    """Runs fn(item) for every item on a bounded thread pool.
+
+    Results come back in the order of `items`. When fn raises, on_error(item, exc)
+    supplies that item's result, so one failure never holds up the rest.
+    """
+    items = list(items)
+    if not items:
+        return []
+    max_workers = max(1, min(max_workers or settings.GEMINI_MAX_CONCURRENCY, len(items)))
+
+    def guarded(item):
+        try:
+            return fn(item)
+        except Exception as e:
+            logger.error(f"Gemini task failed: {e}")
+            return on_error(item, e)
+        finally:
+            # Pool threads get their own DB connections (cache lookups); don't leak them
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini") as pool:
+        # Each call runs in a copy of the caller's context, so its HTTP time counts for the request/job
+        futures = [pool.submit(contextvars.copy_context().run, guarded, item) for item in items]
+        return [future.result() for future in futures]
+
+
+# ---------------------------------------------------------------------------
+# Multi-SKU batching: pack as many SKUs per request as fit the token budget
+
+def estimate_tokens(text):
+    """Rough Gemini token count (~4 characters per token for English/JSON)."""
+    return len(text) // 4 + 1
+
+
+def clean_gemini_output(raw_text):
+    """Cleans Gemini output to extract JSON even if wrapped in markdown or extra text."""
+    text = raw_text.strip()
+
+    if text.startswith("```"):
+        text = text.strip("`")
+        lines = text.splitlines()
+        if lines and lines[0].strip().lower() == "json":
+            lines = lines[1:]
+        text = "\n".join(lines).strip()
+
+    start_idx = text.find("[")
+    end_idx = text.rfind("]")
+    if start_idx != -1 and end_idx != -1:
+        text = text[start_idx:end_idx + 1]
+
+    return text
+
+
+def pack_batches(entries, overhead_tokens, token_budget=None, max_items=None):
+    """Greedily groups (sku, text) entries so each batch fits the prompt token budget.
+
+    `overhead_tokens` is the cost of the shared template sent once per request.
+    An entry too large to share a request still goes out alone.
+    """
+    token_budget = token_budget or settings.GEMINI_BATCH_TOKEN_BUDGET
+    max_items = max_items or settings.GEMINI_BATCH_MAX_ITEMS
+    batches, current, used = [], [], overhead_tokens
+    for sku, text in entries:
+        cost = estimate_tokens(text)
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], overhead_tokens
+        current.append((sku, text))
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def predict_in_batches(entries, build_prompt, api_key, on_error, generation_config=None,
+                       overhead_tokens=0):
+    """Forecasts many SKUs with as few Gemini requests as the token budget allows.
+
+    entries:      [(sku, per-SKU prompt text)], in display order
+    build_prompt: fn([per-SKU texts]) -> full prompt; must ask for a JSON array of
+                  objects carrying a "sku" key
+    on_error:     fn(sku, exc) -> result used for SKUs that could not be predicted
+
+    Returns {sku: result dict}. A batch whose answer cannot be parsed, or that drops
+    SKUs, is split in half and retried so one bad SKU cannot sink the others.
+    """
+    def split(batch, error):
+        if len(batch) == 1:
+            return {batch[0][0]: on_error(batch[0][0], error)}
+        logger.warning(f"Batch of {len(batch)} SKUs failed ({error}), splitting")
+        middle = len(batch) // 2
+        return {**run_batch(batch[:middle]), **run_batch(batch[middle:])}
+
+    def run_batch(batch):
+        prompt = build_prompt([text for _, text in batch])
+        try:
+            raw = call_gemini(prompt, api_key, generation_config)
+        except Exception as e:
+            return split(batch, e)
+        try:
+            parsed = json.loads(clean_gemini_output(raw))
+            if not isinstance(parsed, list):
+                raise ValueError("Gemini response is not a JSON array")
+        except ValueError as e:
+            forget_response(prompt, generation_config)
+            return split(batch, e)
+
+        wanted = {sku for sku, _ in batch}
+        results = {
+            str(row.get("sku")): row
+            for row in parsed
+            if isinstance(row, dict) and str(row.get("sku")) in wanted
+        }
+        missing = [entry for entry in batch if entry[0] not in results]
+        if missing and len(missing) < len(batch):
+            # Retry only the SKUs the model dropped
+            results.update(run_batch(missing))
+        elif missing:
+            results.update(split(missing, ValueError("SKUs missing from Gemini response")))
+        return results
+
+    batches = pack_batches(entries, overhead_tokens)
+    logger.info(f"Forecasting {len(entries)} SKUs in {len(batches)} Gemini requests")
+    results = {}
+    for batch_results in run_concurrently(run_batch, batches, on_error=lambda batch, e: {
+        sku: on_error(sku, e) for sku, _ in batch
+    }):
+        results.update(batch_results)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Streaming: results are handed out per SKU as soon as their JSON object is complete
+
+def stream_gemini(prompt_text, api_key, generation_config=None, use_cache=True, model=GEMINI_MODEL):
+    """Yields response text chunks from streamGenerateContent (server-sent events).
+
+    A cached answer is yielded in one piece; a fully streamed answer is cached like call_gemini's.
+    """
+    key = prompt_cache_key(model, generation_config, prompt_text)
+    if use_cache:
+        try:
+            cached = get_cached_response(key)
+        except DatabaseError as e:
+            logger.warning(f"LLM cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            yield cached
+            return
+
+    rate_limiter.acquire()
+    parts = []
+    for text in client.stream(prompt_text, api_key, model, generation_config):
+        parts.append(text)
+        yield text
+
+    if use_cache and parts:
+        try:
+            store_response(key, model, "".join(parts).strip())
+        except DatabaseError as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+
+def iter_json_objects(chunks):
+    """Yields each top-level JSON object from a streamed array as soon as its closing brace arrives.
+
+    Markdown fences or other text around the array are ignored; objects that fail to parse are skipped.
+    """
+    buffer = []
+    depth = 0
+    in_string = escaped = False
+    for chunk in chunks:
+        for char in chunk:
+            if depth == 0 and char != "{":
+                continue
+            buffer.append(char)
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    text = "".join(buffer)
+                    buffer = []
+                    try:
+                        yield json.loads(text)
+                    except ValueError:
+                        logger.warning(f"Skipping unparsable streamed object: {text[:200]}")
+
+
+def stream_predictions(entries, build_prompt, api_key, on_error, generation_config=None, overhead_tokens=0):
+    """Like predict_in_batches, but yields (sku, result) pairs as each SKU's answer streams in.
+
+    Batches stream concurrently; SKUs a batch fails on or leaves out are retried through
+    predict_in_batches once its stream ends. Closing the generator (the client went away)
+    stops the remaining batches instead of letting them run on for nobody.
+    """
+    batches = pack_batches(entries, overhead_tokens)
+    results = queue.Queue()
+    finished = object()
+    cancelled = threading.Event()
+
+    def stream_batch(batch):
+        if cancelled.is_set():
+            return
+        wanted = dict(batch)
+        seen = set()
+        try:
+            prompt = build_prompt([text for _, text in batch])
+            chunks = stream_gemini(prompt, api_key, generation_config)
+            try:
+                for row in iter_json_objects(chunks):
+                    if cancelled.is_set():
+                        break
+                    sku = str(row.get("sku")) if isinstance(row, dict) else None
+                    if sku in wanted and sku not in seen:
+                        seen.add(sku)
+                        results.put((sku, row))
+            finally:
+                chunks.close()  # drops the HTTP stream when cancelled part way
+        except Exception as e:
+            logger.warning(f"Streaming batch of {len(batch)} SKUs failed after {len(seen)}: {e}")
+        missing = [(sku, text) for sku, text in batch if sku not in seen]
+        if missing and not cancelled.is_set():
+            for sku, row in predict_in_batches(
+                missing, build_prompt, api_key, on_error, generation_config, overhead_tokens
+            ).items():
+                results.put((sku, row))
+
+    def run_all():
+        try:
+            run_concurrently(stream_batch, batches, on_error=lambda batch, e: [
+                results.put((sku, on_error(sku, e))) for sku, _ in batch
+            ])
+        finally:
+            results.put(finished)
+
+    logger.info(f"Streaming {len(entries)} SKUs in {len(batches)} Gemini requests")
+    threading.Thread(target=run_all, name="gemini-stream", daemon=True).start()
+    try:
+        while True:
+            item = results.get()
+            if item is finished:
+                return
+            yield item
+    finally:
+        cancelled.set()
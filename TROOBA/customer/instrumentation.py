@@ -0,0 +1,197 @@
+"""Where a request's time goes: SQL queries, external HTTP calls and template rendering.
+
+collect() gathers the numbers for a block of work (each request via RequestMetricsMiddleware,
+each background job via run_job); measure(kind) times one section of it. Finished requests are
+folded into a rolling per-view aggregate served by the metrics endpoint; jobs run in the worker
+processes, so run_job stores theirs on the Job row and the endpoint summarizes those.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("db", "http", "render")
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """Counts and seconds per kind for one request or job, plus its total duration."""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.total = 0.0
+        # Pool threads started under collect() (run_concurrently) add to the same object
+        self.lock = threading.Lock()
+
+    def add(self, kind, seconds):
+        with self.lock:
+            self.counts[kind] += 1
+            self.seconds[kind] += seconds
+
+    def as_dict(self):
+        return {
+            "total_ms": round(self.total * 1000, 1),
+            **{f"{kind}_count": self.counts[kind] for kind in KINDS},
+            **{f"{kind}_ms": round(self.seconds[kind] * 1000, 1) for kind in KINDS},
+        }
+
+    def server_timing(self):
+        """Server-Timing header value, so browser dev tools show the split per request."""
+        parts = [
+            f'{kind};dur={self.seconds[kind] * 1000:.1f};desc="{self.counts[kind]} {kind}"'
+            for kind in KINDS
+        ]
+        return ", ".join(parts + [f"total;dur={self.total * 1000:.1f}"])
+
+    def __str__(self):
+        return (
+            f"{self.total * 1000:.0f} ms total, {self.counts['db']} queries ({self.seconds['db'] * 1000:.0f} ms), "
+            f"{self.counts['http']} HTTP calls ({self.seconds['http'] * 1000:.0f} ms), "
+            f"render {self.seconds['render'] * 1000:.0f} ms"
+        )
+
+
+@contextmanager
+def measure(kind):
+    """Times the block as one `kind` event of the work being collected; a no-op outside collect()."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(kind, time.perf_counter() - started)
+
+
+def _time_query(execute, sql, params, many, context):
+    with measure("db"):
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def collect(label=None):
+    """Collects RequestMetrics for the block; with a label they are also recorded in the aggregate.
+
+    Queries are counted on this thread's database connections; HTTP calls also in the threads
+    run_concurrently starts (they run in a copy of this context). Render time includes any queries
+    the templates trigger, and work left to a streaming response's iterator is not included.
+    """
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_time_query))
+            yield metrics
+    finally:
+        metrics.total = time.perf_counter() - started
+        _current.reset(token)
+        if label:
+            record(label, metrics)
+
+
+class RollingMetrics:
+    """The last METRICS_WINDOW samples per view (or job kind), in memory, per process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, label, metrics):
+        with self.lock:
+            if label not in self.samples:
+                self.samples[label] = deque(maxlen=settings.METRICS_WINDOW)
+            self.samples[label].append(metrics.as_dict())
+
+    def summary(self):
+        with self.lock:
+            samples = {label: list(rows) for label, rows in self.samples.items()}
+        return summarize(samples)
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+
+
+aggregate = RollingMetrics()
+
+
+def summarize(samples):
+    """{label: [RequestMetrics.as_dict(), ...]} -> per label count, total_ms percentiles, per field mean/max."""
+    result = {}
+    for label, rows in sorted(samples.items()):
+        if not rows:
+            continue
+        totals = sorted(row["total_ms"] for row in rows)
+        result[label] = {
+            "samples": len(rows),
+            "total_ms": {
+                "mean": round(sum(totals) / len(totals), 1),
+                "p50": totals[len(totals) // 2],
+                "p95": totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+                "max": totals[-1],
+            },
+            **{
+                field: {
+                    "mean": round(sum(row[field] for row in rows) / len(rows), 1),
+                    "max": max(row[field] for row in rows),
+                }
+                for field in rows[0] if field != "total_ms"
+            },
+        }
+    return result
+
+
+def record(label, metrics):
+    aggregate.record(label, metrics)
+    if metrics.counts["db"] > settings.METRICS_QUERY_WARNING:
+        logger.warning(f"{label}: {metrics.counts['db']} queries in one go; look for a query per row (N+1)")
+
+
+class RequestMetricsMiddleware:
+    """Collects metrics for every request, records them under the view name and, when
+    METRICS_HEADERS is on (default: DEBUG), reports them in the response headers."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect() as metrics:
+            response = self.get_response(request)
+        match = request.resolver_match
+        record(match.view_name if match else "unresolved", metrics)
+
+        if settings.METRICS_HEADERS:
+            response["Server-Timing"] = metrics.server_timing()
+            response["X-DB-Queries"] = metrics.counts["db"]
+            response["X-HTTP-Calls"] = metrics.counts["http"]
+        return response
+
+
+class _TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with measure("render"):
+            return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with each top-level render timed (includes render inside it)."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name).template, self)
@@ -0,0 +1,272 @@
+import hashlib
+import importlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .instrumentation import collect, summarize
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# kind -> fn(progress, **params); filled by @task in customer.tasks
+TASKS = {}
+TASK_MODULE = "customer.tasks"
+
+
+def task(kind):
+    """Registers fn(progress, **params) as the handler for jobs of `kind`. The return value must be JSON-able."""
+    def register(fn):
+        TASKS[kind] = fn
+        return fn
+    return register
+
+
+def get_task(kind):
+    if not TASKS:
+        importlib.import_module(TASK_MODULE)
+    return TASKS[kind]
+
+
+def unique_key(kind, params):
+    return hashlib.sha256(json.dumps([kind, params], sort_keys=True).encode()).hexdigest()
+
+
+def enqueue(kind, params=None, unique=False, max_attempts=1):
+    """Queues a job and returns it immediately.
+
+    unique=True returns the queued/running job enqueued with unique=True for the same kind and
+    params instead of adding a duplicate (e.g. a page reloaded while its forecast is still running).
+    The job holds a unique key until it finishes, so concurrent calls cannot both create one.
+    """
+    params = params or {}
+    get_task(kind)  # fail in the view, not in the worker, on a typo
+    if not unique:
+        return Job.objects.create(kind=kind, params=params, max_attempts=max_attempts)
+
+    key = unique_key(kind, params)
+    for attempt in range(3):
+        job = Job.objects.filter(unique_key=key).first()
+        if job is not None:
+            return job
+        try:
+            with transaction.atomic():
+                return Job.objects.create(kind=kind, params=params, max_attempts=max_attempts, unique_key=key)
+        except IntegrityError:
+            # Created concurrently: read it back next time round (or create again if it already finished)
+            if attempt == 2:
+                raise
+
+
+def current_claim(job):
+    """The job's row while it is still held by this claim (worker and attempt).
+
+    Once requeue_stale_jobs has handed the job to another worker, updates through it match nothing.
+    """
+    return Job.objects.filter(id=job.id, status=Job.RUNNING, worker=job.worker, attempts=job.attempts)
+
+
+def report_progress(job, fraction, message=""):
+    now = timezone.now()
+    current_claim(job).update(
+        progress=max(0.0, min(float(fraction), 1.0)),
+        message=message[:255],
+        heartbeat_at=now,
+    )
+
+
+def claim_job(worker_name):
+    """Takes the oldest queued job, or returns None.
+
+    SKIP LOCKED lets many workers poll the same table without waiting on each other;
+    the conditional UPDATE keeps claiming safe on backends without row locks (SQLite).
+    """
+    with transaction.atomic():
+        qs = Job.objects.filter(status=Job.QUEUED).order_by("created_at", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        job = qs.first()
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(id=job.id, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            worker=worker_name,
+            attempts=job.attempts + 1,
+            started_at=now,
+            heartbeat_at=now,
+            finished_at=None,
+        )
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    return job
+
+
+def run_job(job):
+    """Runs a claimed job and records its result, error and final status.
+
+    Returns False when the job failed, or when it was requeued as stale while it ran here (the
+    other worker's run then records the outcome and this one is dropped).
+    """
+    def progress(fraction, message=""):
+        report_progress(job, fraction, message)
+
+    # Keeps heartbeat_at fresh while the task is busy between progress reports
+    finished = threading.Event()
+
+    def heartbeat():
+        try:
+            while not finished.wait(settings.JOB_HEARTBEAT_SECONDS):
+                current_claim(job).update(heartbeat_at=timezone.now())
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=heartbeat, name=f"job-{job.id}-heartbeat", daemon=True).start()
+    try:
+        # Queries and HTTP calls of the task itself (the heartbeat thread is not counted)
+        with collect(f"job:{job.kind}") as metrics:
+            result = get_task(job.kind)(progress, **job.params)
+    except Exception as e:
+        logger.exception(f"Job {job.id} ({job.kind}) failed")
+        retry = job.attempts < job.max_attempts
+        succeeded = False
+        updated = current_claim(job).update(
+            status=Job.QUEUED if retry else Job.FAILED,
+            unique_key=F("unique_key") if retry else None,
+            error=f"{e}\n\n{traceback.format_exc()}",
+            message=f"Failed: {e}"[:255],
+            metrics=metrics.as_dict(),
+            finished_at=None if retry else timezone.now(),
+        )
+    else:
+        succeeded = True
+        updated = current_claim(job).update(
+            status=Job.DONE,
+            unique_key=None,
+            progress=1.0,
+            result=result,
+            error="",
+            # Stored with the job, so the web processes can report on work done in the workers
+            metrics=metrics.as_dict(),
+            finished_at=timezone.now(),
+        )
+    finally:
+        finished.set()
+
+    if not updated:
+        logger.warning(f"Job {job.id} ({job.kind}) was requeued while running here; outcome dropped")
+        return False
+    if succeeded:
+        logger.info(f"Job {job.id} ({job.kind}) done: {metrics}")
+    return succeeded
+
+
+def requeue_stale_jobs(stale_after=None):
+    """Puts running jobs whose worker stopped reporting (crash, kill -9) back in the queue."""
+    stale_after = stale_after or settings.JOB_STALE_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED, unique_key=None, error="Worker stopped responding", finished_at=timezone.now()
+    )
+    requeued = stale.update(status=Job.QUEUED, message="Requeued after worker timeout")
+    return requeued, failed
+
+
+def _requeue_stale(worker_name):
+    try:
+        requeued, failed = requeue_stale_jobs()
+    except DatabaseError as e:
+        logger.warning(f"{worker_name}: requeueing stale jobs failed ({e})")
+        return
+    if requeued or failed:
+        logger.info(f"{worker_name}: requeued {requeued} abandoned jobs, gave up on {failed}")
+
+
+def work(worker_name, stop_event, poll_interval=None, once=False):
+    """Claims and runs jobs until stop_event is set (or the queue is empty when once=True).
+
+    Every JOB_REQUEUE_INTERVAL seconds (and on start) it also requeues jobs whose worker died,
+    so they are picked up again without restarting the workers.
+    """
+    poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+    next_requeue = 0.0
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            if time.monotonic() >= next_requeue:
+                _requeue_stale(worker_name)
+                next_requeue = time.monotonic() + settings.JOB_REQUEUE_INTERVAL
+            try:
+                job = claim_job(worker_name)
+            except DatabaseError as e:
+                logger.warning(f"{worker_name}: claiming failed ({e}), retrying")
+                job = None
+            if job is None:
+                if once:
+                    return
+                stop_event.wait(poll_interval)
+                continue
+            logger.info(f"{worker_name}: running job {job.id} ({job.kind})")
+            run_job(job)
+    finally:
+        connections.close_all()
+
+
+def worker_name(thread_index):
+    return f"{socket.gethostname()}:{os.getpid()}:{thread_index}"
+
+
+def run_worker_threads(threads, stop_event, once=False):
+    """Runs `threads` worker loops in this process and waits for them."""
+    pool = [
+        threading.Thread(target=work, args=(worker_name(i), stop_event), kwargs={"once": once}, name=f"job-worker-{i}")
+        for i in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    while any(thread.is_alive() for thread in pool):
+        for thread in pool:
+            thread.join(timeout=1)
+
+
+def job_metrics_summary(window=None):
+    """Per kind summary (like the per-view one) of the metrics stored on the last `window` finished jobs of each kind."""
+    window = window or settings.METRICS_WINDOW
+    samples = {}
+    for kind in Job.objects.order_by().values_list("kind", flat=True).distinct():
+        rows = (
+            Job.objects.filter(kind=kind, status__in=[Job.DONE, Job.FAILED], metrics__isnull=False)
+            .order_by("-finished_at").values_list("metrics", flat=True)[:window]
+        )
+        samples[f"job:{kind}"] = list(rows)
+    return summarize(samples)
+
+
+def job_payload(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": round(job.progress, 3),
+        "message": job.message,
+        "result": job.result if job.status == Job.DONE else None,
+        "error": job.error.split("\n\n", 1)[0] if job.status == Job.FAILED else "",
+        "attempts": job.attempts,
+        "metrics": job.metrics,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
@@ -0,0 +1,71 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customer.backtest import BACKTEST_BACKENDS, run_backtest
+from customer.forecasting import DEFAULT_METHOD
+
+SCOPES = ['overall', 'horizon', 'category', 'sku']
+
+
+class Command(BaseCommand):
+    help = 'Replay forecasts at many historical cutoffs and report MAPE / WAPE / bias per SKU, category and horizon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--method', action='append', choices=sorted(BACKTEST_BACKENDS),
+                            help=f'Backend to score; repeatable (default {DEFAULT_METHOD})')
+        parser.add_argument('--horizon', type=int, default=3, help='Months forecast at each cutoff (default 3)')
+        parser.add_argument('--history-months', type=int, default=24)
+        parser.add_argument('--from', dest='first_cutoff', help='First cutoff month YYYY-MM (default: earliest)')
+        parser.add_argument('--to', dest='last_cutoff', help='Last cutoff month YYYY-MM (default: latest)')
+        parser.add_argument('--every', type=int, default=1, help='Months between cutoffs (default 1)')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU)')
+        parser.add_argument('--output', help='Write every metric row to this CSV file')
+        parser.add_argument('--top', type=int, default=10, help='Worst SKUs by WAPE to print (default 10)')
+
+    def handle(self, *args, **options):
+        methods = options['method'] or [DEFAULT_METHOD]
+        started = time.monotonic()
+        try:
+            report = run_backtest(
+                methods,
+                horizon=options['horizon'],
+                history_months=options['history_months'],
+                first_cutoff=options['first_cutoff'],
+                last_cutoff=options['last_cutoff'],
+                every=options['every'],
+                max_workers=options['workers'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        cutoffs = report['cutoffs']
+        self.stdout.write(f"{len(cutoffs)} cutoffs ({cutoffs[0]} .. {cutoffs[-1]}), horizon {report['horizon']} "
+                          f"months, {time.monotonic() - started:.1f}s")
+        for method, scopes in report['results'].items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{method}"))
+            for scope in ['overall', 'horizon', 'category']:
+                for row in scopes[scope]:
+                    self.stdout.write(self._format(scope, row))
+            worst = sorted((r for r in scopes['sku'] if r['wape'] is not None), key=lambda r: -r['wape'])
+            for row in worst[:options['top']]:
+                self.stdout.write(self._format('sku', row))
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['method', 'scope', 'key', 'cells', 'actual', 'forecast', 'mape', 'wape', 'bias'])
+                for method, scopes in report['results'].items():
+                    for scope in SCOPES:
+                        for row in scopes[scope]:
+                            writer.writerow([method, scope, row['key'], row['cells'], row['actual'], row['forecast'],
+                                             row['mape'], row['wape'], row['bias']])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    @staticmethod
+    def _format(scope, row):
+        def pct(value):
+            return '   n/a' if value is None else f'{value:6.1f}'
+        return (f"  {scope:<9} {str(row['key'])[:40]:<40} MAPE {pct(row['mape'])}%  "
+                f"WAPE {pct(row['wape'])}%  bias {pct(row['bias'])}%  ({row['cells']} cells)")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from customer.models import ProductVariant
+from customer.prophet_backend import PROPHET_AVAILABLE, fit_prophet_models
+
+
+class Command(BaseCommand):
+    help = 'Fit Prophet forecasts for every SKU whose sales history changed since the last fit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, default=3, help='Months to forecast (default 3)')
+        parser.add_argument('--history-months', type=int, default=24)
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default PROPHET_MAX_WORKERS)')
+        parser.add_argument('--sku', action='append', help='Only fit this SKU; repeatable')
+        parser.add_argument('--force', action='store_true', help='Refit even when the history is unchanged')
+
+    def handle(self, *args, **options):
+        if not PROPHET_AVAILABLE:
+            raise CommandError('prophet is not installed (pip install prophet)')
+
+        variant_ids = None
+        if options['sku']:
+            variant_ids = list(ProductVariant.objects.filter(sku__in=options['sku']).values_list('id', flat=True))
+            if not variant_ids:
+                raise CommandError('No variants match the given SKUs')
+
+        counts = fit_prophet_models(
+            horizon=options['horizon'],
+            history_months=options['history_months'],
+            variant_ids=variant_ids,
+            max_workers=options['workers'],
+            force=options['force'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Fitted {counts['fitted']}, unchanged {counts['unchanged']}, "
+            f"too little history {counts['too_short']}, failed {counts['failed']}"
+        ))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customer.jobs import enqueue
+from customer.promotions import import_promotion_report
+
+
+class Command(BaseCommand):
+    help = 'Import a Google Shopping product report CSV into CustomerPromotion for one month'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path to the report CSV (comma or tab separated)')
+        parser.add_argument('--month', required=True, help='Report month as YYYY-MM')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per bulk upsert')
+        parser.add_argument('--encoding', default='utf-8-sig', help='File encoding (Google "CSV for Excel" is utf-16)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['file'], newline='', encoding=options['encoding']) as fh:
+                imported, skipped = import_promotion_report(fh, options['month'], chunk_size=options['chunk_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        # Promotion summaries are part of every SKU's features
+        enqueue('refresh_sku_features', unique=True)
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} rows without a parseable product/variant id'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} promotion rows for {options['month']} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from customer.snapshots import purge_expired_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Delete expired item snapshots (saving snapshots also enqueues this job at most once per purge interval)'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_snapshots()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired item snapshots"))
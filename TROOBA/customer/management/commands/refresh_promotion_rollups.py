@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from customer.promotions import refresh_promotion_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-category promotion rollup table (import_promotions does this for its month)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', action='append', help='YYYY-MM to rebuild; repeatable, default all months')
+
+    def handle(self, *args, **options):
+        written = refresh_promotion_rollups(options['month'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} promotion rollup rows'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customer.features import refresh_sku_features
+from customer.models import ProductVariant
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-SKU feature store (the Shopify sync refreshes the variants it changed by itself)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sku', action='append', help='Only refresh this SKU; repeatable')
+
+    def handle(self, *args, **options):
+        variant_ids = None
+        if options['sku']:
+            variant_ids = list(ProductVariant.objects.filter(sku__in=options['sku']).values_list('id', flat=True))
+            if not variant_ids:
+                raise CommandError('No variants match the given SKUs')
+
+        started = time.monotonic()
+        count = refresh_sku_features(variant_ids)
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {count} SKU feature rows in {time.monotonic() - started:.1f}s"))
@@ -0,0 +1,56 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from customer.jobs import run_worker_threads
+
+
+def _worker_process(threads, once):
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    run_worker_threads(threads, stop_event, once=once)
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers (Shopify sync, forecasts, prompt generation) against the jobs table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKER_PROCESSES,
+                            help='Worker processes (default JOB_WORKER_PROCESSES)')
+        parser.add_argument('--threads', type=int, default=settings.JOB_WORKER_THREADS,
+                            help='Worker threads per process (default JOB_WORKER_THREADS)')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        threads = max(1, options['threads'])
+        once = options['once']
+
+        self.stdout.write(f'Starting {processes} worker process(es) x {threads} thread(s)')
+
+        if processes == 1:
+            _worker_process(threads, once)
+            return
+
+        # Children open their own connections; never share the parent's
+        connections.close_all()
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+        children = [
+            context.Process(target=_worker_process, args=(threads, once), name=f'job-worker-process-{i}')
+            for i in range(processes)
+        ]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+            for child in children:
+                child.join()
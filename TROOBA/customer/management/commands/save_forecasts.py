@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from customer.forecast_runs import run_catalog_forecast
+from customer.forecasting import DEFAULT_METHOD, FORECAST_METHODS
+
+
+class Command(BaseCommand):
+    help = 'Forecast the whole catalog with a statistical method (or stored Prophet fits) and save it as a run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--method', default=DEFAULT_METHOD, choices=sorted(FORECAST_METHODS) + ['prophet'])
+        parser.add_argument('--horizon', type=int, default=1, help='Months to forecast (default 1)')
+
+    def handle(self, *args, **options):
+        if options['horizon'] < 1:
+            raise CommandError('--horizon must be at least 1')
+        run = run_catalog_forecast(options['method'], horizon=options['horizon'])
+        self.stdout.write(self.style.SUCCESS(f'Saved {run} with {run.sku_count} SKUs'))
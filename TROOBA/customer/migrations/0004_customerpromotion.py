@@ -0,0 +1,155 @@
+# Generated by Django 4.2 on 2026-10-19 14:38
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+
+# Old per-month tables and the month key they are folded into
+MONTHLY_TABLES = [
+    ('2025-04', 'CustomerPromotion_April'),
+    ('2025-05', 'CustomerPromotion_May'),
+    ('2025-06', 'CustomerPromotion_June'),
+]
+
+# The June table used shorter column names for the same metrics
+JUNE_RENAMES = {
+    'cost_conv': 'cost_per_conv',
+    'conv_value_click': 'conv_value_per_click',
+    'value_conv': 'value_per_conv',
+    'all_conv_value_click': 'all_conv_value_per_click',
+    'all_conv_value_cost': 'all_conv_value_per_cost',
+    'cost_all_conv': 'cost_per_all_conv',
+    'value_all_conv': 'value_per_all_conv',
+}
+
+# Columns that were strings in at least one of the old tables
+TEXT_NUMERIC_FIELDS = ['price', 'ctr', 'conv_rate', 'all_conv_rate']
+
+NON_NUMERIC = re.compile(r"[^0-9.\-]")
+
+
+def to_decimal(value):
+    """'12.5%', '₹1,299.00', '--' -> Decimal('12.5'), Decimal('1299.00'), None."""
+    if value is None or isinstance(value, Decimal):
+        return value
+    cleaned = NON_NUMERIC.sub('', str(value))
+    if cleaned in ('', '-', '.'):
+        return None
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        return None
+
+
+def fold_monthly_tables(apps, schema_editor):
+    CustomerPromotion = apps.get_model('customer', 'CustomerPromotion')
+    target_fields = {f.name for f in CustomerPromotion._meta.concrete_fields} - {'id', 'month'}
+
+    for month, model_name in MONTHLY_TABLES:
+        model = apps.get_model('customer', model_name)
+        batch = []
+        previous = None
+        # Ordered by variant so duplicates are adjacent; the latest row for a variant wins
+        for row in model.objects.order_by('variant_id', 'id').values().iterator(chunk_size=2000):
+            row.pop('id')
+            for old, new in JUNE_RENAMES.items():
+                if old in row:
+                    row[new] = row.pop(old)
+            for field in TEXT_NUMERIC_FIELDS:
+                row[field] = to_decimal(row.get(field))
+
+            obj = CustomerPromotion(month=month, **{k: v for k, v in row.items() if k in target_fields})
+            if previous is not None and previous.variant_id == obj.variant_id:
+                batch[-1] = obj
+            else:
+                batch.append(obj)
+            previous = obj
+
+            if len(batch) >= 2000:
+                # Keep the last one back, a duplicate of it may still follow
+                CustomerPromotion.objects.bulk_create(batch[:-1])
+                batch = batch[-1:]
+        CustomerPromotion.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0003_alter_productvariant_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerPromotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.CharField(max_length=7)),
+                ('title', models.CharField(max_length=255)),
+                ('item_id', models.CharField(max_length=255)),
+                ('product_id', models.BigIntegerField()),
+                ('variant_id', models.BigIntegerField()),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('clicks', models.IntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('conv_value', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('conv_value_per_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('impressions', models.IntegerField(default=0)),
+                ('ctr', models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True)),
+                ('avg_cpc', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('conversions', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('cost_per_conv', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('conv_value_per_click', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('value_per_conv', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('conv_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True)),
+                ('all_conv', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('all_conv_value_per_click', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('all_conv_value_per_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('cost_per_all_conv', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('value_per_all_conv', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('all_conv_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True)),
+                ('all_conv_value', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('units_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('avg_order_value', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('orders', models.IntegerField(default=0)),
+                ('avg_basket_size', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('gross_profit', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('cost_of_goods_sold', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('lead_units_sold', models.IntegerField(default=0)),
+                ('cross_sell_units_sold', models.IntegerField(default=0)),
+                ('lead_revenue', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('cross_sell_revenue', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('cross_device_conv', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('cross_device_conv_value', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('category_1st_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_2nd_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_3rd_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_4th_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_5th_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('product_type_1st_level', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+            options={
+                'db_table': 'customer_promotion',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='customerpromotion',
+            index=models.Index(fields=['month'], name='customer_promotion_month'),
+        ),
+        migrations.AddConstraint(
+            model_name='customerpromotion',
+            constraint=models.UniqueConstraint(fields=('variant_id', 'month'), name='customer_promotion_variant_month'),
+        ),
+        migrations.RunPython(fold_monthly_tables, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='CustomerPromotion_April',
+        ),
+        migrations.DeleteModel(
+            name='CustomerPromotion_June',
+        ),
+        migrations.DeleteModel(
+            name='CustomerPromotion_May',
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 4.2 on 2026-10-19 14:43
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+CATEGORY_LEVEL_FIELDS = [
+    'category_1st_level',
+    'category_2nd_level',
+    'category_3rd_level',
+    'category_4th_level',
+    'category_5th_level',
+]
+
+METRICS = ['products', 'impressions', 'clicks', 'spend', 'conversions', 'conv_value', 'revenue', 'gross_profit']
+
+
+def ratio(numerator, denominator, scale=1):
+    if not denominator:
+        return None
+    return round(float(numerator or 0) / float(denominator) * scale, 4)
+
+
+def build_rollups(apps, schema_editor):
+    """Rollups for the promotion months 0004 folded in (same aggregates as refresh_promotion_rollups)."""
+    CustomerPromotion = apps.get_model('customer', 'CustomerPromotion')
+    PromotionCategoryRollup = apps.get_model('customer', 'PromotionCategoryRollup')
+
+    rollups = []
+    for level in range(len(CATEGORY_LEVEL_FIELDS) + 1):
+        group_by = ['month'] + CATEGORY_LEVEL_FIELDS[:level]
+        rows = (
+            CustomerPromotion.objects.order_by().values(*group_by)
+            .annotate(
+                products=Count('id'),
+                impressions=Sum('impressions'),
+                clicks=Sum('clicks'),
+                spend=Sum('cost'),
+                conversions=Sum('conversions'),
+                conv_value=Sum('conv_value'),
+                revenue=Sum('revenue'),
+                gross_profit=Sum('gross_profit'),
+            )
+        )
+        for row in rows:
+            metrics = {k: row[k] or 0 for k in METRICS}
+            rollups.append(PromotionCategoryRollup(
+                level=level,
+                roas=ratio(metrics['conv_value'], metrics['spend']),
+                ctr=ratio(metrics['clicks'], metrics['impressions'], 100),
+                conv_rate=ratio(metrics['conversions'], metrics['clicks'], 100),
+                **{f: row[f] for f in group_by},
+                **metrics,
+            ))
+    PromotionCategoryRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0004_customerpromotion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromotionCategoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.CharField(max_length=7)),
+                ('level', models.PositiveSmallIntegerField()),
+                ('category_1st_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_2nd_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_3rd_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_4th_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('category_5th_level', models.CharField(blank=True, max_length=255, null=True)),
+                ('products', models.IntegerField(default=0)),
+                ('impressions', models.BigIntegerField(default=0)),
+                ('clicks', models.BigIntegerField(default=0)),
+                ('spend', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('conversions', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('conv_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('gross_profit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('roas', models.FloatField(blank=True, null=True)),
+                ('ctr', models.FloatField(blank=True, null=True)),
+                ('conv_rate', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'customer_promotion_category_rollup',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='promotioncategoryrollup',
+            index=models.Index(fields=['month', 'level'], name='promo_rollup_month_level'),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
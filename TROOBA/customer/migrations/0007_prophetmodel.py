@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-19 14:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0006_llmresponsecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProphetModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('model_json', models.TextField()),
+                ('forecast', models.JSONField(default=dict)),
+                ('history_end', models.DateField()),
+                ('fitted_at', models.DateTimeField(auto_now=True)),
+                ('fit_seconds', models.FloatField(default=0)),
+                ('variant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='prophet_model', to='customer.productvariant')),
+            ],
+            options={
+                'db_table': 'customer_prophet_model',
+            },
+        ),
+    ]
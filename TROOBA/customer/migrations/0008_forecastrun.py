@@ -0,0 +1,76 @@
+# Generated by Django 4.2 on 2026-10-19 14:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0007_prophetmodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=50)),
+                ('reference_date', models.DateField()),
+                ('horizon', models.PositiveSmallIntegerField()),
+                ('sku_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'customer_forecast_run',
+            },
+        ),
+        migrations.AddField(
+            model_name='salesprediction',
+            name='horizon',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='salesprediction',
+            name='reason',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='salesprediction',
+            name='variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='customer.productvariant'),
+        ),
+        migrations.AlterField(
+            model_name='salesprediction',
+            name='day_of_week',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='salesprediction',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='customer.location'),
+        ),
+        migrations.AlterField(
+            model_name='salesprediction',
+            name='season',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='salesprediction',
+            name='time_slot',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='salesprediction',
+            name='run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='predictions', to='customer.forecastrun'),
+        ),
+        migrations.AddIndex(
+            model_name='salesprediction',
+            index=models.Index(fields=['run', 'variant', 'date'], name='sales_prediction_run_variant'),
+        ),
+        migrations.AddIndex(
+            model_name='forecastrun',
+            index=models.Index(fields=['method', 'reference_date', 'created_at'], name='forecast_run_latest'),
+        ),
+    ]
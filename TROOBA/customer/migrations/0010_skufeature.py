@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-19 15:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0009_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkuFeature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(db_index=True, max_length=100)),
+                ('product_title', models.CharField(max_length=255)),
+                ('variant_title', models.CharField(blank=True, default='', max_length=255)),
+                ('product_type', models.CharField(blank=True, max_length=255, null=True)),
+                ('vendor', models.CharField(blank=True, max_length=255, null=True)),
+                ('price', models.FloatField(default=0)),
+                ('created_at', models.TextField(blank=True, null=True)),
+                ('reference_date', models.DateField()),
+                ('history_start', models.CharField(max_length=7)),
+                ('monthly_sales', models.JSONField(default=list)),
+                ('sales_12m', models.IntegerField(default=0)),
+                ('sales_last_7_days', models.IntegerField(default=0)),
+                ('sales_last_30_days', models.IntegerField(default=0)),
+                ('reference_month_sales', models.IntegerField(default=0)),
+                ('promo_summary', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='customer.product')),
+                ('variant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='features', to='customer.productvariant')),
+            ],
+            options={
+                'db_table': 'customer_sku_feature',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='skufeature',
+            index=models.Index(fields=['reference_date', '-sales_12m'], name='sku_feature_rank'),
+        ),
+    ]
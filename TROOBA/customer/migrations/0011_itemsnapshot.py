@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-19 15:10
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0010_skufeature'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('items', models.JSONField(default=list)),
+                ('item_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'customer_item_snapshot',
+            },
+        ),
+    ]
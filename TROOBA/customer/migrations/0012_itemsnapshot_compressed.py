@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-19 16:02
+
+import json
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def compress_items(apps, schema_editor):
+    """Moves existing snapshots from the JSON column to compressed data with a fresh lifetime."""
+    ItemSnapshot = apps.get_model('customer', 'ItemSnapshot')
+    expires_at = timezone.now() + timedelta(seconds=settings.ITEM_SNAPSHOT_TTL_SECONDS)
+    for snapshot in ItemSnapshot.objects.all().iterator():
+        payload = json.dumps(snapshot.items, sort_keys=True, separators=(',', ':'), default=str)
+        snapshot.data = zlib.compress(payload.encode('utf-8'))
+        snapshot.expires_at = expires_at
+        snapshot.save(update_fields=['data', 'expires_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0011_itemsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemsnapshot',
+            name='data',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='itemsnapshot',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.RunPython(compress_items, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='itemsnapshot',
+            name='items',
+        ),
+        migrations.AlterField(
+            model_name='itemsnapshot',
+            name='data',
+            field=models.BinaryField(),
+        ),
+        migrations.AlterField(
+            model_name='itemsnapshot',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-19 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0012_itemsnapshot_compressed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='skufeature',
+            index=models.Index(fields=['reference_date', 'sales_last_30_days'], name='sku_feature_last_30'),
+        ),
+        migrations.AddIndex(
+            model_name='skufeature',
+            index=models.Index(fields=['reference_date', 'sales_last_7_days'], name='sku_feature_last_7'),
+        ),
+        migrations.AddIndex(
+            model_name='skufeature',
+            index=models.Index(fields=['reference_date', 'price'], name='sku_feature_price'),
+        ),
+        migrations.AddIndex(
+            model_name='skufeature',
+            index=models.Index(fields=['reference_date', 'sku'], name='sku_feature_sku'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0013_skufeature_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromotionImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.CharField(max_length=7)),
+                ('imported', models.IntegerField(default=0)),
+                ('skipped', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'customer_promotion_import',
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2 on 2026-10-19 19:05
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_tables(apps, schema_editor):
+    """Creates the DatabaseCache table(s) from settings.CACHES (trooba_cache); existing ones are left alone."""
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0014_promotionimport'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
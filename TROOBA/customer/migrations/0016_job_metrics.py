@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0015_create_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='metrics',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0016_job_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='unique_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
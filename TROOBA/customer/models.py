@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 # --- Lookup / Metadata Tables ---
@@ -84,114 +86,85 @@ class OrderLineItem(models.Model):
 
 # --- Sales Prediction ---
 
+# One forecast run (Gemini or statistical); its SalesPrediction rows are written in a single transaction.
+class ForecastRun(models.Model):
+    method = models.CharField(max_length=50)      # gemini, prophet, exponential_smoothing, ...
+    reference_date = models.DateField()           # first forecast month
+    horizon = models.PositiveSmallIntegerField()  # months forecast from reference_date
+    sku_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'customer_forecast_run'
+        indexes = [
+            models.Index(fields=['method', 'reference_date', 'created_at'], name='forecast_run_latest'),
+        ]
+
+    def __str__(self):
+        return f"{self.method} run {self.id} ({self.reference_date}, {self.horizon}m)"
+
 class SalesPrediction(models.Model):
+    run = models.ForeignKey(ForecastRun, on_delete=models.CASCADE, null=True, blank=True, related_name='predictions')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    location = models.ForeignKey(Location, on_delete=models.CASCADE)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, null=True, blank=True)
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, null=True, blank=True)  # null = all locations
     event = models.ForeignKey(Event, on_delete=models.SET_NULL, null=True, blank=True)
-    date = models.DateField()
-    
+    date = models.DateField()  # first day of the forecast month for run predictions
+    horizon = models.PositiveSmallIntegerField(default=1)  # months ahead of the run's reference_date, 1-based
+
     # AI Features
-    season = models.CharField(max_length=20)
-    day_of_week = models.CharField(max_length=10)
-    time_slot = models.CharField(max_length=20)
+    season = models.CharField(max_length=20, blank=True, default="")
+    day_of_week = models.CharField(max_length=10, blank=True, default="")
+    time_slot = models.CharField(max_length=20, blank=True, default="")
     
     predicted_sales = models.FloatField()
     actual_sales = models.FloatField(null=True, blank=True)
+    reason = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run', 'variant', 'date'], name='sales_prediction_run_variant'),
+        ]
 
     def __str__(self):
-        return f"{self.product.title} on {self.date} @ {self.location.name}"
+        return f"{self.product.title} on {self.date} @ {self.location.name if self.location else 'all locations'}"
     
 class Prompt(models.Model):
     prompt=models.TextField(max_length=100000)
     type=models.TextField(max_length=100,default="Header")
 
 # new models -- for promotions data -- 30/07/25
+# One row per variant per month; replaces the old CustomerPromotion_April/_May/_June tables.
 
-from django.db import models
-
-class CustomerPromotion_June(models.Model):
+class CustomerPromotion(models.Model):
+    month = models.CharField(max_length=7)  # YYYY-MM, same key the views use for sales months
     title = models.CharField(max_length=255)
     item_id = models.CharField(max_length=255)
     product_id = models.BigIntegerField()
-    variant_id = models.BigIntegerField()
-    price = models.CharField(max_length=50, null=True, blank=True)
+    variant_id = models.BigIntegerField()  # Shopify variant id (ProductVariant.shopify_id)
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
 
-    clicks = models.IntegerField(default=0)
-    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    conv_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    conv_value_per_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    impressions = models.IntegerField(default=0)
-    ctr = models.CharField(max_length=20, null=True, blank=True)
-    avg_cpc = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    conversions = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    cost_conv = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    conv_value_click = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    value_conv = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    conv_rate = models.CharField(max_length=20, null=True, blank=True)
-
-    all_conv = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    all_conv_value_click = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    all_conv_value_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    cost_all_conv = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    value_all_conv = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    all_conv_rate = models.CharField(max_length=20, null=True, blank=True)
-    all_conv_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-
-    units_sold = models.IntegerField(default=0)
-    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    avg_order_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    orders = models.IntegerField(default=0)
-    avg_basket_size = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    gross_profit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    cost_of_goods_sold = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-
-    lead_units_sold = models.IntegerField(default=0)
-    cross_sell_units_sold = models.IntegerField(default=0)
-    lead_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    cross_sell_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    cross_device_conv = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    cross_device_conv_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-
-    category_1st_level = models.CharField(max_length=255, null=True, blank=True)
-    category_5th_level = models.CharField(max_length=255, null=True, blank=True)
-    category_2nd_level = models.CharField(max_length=255, null=True, blank=True)
-    category_3rd_level = models.CharField(max_length=255, null=True, blank=True)
-    category_4th_level = models.CharField(max_length=255, null=True, blank=True)
-    product_type_1st_level = models.CharField(max_length=255, null=True, blank=True)
-
-    class Meta:
-        db_table = "customer_promotion_june"
-
-    def __str__(self):
-        return f"{self.title} ({self.itemid})"
-    
-    from django.db import models
-
-class CustomerPromotion_May(models.Model):
-    title = models.CharField(max_length=255)
-    item_id = models.CharField(max_length=255)
-    product_id = models.BigIntegerField()
-    variant_id = models.BigIntegerField()
-    price = models.CharField(max_length=50, null=True, blank=True)
     clicks = models.IntegerField(default=0)
     cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     conv_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     conv_value_per_cost = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     impressions = models.IntegerField(default=0)
-    ctr = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    ctr = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)  # percent
     avg_cpc = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    conversions = models.IntegerField(default=0)
+    conversions = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     cost_per_conv = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     conv_value_per_click = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     value_per_conv = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    conv_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
-    all_conv = models.IntegerField(default=0)
+    conv_rate = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)  # percent
+
+    all_conv = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     all_conv_value_per_click = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     all_conv_value_per_cost = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     cost_per_all_conv = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     value_per_all_conv = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    all_conv_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    all_conv_rate = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True)  # percent
     all_conv_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
     units_sold = models.IntegerField(default=0)
     revenue = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     avg_order_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
@@ -199,77 +172,232 @@ class CustomerPromotion_May(models.Model):
     avg_basket_size = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     gross_profit = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     cost_of_goods_sold = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
     lead_units_sold = models.IntegerField(default=0)
     cross_sell_units_sold = models.IntegerField(default=0)
     lead_revenue = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     cross_sell_revenue = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    cross_device_conv = models.IntegerField(default=0)
+    cross_device_conv = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     cross_device_conv_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
     category_1st_level = models.CharField(max_length=255, null=True, blank=True)
-    category_5th_level = models.CharField(max_length=255, null=True, blank=True)
     category_2nd_level = models.CharField(max_length=255, null=True, blank=True)
     category_3rd_level = models.CharField(max_length=255, null=True, blank=True)
     category_4th_level = models.CharField(max_length=255, null=True, blank=True)
+    category_5th_level = models.CharField(max_length=255, null=True, blank=True)
     product_type_1st_level = models.CharField(max_length=255, null=True, blank=True)
 
     class Meta:
-        db_table = 'customer_promotion_may'
+        db_table = 'customer_promotion'
+        constraints = [
+            # Also serves as the (variant_id, month) index for per-SKU lookups
+            models.UniqueConstraint(fields=['variant_id', 'month'], name='customer_promotion_variant_month'),
+        ]
+        indexes = [
+            models.Index(fields=['month'], name='customer_promotion_month'),
+        ]
 
     def __str__(self):
-        return f"{self.title} - {self.item_id}"
-    
+        return f"{self.title} - {self.item_id} ({self.month})"
 
-    from django.db import models
 
-class CustomerPromotion_April(models.Model):
-    title = models.CharField(max_length=255)
-    item_id = models.CharField(max_length=255)
-    product_id = models.BigIntegerField()
-    variant_id = models.BigIntegerField()
-    price = models.CharField(max_length=50, null=True, blank=True)
-    clicks = models.IntegerField(default=0)
-    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    conv_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    conv_value_per_cost = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    impressions = models.IntegerField(default=0)
-    ctr = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
-    avg_cpc = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    conversions = models.IntegerField(default=0)
-    cost_per_conv = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    conv_value_per_click = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    value_per_conv = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    conv_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
-    all_conv = models.IntegerField(default=0)
-    all_conv_value_per_click = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    all_conv_value_per_cost = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    cost_per_all_conv = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    value_per_all_conv = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    all_conv_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
-    all_conv_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    units_sold = models.IntegerField(default=0)
-    revenue = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    avg_order_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    orders = models.IntegerField(default=0)
-    avg_basket_size = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    gross_profit = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    cost_of_goods_sold = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    lead_units_sold = models.IntegerField(default=0)
-    cross_sell_units_sold = models.IntegerField(default=0)
-    lead_revenue = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    cross_sell_revenue = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
-    cross_device_conv = models.IntegerField(default=0)
-    cross_device_conv_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+# Materialized promotion spend/ROAS per category level and month, rebuilt by
+# customer.promotions.refresh_promotion_rollups() after every import.
+# level 0 is the month total, level N groups by category_1st_level..category_Nth_level.
+
+class PromotionCategoryRollup(models.Model):
+    month = models.CharField(max_length=7)
+    level = models.PositiveSmallIntegerField()
     category_1st_level = models.CharField(max_length=255, null=True, blank=True)
-    category_5th_level = models.CharField(max_length=255, null=True, blank=True)
     category_2nd_level = models.CharField(max_length=255, null=True, blank=True)
     category_3rd_level = models.CharField(max_length=255, null=True, blank=True)
     category_4th_level = models.CharField(max_length=255, null=True, blank=True)
-    product_type_1st_level = models.CharField(max_length=255, null=True, blank=True)
+    category_5th_level = models.CharField(max_length=255, null=True, blank=True)
+
+    products = models.IntegerField(default=0)
+    impressions = models.BigIntegerField(default=0)
+    clicks = models.BigIntegerField(default=0)
+    spend = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    conversions = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    conv_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    gross_profit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    roas = models.FloatField(null=True, blank=True)       # conv_value / spend
+    ctr = models.FloatField(null=True, blank=True)        # percent, clicks / impressions
+    conv_rate = models.FloatField(null=True, blank=True)  # percent, conversions / clicks
+
+    class Meta:
+        db_table = 'customer_promotion_category_rollup'
+        indexes = [
+            models.Index(fields=['month', 'level'], name='promo_rollup_month_level'),
+        ]
+
+    def __str__(self):
+        return f"{self.month} L{self.level} {self.category_path}"
+
+    @property
+    def category_path(self):
+        return " > ".join(getattr(self, f) or "(none)" for f in CATEGORY_LEVEL_FIELDS[:self.level])
+
+
+# One row per promotion report import, written in the import's transaction. The newest id is the
+# promotion data version that cached summaries are keyed on (customer.promotions.promotions_version),
+# so rows are kept: deleting the newest could hand its id, and its cached summaries, to the next import.
+
+class PromotionImport(models.Model):
+    month = models.CharField(max_length=7)
+    imported = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'customer_promotion_import'
+
+    def __str__(self):
+        return f"Import {self.id} {self.month} ({self.imported} rows)"
+
+
+CATEGORY_LEVEL_FIELDS = [
+    'category_1st_level',
+    'category_2nd_level',
+    'category_3rd_level',
+    'category_4th_level',
+    'category_5th_level',
+]
+
+
+# Cached LLM completions, keyed by sha256(model + generation config + prompt).
+# Expired rows and the least recently used rows beyond LLM_CACHE_MAX_ENTRIES are evicted on write.
+
+class LLMResponseCache(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    response = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'customer_llm_response_cache'
+
+    def __str__(self):
+        return f"{self.model} {self.key[:12]}"
+
+
+# Fitted Prophet model per variant. `fingerprint` hashes the daily sales history,
+# holidays and fit settings the model was trained on, so unchanged SKUs are never refit.
+
+class ProphetModel(models.Model):
+    variant = models.OneToOneField(ProductVariant, on_delete=models.CASCADE, related_name='prophet_model')
+    fingerprint = models.CharField(max_length=64)
+    model_json = models.TextField()             # prophet.serialize.model_to_json
+    forecast = models.JSONField(default=dict)   # {"YYYY-MM": units} for the months after history_end
+    history_end = models.DateField()
+    fitted_at = models.DateTimeField(auto_now=True)
+    fit_seconds = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'customer_prophet_model'
+
+    def __str__(self):
+        return f"Prophet {self.variant_id} ({self.history_end})"
+
+
+# Background job queue in the main database (no broker). Views enqueue, `manage.py run_workers`
+# claims rows with SELECT ... FOR UPDATE SKIP LOCKED and runs the task registered under `kind`.
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.FloatField(default=0)  # 0..1
+    message = models.CharField(max_length=255, blank=True, default="")
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    metrics = models.JSONField(null=True, blank=True)  # queries, HTTP calls and timings of the last run
+
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=1)
+    worker = models.CharField(max_length=100, blank=True, default="")
+    # Kind + params digest of a job enqueued with unique=True, held while it is queued or running
+    unique_key = models.CharField(max_length=64, null=True, blank=True, unique=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # refreshed on every progress report
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'customer_job'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_claim'),
+            models.Index(fields=['kind', 'status'], name='job_kind_status'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} {self.kind} ({self.status})"
+
+
+# Feature store: the current forecasting inputs per SKU, rebuilt by customer.features.refresh_sku_features
+# (after every Shopify sync for the variants it touched, or in full with `manage.py refresh_sku_features`).
+
+class SkuFeature(models.Model):
+    variant = models.OneToOneField(ProductVariant, on_delete=models.CASCADE, related_name='features')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    sku = models.CharField(max_length=100, db_index=True)
+    product_title = models.CharField(max_length=255)
+    variant_title = models.CharField(max_length=255, blank=True, default="")
+    product_type = models.CharField(max_length=255, null=True, blank=True)
+    vendor = models.CharField(max_length=255, null=True, blank=True)
+    price = models.FloatField(default=0)
+    created_at = models.TextField(null=True, blank=True)  # ProductVariant.created_at as stored
+
+    reference_date = models.DateField()                 # features describe the sales before this date
+    history_start = models.CharField(max_length=7)      # YYYY-MM of monthly_sales[0]
+    monthly_sales = models.JSONField(default=list)      # units per month, history_start .. month before reference_date
+    sales_12m = models.IntegerField(default=0)          # last 12 months, used to rank the top SKUs
+    sales_last_7_days = models.IntegerField(default=0)
+    sales_last_30_days = models.IntegerField(default=0)
+    reference_month_sales = models.IntegerField(default=0)  # actual units in the reference month
+    promo_summary = models.JSONField(default=dict)      # {month: {field: value}}, as promotion_summaries
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        db_table = 'customer_promotion_april'
+        db_table = 'customer_sku_feature'
+        indexes = [
+            models.Index(fields=['reference_date', '-sales_12m'], name='sku_feature_rank'),
+            # Other sort orders of the paginated SKU API
+            models.Index(fields=['reference_date', 'sales_last_30_days'], name='sku_feature_last_30'),
+            models.Index(fields=['reference_date', 'sales_last_7_days'], name='sku_feature_last_7'),
+            models.Index(fields=['reference_date', 'price'], name='sku_feature_price'),
+            models.Index(fields=['reference_date', 'sku'], name='sku_feature_sku'),
+        ]
 
     def __str__(self):
-        return f"{self.title} - {self.item_id}"
+        return f"Features {self.sku} ({self.reference_date})"
+
 
+# Item sets shown on the items page, stored once so forms post only the snapshot id
+# (instead of one hidden field per SKU, month and promotion metric).
 
+class ItemSnapshot(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    digest = models.CharField(max_length=64, unique=True)  # sha256 of the items, so identical sets share a row
+    data = models.BinaryField()  # zlib-compressed JSON list of items
+    item_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)  # pushed back while the snapshot is in use
+
+    class Meta:
+        db_table = 'customer_item_snapshot'
+
+    def __str__(self):
+        return f"Snapshot {self.id} ({self.item_count} items)"
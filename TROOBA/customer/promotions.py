@@ -0,0 +1,380 @@
+import csv
+import logging
+import re
+import zlib
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from .models import CATEGORY_LEVEL_FIELDS, CustomerPromotion, PromotionCategoryRollup, PromotionImport
+
+logger = logging.getLogger(__name__)
+
+# Months of promotion data shown next to each SKU (keys of CustomerPromotion.month)
+PROMOTION_MONTHS = ['2025-04', '2025-05', '2025-06']
+
+# Columns the dashboards and forecast prompts show per SKU and month
+PROMO_SUMMARY_FIELDS = [
+    "id", "title", "item_id", "product_id", "variant_id", "price",
+    "clicks", "cost", "conv_value", "conv_value_per_cost", "impressions", "ctr", "avg_cpc",
+    "category_1st_level", "category_2nd_level", "category_3rd_level",
+    "category_4th_level", "category_5th_level", "product_type_1st_level",
+]
+
+PROMO_SUMMARY_TIMEOUT = 60 * 60
+
+MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+# Google Shopping "Products" report header -> CustomerPromotion field
+REPORT_COLUMNS = {
+    "title": "title",
+    "item id": "item_id",
+    "product id": "product_id",
+    "variant id": "variant_id",
+    "price": "price",
+    "clicks": "clicks",
+    "cost": "cost",
+    "conv. value": "conv_value",
+    "conv. value / cost": "conv_value_per_cost",
+    "impr.": "impressions",
+    "impressions": "impressions",
+    "ctr": "ctr",
+    "avg. cpc": "avg_cpc",
+    "conversions": "conversions",
+    "cost / conv.": "cost_per_conv",
+    "conv. value / click": "conv_value_per_click",
+    "value / conv.": "value_per_conv",
+    "conv. rate": "conv_rate",
+    "all conv.": "all_conv",
+    "all conv. value / click": "all_conv_value_per_click",
+    "all conv. value / cost": "all_conv_value_per_cost",
+    "cost / all conv.": "cost_per_all_conv",
+    "value / all conv.": "value_per_all_conv",
+    "all conv. rate": "all_conv_rate",
+    "all conv. value": "all_conv_value",
+    "units sold": "units_sold",
+    "revenue": "revenue",
+    "avg. order value": "avg_order_value",
+    "orders": "orders",
+    "avg. basket size": "avg_basket_size",
+    "gross profit": "gross_profit",
+    "cost of goods sold": "cost_of_goods_sold",
+    "lead units sold": "lead_units_sold",
+    "cross-sell units sold": "cross_sell_units_sold",
+    "lead revenue": "lead_revenue",
+    "cross-sell revenue": "cross_sell_revenue",
+    "cross-device conv.": "cross_device_conv",
+    "cross-device conv. value": "cross_device_conv_value",
+    "category (1st level)": "category_1st_level",
+    "category (2nd level)": "category_2nd_level",
+    "category (3rd level)": "category_3rd_level",
+    "category (4th level)": "category_4th_level",
+    "category (5th level)": "category_5th_level",
+    "product type (1st level)": "product_type_1st_level",
+}
+
+PROMOTION_FIELDS = {f.name: f for f in CustomerPromotion._meta.concrete_fields if f.name not in ("id", "month")}
+INTEGER_FIELDS = [n for n, f in PROMOTION_FIELDS.items() if f.get_internal_type() in ("IntegerField", "BigIntegerField") and n not in ("product_id", "variant_id")]
+DECIMAL_FIELDS = [n for n, f in PROMOTION_FIELDS.items() if f.get_internal_type() == "DecimalField"]
+UPSERT_UNIQUE_FIELDS = ["variant_id", "month"]
+UPSERT_UPDATE_FIELDS = [n for n in PROMOTION_FIELDS if n != "variant_id"]
+UPSERT_BATCH_SIZE = 1000
+
+# Drops currency symbols, thousands separators, % and whitespace in one pass
+_NUMERIC_JUNK = re.compile(r"[^0-9.\-]")
+_EMPTY_VALUES = {"", "-", ".", "--"}
+_ITEM_ID_IDS = re.compile(r"(\d+)_(\d+)$")
+
+
+def _to_decimal(text):
+    cleaned = _NUMERIC_JUNK.sub("", text)
+    if cleaned in _EMPTY_VALUES:
+        return None
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        return None
+
+
+def normalize_numeric_column(values, as_int=False):
+    """Converts a whole column of report strings ('12.5%', '₹1,299.00', '--') to numbers.
+
+    Reports repeat the same few strings ('0', '--', '0.00%') on most rows, so each
+    distinct string is parsed once per column.
+    """
+    parsed = {}
+    out = []
+    for value in values:
+        if value is None:
+            out.append(None)
+            continue
+        number = parsed.get(value)
+        if number is None and value not in parsed:
+            number = _to_decimal(value)
+            if as_int and number is not None:
+                number = int(number)
+            parsed[value] = number
+        out.append(number)
+    return out
+
+
+def parse_item_ids(item_id):
+    """'shopify_IN_8123456_4456789' -> (8123456, 4456789); (None, None) if it does not match."""
+    match = _ITEM_ID_IDS.search(item_id or "")
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+
+def iter_report_rows(fileobj):
+    """Yields one {field: raw string} dict per report row, reading the file lazily.
+
+    Google Ads exports put a report title and date range above the header row, so
+    lines are skipped until one that contains an "Item ID" column.
+    """
+    header = None
+    reader = None
+    for line in fileobj:
+        if header is None:
+            delimiter = "\t" if "\t" in line else ","
+            cells = next(csv.reader([line], delimiter=delimiter))
+            names = [c.strip().lower() for c in cells]
+            if "item id" in names or "item_id" in names:
+                header = [REPORT_COLUMNS.get(n, n if n in PROMOTION_FIELDS else None) for n in names]
+                reader = csv.reader(fileobj, delimiter=delimiter)
+                break
+    if reader is None:
+        raise ValueError("No header row with an 'Item ID' column found in report")
+
+    for cells in reader:
+        if not cells or not cells[0].strip():
+            continue
+        # Footer rows ("Total: ...") carry no item id
+        row = {field: cell.strip() for field, cell in zip(header, cells) if field}
+        if not row.get("item_id") or row["item_id"].lower().startswith("total"):
+            continue
+        yield row
+
+
+def _report_id(value):
+    """An explicit Product ID / Variant ID cell as an int; None when empty, False when unparseable."""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return False
+
+
+def _build_chunk(rows, month):
+    """Normalizes a chunk of raw rows column by column and returns (CustomerPromotion rows, skipped).
+
+    Rows without a usable product/variant id are skipped (and logged), not fatal.
+    """
+    columns = {field: [row.get(field) for row in rows] for field in PROMOTION_FIELDS}
+    for field in DECIMAL_FIELDS:
+        columns[field] = normalize_numeric_column(columns[field])
+    for field in INTEGER_FIELDS:
+        columns[field] = normalize_numeric_column(columns[field], as_int=True)
+    not_null = [f for f in INTEGER_FIELDS + DECIMAL_FIELDS if not PROMOTION_FIELDS[f].null]
+    for field in not_null:
+        columns[field] = [0 if v is None else v for v in columns[field]]
+
+    # Latest row wins when the report lists a variant twice
+    by_variant = {}
+    skipped = 0
+    for i, row in enumerate(rows):
+        product_id, variant_id = parse_item_ids(row.get("item_id"))
+        explicit_variant, explicit_product = _report_id(row.get("variant_id")), _report_id(row.get("product_id"))
+        if explicit_variant is False or explicit_product is False:
+            logger.warning(
+                "Skipping promotion row %r: unparseable product/variant id (%r, %r)",
+                row.get("item_id"), row.get("product_id"), row.get("variant_id"),
+            )
+            skipped += 1
+            continue
+        variant_id = explicit_variant or variant_id
+        product_id = explicit_product or product_id
+        if variant_id is None or product_id is None:
+            skipped += 1
+            continue
+
+        values = {field: columns[field][i] for field in PROMOTION_FIELDS}
+        values.update(month=month, product_id=product_id, variant_id=variant_id,
+                      title=values["title"] or "", item_id=values["item_id"] or "")
+        by_variant[variant_id] = CustomerPromotion(**values)
+    return list(by_variant.values()), skipped
+
+
+def upsert_promotions(promotions):
+    """Upserts CustomerPromotion instances on (variant_id, month) in one statement per batch."""
+    if not promotions:
+        return
+    CustomerPromotion.objects.bulk_create(
+        promotions,
+        batch_size=UPSERT_BATCH_SIZE,
+        update_conflicts=True,
+        # MySQL cannot name the conflict target, it uses every unique key
+        unique_fields=UPSERT_UNIQUE_FIELDS if connection.features.supports_update_conflicts_with_target else None,
+        update_fields=UPSERT_UPDATE_FIELDS,
+    )
+
+
+def import_promotion_report(fileobj, month, chunk_size=5000):
+    """Streams a report into CustomerPromotion for `month`. Returns (imported, skipped)."""
+    if not MONTH_RE.match(month):
+        raise ValueError(f"Invalid month {month!r}, expected YYYY-MM")
+
+    imported = skipped = 0
+    chunk = []
+    with transaction.atomic():
+        for row in iter_report_rows(fileobj):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                promotions, bad = _build_chunk(chunk, month)
+                upsert_promotions(promotions)
+                imported += len(promotions)
+                skipped += bad
+                chunk = []
+                logger.info("Imported %s promotion rows for %s", imported, month)
+        if chunk:
+            promotions, bad = _build_chunk(chunk, month)
+            upsert_promotions(promotions)
+            imported += len(promotions)
+            skipped += bad
+        refresh_promotion_rollups([month])
+        # Commits with the data, so every process sees the new version exactly when it sees the rows
+        PromotionImport.objects.create(month=month, imported=imported, skipped=skipped)
+    return imported, skipped
+
+
+def promotions_version():
+    """Current promotion data version (the newest PromotionImport id); part of every cached summary key.
+
+    Kept in the database rather than the cache, so all processes agree on it whatever the cache backend.
+    """
+    return PromotionImport.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def _summary_key(version, fields_key, variant_id, month):
+    return f"promo-summary:{version}:{fields_key}:{variant_id}:{month}"
+
+
+def _decimal_columns_to_float(rows, indexes):
+    """Converts the Decimal columns of `rows` to rounded floats in one numpy pass per column."""
+    if not rows:
+        return []
+    columns = [list(col) for col in zip(*rows)]
+    for i in indexes:
+        converted = np.round(np.array(columns[i], dtype=float), 2).tolist()
+        columns[i] = [None if v != v else v for v in converted]  # NaN (was NULL) -> None
+    return list(zip(*columns))
+
+
+def promotion_summaries(variant_ids, months=PROMOTION_MONTHS, fields=PROMO_SUMMARY_FIELDS):
+    """Returns {variant_id: {month: {field: value}}} for the given Shopify variant ids.
+
+    Only `fields` are selected from the DB. Summaries are cached per (variant, month)
+    and invalidated by the next import (see promotions_version()).
+    """
+    fields = list(fields)
+    fields_key = zlib.crc32(",".join(fields).encode())
+    version = promotions_version()
+    keys = {
+        _summary_key(version, fields_key, v, m): (v, m)
+        for v in set(variant_ids) for m in months
+    }
+
+    summaries = {}
+    found = cache.get_many(keys.keys())
+    for key, summary in found.items():
+        if summary:  # {} marks "no promotion row" so it is not queried again
+            variant_id, month = keys[key]
+            summaries.setdefault(variant_id, {})[month] = summary
+
+    missing = [vm for key, vm in keys.items() if key not in found]
+    if not missing:
+        return _in_month_order(summaries)
+
+    select = list(dict.fromkeys(["variant_id", "month"] + fields))
+    decimal_indexes = [i for i, f in enumerate(select) if f in DECIMAL_FIELDS]
+    rows = list(
+        CustomerPromotion.objects
+        .filter(variant_id__in={v for v, _ in missing}, month__in={m for _, m in missing})
+        .values_list(*select)
+    )
+    rows = _decimal_columns_to_float(rows, decimal_indexes)
+
+    fresh = {}
+    for row in rows:
+        record = dict(zip(select, row))
+        summary = {f: record[f] for f in fields}
+        variant_id, month = record["variant_id"], record["month"]
+        summaries.setdefault(variant_id, {})[month] = summary
+        fresh[_summary_key(version, fields_key, variant_id, month)] = summary
+    for variant_id, month in missing:
+        fresh.setdefault(_summary_key(version, fields_key, variant_id, month), {})
+    cache.set_many(fresh, PROMO_SUMMARY_TIMEOUT)
+    return _in_month_order(summaries)
+
+
+def _in_month_order(summaries):
+    return {v: dict(sorted(by_month.items())) for v, by_month in summaries.items()}
+
+
+def _ratio(numerator, denominator, scale=1):
+    if not denominator:
+        return None
+    return round(float(numerator or 0) / float(denominator) * scale, 4)
+
+
+def refresh_promotion_rollups(months=None):
+    """Rebuilds PromotionCategoryRollup for `months` (all months when None).
+
+    Equivalent of GROUP BY month, category_1st_level, ... WITH ROLLUP: one grouped
+    aggregate per hierarchy depth (0 = month total, 1..5 = category levels), run in the DB.
+    Returns the number of rollup rows written.
+    """
+    promos = CustomerPromotion.objects.all()
+    if months is not None:
+        promos = promos.filter(month__in=months)
+    else:
+        months = list(promos.order_by().values_list("month", flat=True).distinct())
+
+    rollups = []
+    for level in range(len(CATEGORY_LEVEL_FIELDS) + 1):
+        group_by = ["month"] + CATEGORY_LEVEL_FIELDS[:level]
+        rows = (
+            promos.order_by().values(*group_by)
+            .annotate(
+                products=Count("id"),
+                impressions=Sum("impressions"),
+                clicks=Sum("clicks"),
+                spend=Sum("cost"),
+                conversions=Sum("conversions"),
+                conv_value=Sum("conv_value"),
+                revenue=Sum("revenue"),
+                gross_profit=Sum("gross_profit"),
+            )
+        )
+        for row in rows:
+            metrics = {k: row[k] or 0 for k in (
+                "products", "impressions", "clicks", "spend", "conversions",
+                "conv_value", "revenue", "gross_profit",
+            )}
+            rollups.append(PromotionCategoryRollup(
+                level=level,
+                roas=_ratio(metrics["conv_value"], metrics["spend"]),
+                ctr=_ratio(metrics["clicks"], metrics["impressions"], 100),
+                conv_rate=_ratio(metrics["conversions"], metrics["clicks"], 100),
+                **{f: row[f] for f in group_by},
+                **metrics,
+            ))
+
+    with transaction.atomic():
+        PromotionCategoryRollup.objects.filter(month__in=months).delete()
+        PromotionCategoryRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
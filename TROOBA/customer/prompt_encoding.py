@@ -0,0 +1,142 @@
+import json
+import logging
+import math
+import re
+from decimal import Decimal
+
+from .forecasting import add_months
+from .gemini import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Decimal places kept for non-integer numbers
+DIGITS = 2
+
+# Row ids mean nothing to the model
+OMIT_FIELDS = {"id"}
+
+# Identifiers stay text even when they look numeric
+TEXT_FIELDS = {"sku", "title", "item_id"}
+
+# How empty form fields come back from the templates
+NULL_TEXT = {"None", "null"}
+
+NUMBER_TEXT = re.compile(r"^-?(0|[1-9]\d*)(\.\d+)?$")
+MONTH = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+def _number(value):
+    """Rounded int or float; None for NaN and infinity, which JSON cannot carry."""
+    if isinstance(value, str) and "." not in value:
+        return int(value)
+    value = float(value)
+    if not math.isfinite(value):
+        return None
+    value = round(value, DIGITS)
+    return int(value) if value.is_integer() else value
+
+
+def compact(value, key=None):
+    """Drops null / empty fields, rounds numbers and turns numeric strings (form values, Decimals) into numbers.
+
+    Array positions are kept (nulls stay) so tabular rows remain aligned.
+    """
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            if k in OMIT_FIELDS:
+                continue
+            v = compact(v, k)
+            if v is None or v == "" or v == {} or v == []:
+                continue
+            out[k] = v
+        return out
+    if isinstance(value, (list, tuple)):
+        return [compact(v) for v in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (Decimal, float)):
+        return _number(value)
+    if isinstance(value, str):
+        value = value.strip()
+        if value in NULL_TEXT:
+            return None
+        if key not in TEXT_FIELDS and NUMBER_TEXT.match(value):
+            return _number(value)
+    return value
+
+
+def month_series(by_month, fill=None):
+    """{month: value} as {"start": first month, "values": [...]} when the months are consecutive.
+
+    fill: value for months missing between the first and the last (e.g. 0 units sold);
+    without it, gaps fall back to {"months": [...], "values": [...]}.
+    """
+    months = sorted(by_month)
+    if not months:
+        return {}
+    if not all(MONTH.match(m) for m in months):
+        return {"months": months, "values": [by_month[m] for m in months]}
+    consecutive = [months[0]]
+    while consecutive[-1] < months[-1]:
+        consecutive.append(add_months(consecutive[-1], 1))
+    if fill is not None or consecutive == months:
+        return {"start": months[0], "values": [by_month.get(m, fill) for m in consecutive]}
+    return {"months": months, "values": [by_month[m] for m in months]}
+
+
+def month_table(by_month):
+    """{month: {field: value}} as one table: fields equal in every month are stated once,
+    the rest become columns with one row per month."""
+    months = sorted(by_month)
+    rows = [compact(by_month[m]) for m in months]
+    fields = list(dict.fromkeys(f for row in rows for f in row))
+    constant, columns = {}, []
+    for f in fields:
+        values = [row.get(f) for row in rows]
+        if len(rows) > 1 and all(v == values[0] for v in values):
+            constant[f] = values[0]
+        else:
+            columns.append(f)
+    if not columns:
+        return constant
+    return {
+        **constant,
+        "columns": ["month"] + columns,
+        "rows": [[m] + [row.get(f) for f in columns] for m, row in zip(months, rows)],
+    }
+
+
+def encode(value):
+    """Compact single-line JSON for prompts."""
+    return json.dumps(compact(value), separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class PayloadReport:
+    """Prompt data size before (indented JSON) and after compact encoding, in estimated tokens."""
+
+    def __init__(self, label):
+        self.label = label
+        self.verbose_tokens = 0
+        self.compact_tokens = 0
+
+    def add(self, verbose, compact_text):
+        self.verbose_tokens += estimate_tokens(verbose)
+        self.compact_tokens += estimate_tokens(compact_text)
+        return compact_text
+
+    def as_dict(self):
+        saved = 1 - self.compact_tokens / self.verbose_tokens if self.verbose_tokens else 0.0
+        return {
+            "verbose_tokens": self.verbose_tokens,
+            "compact_tokens": self.compact_tokens,
+            "saved_pct": round(100 * saved, 1),
+        }
+
+    def log(self):
+        stats = self.as_dict()
+        logger.info(
+            f"{self.label} prompt data: ~{stats['verbose_tokens']} -> ~{stats['compact_tokens']} tokens "
+            f"({stats['saved_pct']}% smaller)"
+        )
+        return stats
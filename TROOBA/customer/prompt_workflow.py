@@ -0,0 +1,160 @@
+import json
+import logging
+import math
+from contextlib import closing
+
+from django.conf import settings
+
+from .forecast_runs import save_forecast_run
+from .gemini import FORECAST_GENERATION_CONFIG, call_gemini, estimate_tokens, predict_in_batches, stream_predictions
+from .models import ProductVariant
+from .prompt_encoding import PayloadReport, encode, month_series, month_table
+from .prompts import PromptTemplate
+
+logger = logging.getLogger(__name__)
+
+PROMPT_WRITER_MODEL = "gemini-1.5-flash"
+
+
+def generate_prompt_text(full_prompt):
+    """Asks Gemini to write a forecasting prompt for the selected items."""
+    # Each generation should be fresh, so this one skips the response cache
+    return call_gemini(full_prompt, settings.GEMINI_API_KEY, use_cache=False, model=PROMPT_WRITER_MODEL)
+
+
+# Forecast prompt for the items posted from the prompt page; $prompt is the saved Generated_Prompt
+ITEMS_PROMPT = PromptTemplate("""
+$prompt
+
+For each SKU in the following list, please predict total sales quantity for July 2025.
+
+Return ONLY a valid JSON array (no markdown).  
+Each element must have:
+- "sku" (string)
+- "july_predicted" (integer)
+- "reason" (brief explanation with algorithm and adjustments)
+
+Input SKUs data:
+$items
+""")
+
+
+def items_prompt_builder(base_prompt):
+    """build_prompt(item_texts) for batches of posted items, with the base prompt compiled in once.
+
+    Items are split into as many prompts as the token budget requires.
+    """
+    template = ITEMS_PROMPT.partial(prompt=base_prompt)
+
+    def build_prompt(item_texts):
+        return template.render(items="[\n" + ",\n".join(item_texts) + "\n]")
+    return build_prompt
+
+
+def compact_item(item):
+    """A posted item with its sales history and promotions as compact month tables."""
+    return {
+        **item,
+        "past_sales": month_series({row["month"]: row["value"] for row in item.get("past_sales") or []}),
+        "promo_summary": month_table(item.get("promo_summary") or {}),
+    }
+
+
+def item_entries(items_data, label):
+    """[(sku, compact item JSON)] for the batching helpers, plus the before/after size report."""
+    payload = PayloadReport(label)
+    entries = [
+        (str(item.get("sku")), payload.add(json.dumps(item, indent=2), encode(compact_item(item))))
+        for item in items_data
+    ]
+    return entries, payload.log()
+
+
+def _prediction_failed(sku, e):
+    return {"sku": sku, "july_predicted": 0, "reason": f"Gemini request failed: {e}"}
+
+
+def predict_items(base_prompt, items_data, progress=None):
+    """July forecasts for the items posted from the prompt page, saved as a "gemini_prompt" run."""
+    progress = progress or (lambda fraction, message="": None)
+
+    build_prompt = items_prompt_builder(base_prompt)
+
+    entries, payload_stats = item_entries(items_data, "Prompt page")
+    progress(0.1, f"Forecasting {len(items_data)} SKUs with Gemini "
+                  f"(data ~{payload_stats['compact_tokens']} tokens, {payload_stats['saved_pct']}% smaller)")
+    results = predict_in_batches(
+        entries,
+        build_prompt,
+        settings.GEMINI_API_KEY,
+        on_error=_prediction_failed,
+        generation_config=FORECAST_GENERATION_CONFIG,
+        overhead_tokens=estimate_tokens(build_prompt([])),
+    )
+    predictions = [results[sku] for sku, _ in entries if sku in results]
+
+    progress(0.9, "Saving forecast run")
+    save_item_predictions(predictions)
+    return predictions
+
+
+def stream_item_predictions(base_prompt, items_data):
+    """Yields each item's prediction as soon as Gemini has written it; saves the run at the end."""
+    build_prompt = items_prompt_builder(base_prompt)
+
+    entries, _ = item_entries(items_data, "Prompt page (streamed)")
+    predictions = []
+    stream = stream_predictions(
+        entries,
+        build_prompt,
+        settings.GEMINI_API_KEY,
+        on_error=_prediction_failed,
+        generation_config=FORECAST_GENERATION_CONFIG,
+        overhead_tokens=estimate_tokens(build_prompt([])),
+    )
+    # Closed with this generator, so a disconnected client cancels the Gemini calls behind it
+    with closing(stream):
+        for _, row in stream:
+            predictions.append(row)
+            yield row
+    save_item_predictions(predictions)
+
+
+def _predicted_units(value):
+    """A model's july_predicted as a float: 0 when missing, None when it is not a finite number ("~120", "N/A")."""
+    if value is None or value == "":
+        return 0.0
+    try:
+        units = float(value)
+    except (TypeError, ValueError):
+        return None
+    return units if math.isfinite(units) else None
+
+
+def save_item_predictions(predictions):
+    """Stores prompt-page predictions whose SKU matches a variant as a "gemini_prompt" ForecastRun.
+
+    Items whose prediction is not a number are logged and left out, the rest are still saved.
+    """
+    skus = [str(p.get("sku")) for p in predictions]
+    variants = {}
+    for variant_id, sku, product_id in ProductVariant.objects.filter(sku__in=skus).values_list("id", "sku", "product_id"):
+        variants.setdefault(sku, (variant_id, product_id))
+    rows = []
+    for p in predictions:
+        sku = str(p.get("sku"))
+        if sku not in variants:
+            continue
+        units = _predicted_units(p.get("july_predicted"))
+        if units is None:
+            logger.warning(f"Not saving the prediction for {sku}: july_predicted {p.get('july_predicted')!r} is not a number")
+            continue
+        rows.append({
+            "variant_id": variants[sku][0],
+            "product_id": variants[sku][1],
+            "month": "2025-07",
+            "predicted_sales": units,
+            "reason": str(p.get("reason") or ""),
+        })
+    if rows:
+        save_forecast_run("gemini_prompt", rows)
@@ -0,0 +1,119 @@
+import re
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Prompt
+
+# Bumped on every Prompt change; every process compares it with the version its registry was built for
+VERSION_KEY = "prompts:version"
+
+PLACEHOLDER = re.compile(r"\$([A-Za-z_]\w*)")
+
+
+class PromptTemplate:
+    """A prompt layout with $name placeholders, parsed once so render() only joins strings.
+
+    Substituted values are inserted as-is and never parsed, so a "$" inside them is safe.
+    """
+
+    def __init__(self, layout="", segments=None):
+        if segments is None:
+            segments, position = [], 0
+            for match in PLACEHOLDER.finditer(layout):
+                segments.append((layout[position:match.start()], match.group(1)))
+                position = match.end()
+            segments.append((layout[position:], None))
+        self.segments = segments
+        self.fields = {name for _, name in segments if name}
+
+    def partial(self, **values):
+        """A new template with some placeholders filled in, e.g. the stored prompt text."""
+        segments, literal = [], ""
+        for text, name in self.segments:
+            literal += text
+            if name in values:
+                literal += str(values[name])
+            else:
+                segments.append((literal, name))
+                literal = ""
+        return PromptTemplate(segments=segments)
+
+    def render(self, **values):
+        missing = self.fields - values.keys()
+        if missing:
+            raise ValueError(f"No value for prompt placeholder(s) {', '.join('$' + name for name in sorted(missing))}")
+        return "".join(text + (str(values[name]) if name else "") for text, name in self.segments)
+
+
+class PromptRegistry:
+    """Prompt texts and compiled templates, cached in process and keyed by the shared prompt version.
+
+    Saving or deleting a Prompt bumps the version (signals below); other processes notice within
+    PROMPT_REGISTRY_CHECK_SECONDS and drop what they had cached.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0.0
+        self.entries = {}
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self.checked_at < settings.PROMPT_REGISTRY_CHECK_SECONDS:
+            return
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_KEY)
+        with self.lock:
+            if version != self.version:
+                self.entries = {}
+                self.version = version
+            self.checked_at = now
+
+    def _cached(self, key, build):
+        self._sync()
+        entries = self.entries
+        if key not in entries:
+            entries[key] = build()
+        return entries[key]
+
+    def text(self, prompt_type):
+        """The stored prompt of this type, or None."""
+        return self._cached(
+            ("text", prompt_type),
+            lambda: Prompt.objects.filter(type=prompt_type).values_list("prompt", flat=True).first(),
+        )
+
+    def template(self, prompt_type, layout, strip=False):
+        """`layout` compiled with the stored prompt of this type as $prompt, or None if there is none."""
+        def build():
+            text = self.text(prompt_type)
+            if text is None:
+                return None
+            return PromptTemplate(layout).partial(prompt=text.strip() if strip else text)
+        return self._cached(("template", prompt_type, layout, strip), build)
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        with self.lock:
+            self.entries = {}
+            self.checked_at = 0.0
+
+
+prompts = PromptRegistry()
+
+
+@receiver(post_save, sender=Prompt)
+@receiver(post_delete, sender=Prompt)
+def prompt_changed(sender, **kwargs):
+    # After commit, so no process can reload the old text under the new version
+    transaction.on_commit(prompts.invalidate)
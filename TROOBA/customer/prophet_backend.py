@@ -0,0 +1,192 @@
+import hashlib
+import importlib.util
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import make_aware
+
+from .forecasting import REFERENCE_DATE, add_months
+from .models import Event, OrderLineItem, ProphetModel
+from .prophet_worker import fit_series
+
+try:
+    import holidays as holidays_lib
+except ImportError:  # optional, Event rows are still used
+    holidays_lib = None
+
+logger = logging.getLogger(__name__)
+
+PROPHET_AVAILABLE = importlib.util.find_spec("prophet") is not None
+
+# Bump when fit settings change so every SKU is refit once
+PROPHET_CONFIG_VERSION = 2
+# SKUs with fewer selling days than this fall back to the statistical baseline
+MIN_SALE_DAYS = 14
+
+
+def daily_sales_cube(start, end, variant_ids=None):
+    """Units sold per variant per day in [start, end): (variant_ids, matrix[n_variants, n_days])."""
+    n_days = (end - start).days
+    qs = OrderLineItem.objects.filter(
+        order__order_date__gte=make_aware(start),
+        order__order_date__lt=make_aware(end),
+        variant__isnull=False,
+    )
+    if variant_ids is not None:
+        qs = qs.filter(variant_id__in=variant_ids)
+    rows = list(
+        qs.annotate(day=TruncDate("order__order_date"))
+        .values_list("variant_id", "day")
+        .annotate(qty=Sum("quantity"))
+        .order_by()
+    )
+
+    ids = np.array(sorted({r[0] for r in rows}), dtype=np.int64)
+    matrix = np.zeros((len(ids), n_days), dtype=float)
+    if rows:
+        first_day = start.date()
+        variant_col = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        day_col = np.fromiter(((r[1] - first_day).days for r in rows), dtype=np.int64, count=len(rows))
+        qty_col = np.fromiter((r[2] or 0 for r in rows), dtype=float, count=len(rows))
+        np.add.at(matrix, (np.searchsorted(ids, variant_col), day_col), qty_col)
+    return ids, matrix
+
+
+def holiday_records(start, end):
+    """Prophet holiday rows (name, date, lower_window, upper_window) from the holidays package and Event."""
+    records = []
+    if holidays_lib is not None and settings.PROPHET_HOLIDAY_COUNTRY:
+        calendar = holidays_lib.country_holidays(
+            settings.PROPHET_HOLIDAY_COUNTRY, years=range(start.year, end.year + 1)
+        )
+        records += [(name, day.isoformat(), 0, 0) for day, name in sorted(calendar.items())]
+
+    events = Event.objects.filter(start_date__lt=end.date(), end_date__gte=start.date()).order_by("start_date", "id")
+    for event in events:
+        # Multi-day events (sales, festivals) cover start_date .. end_date
+        records.append((event.name, event.start_date.isoformat(), 0, max(0, (event.end_date - event.start_date).days)))
+    return records
+
+
+def sku_holidays(holidays, first_day, history_end):
+    """The holiday rows that can change a fit of history running from first_day to history_end.
+
+    Prophet learns one effect per holiday name from the history, so a name that never falls
+    inside it adds nothing; rows of the other names are kept from first_day on (the forecast
+    window included).
+    """
+    def days(row):
+        day = date.fromisoformat(row[1])
+        return day, day + timedelta(days=row[3])
+
+    seen = {row[0] for row in holidays if days(row)[1] >= first_day and days(row)[0] < history_end}
+    return [row for row in holidays if row[0] in seen and days(row)[1] >= first_day]
+
+
+def series_fingerprint(start, y, holidays):
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"version": PROPHET_CONFIG_VERSION, "start": start.isoformat(), "holidays": holidays}).encode())
+    digest.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def fit_prophet_models(horizon=3, history_months=24, reference_date=REFERENCE_DATE, variant_ids=None,
+                       max_workers=None, force=False):
+    """Fits Prophet for every SKU whose sales history changed since its last fit.
+
+    Fits run on a process pool; each result is saved as it arrives so an
+    interrupted run keeps the SKUs it finished. Returns counts per outcome.
+    """
+    if not PROPHET_AVAILABLE:
+        raise RuntimeError("prophet is not installed")
+
+    # Step 1: daily history for the whole catalog in one query
+    ref_key = f"{reference_date.year:04d}-{reference_date.month:02d}"
+    start_key = add_months(ref_key, -history_months)
+    start = datetime(int(start_key[:4]), int(start_key[5:]), 1)
+    ids, matrix = daily_sales_cube(start, reference_date, variant_ids)
+
+    target_months = [add_months(ref_key, h) for h in range(horizon)]
+    last_month = target_months[-1]
+    forecast_end = datetime(int(last_month[:4]), int(last_month[5:]), 1)
+    forecast_end = (forecast_end + timedelta(days=32)).replace(day=1)
+    holidays = holiday_records(start, forecast_end)
+
+    # Step 2: keep only SKUs whose fingerprint changed. Each SKU is fitted (and fingerprinted) on
+    # its own series from its first sale plus the holidays that apply to it, so a new sale or Event
+    # only refits the SKUs it touches.
+    existing = dict(ProphetModel.objects.filter(variant_id__in=ids.tolist()).values_list("variant_id", "fingerprint"))
+    sale_days = (matrix > 0).sum(axis=1)
+    tasks, fingerprints = [], {}
+    counts = {"fitted": 0, "unchanged": 0, "too_short": 0, "failed": 0}
+    for variant_id, y, days in zip(ids.tolist(), matrix, sale_days.tolist()):
+        if days < MIN_SALE_DAYS:
+            counts["too_short"] += 1
+            continue
+        first_sale = int(np.argmax(y > 0))
+        first_day = start.date() + timedelta(days=first_sale)
+        y = y[first_sale:]
+        own_holidays = sku_holidays(holidays, first_day, reference_date.date())
+        # The fingerprint also covers the forecast window, so a longer horizon refits
+        fingerprint = series_fingerprint(first_day, y, {"holidays": own_holidays, "target_months": target_months})
+        if not force and existing.get(variant_id) == fingerprint:
+            counts["unchanged"] += 1
+            continue
+        fingerprints[variant_id] = fingerprint
+        tasks.append({
+            "variant_id": variant_id,
+            "start": first_day.isoformat(),
+            "y": y.tolist(),
+            "holidays": own_holidays,
+            "target_months": target_months,
+            "periods": (forecast_end - reference_date).days,
+        })
+    logger.info(f"Prophet: {len(tasks)} SKUs to fit, {counts['unchanged']} unchanged")
+    if not tasks:
+        return counts
+
+    # Step 3: fit across processes. Forked workers must not share our DB connection.
+    connections.close_all()
+    max_workers = max_workers or settings.PROPHET_MAX_WORKERS or None
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(fit_series, task) for task in tasks]
+        for future in as_completed(futures):
+            variant_id, model_json, forecast, seconds, error = future.result()
+            if error:
+                logger.error(f"Prophet fit failed for variant {variant_id}: {error}")
+                counts["failed"] += 1
+                continue
+            ProphetModel.objects.update_or_create(
+                variant_id=variant_id,
+                defaults={
+                    "fingerprint": fingerprints[variant_id],
+                    "model_json": model_json,
+                    "forecast": forecast,
+                    "history_end": (reference_date - timedelta(days=1)).date(),
+                    "fit_seconds": seconds,
+                },
+            )
+            counts["fitted"] += 1
+    return counts
+
+
+def stored_forecasts(variant_ids=None):
+    """{sku: {"YYYY-MM": units}} from the last Prophet fits."""
+    qs = ProphetModel.objects.exclude(variant__sku__isnull=True).exclude(variant__sku="")
+    if variant_ids is not None:
+        qs = qs.filter(variant_id__in=variant_ids)
+    return dict(qs.values_list("variant__sku", "forecast"))
+
+
+def load_model(variant_id):
+    """The fitted Prophet model for a variant, e.g. for components or longer predictions."""
+    from prophet.serialize import model_from_json
+
+    return model_from_json(ProphetModel.objects.get(variant_id=variant_id).model_json)
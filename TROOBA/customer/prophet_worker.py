@@ -0,0 +1,51 @@
+"""Prophet fitting that runs inside process-pool workers.
+
+Kept free of Django imports so worker processes start fast and never touch the
+database; customer.prophet_backend sends plain lists in and saves the results.
+"""
+import logging
+import time
+
+
+def fit_series(task):
+    """Fits one SKU's daily history and sums the forecast per month.
+
+    task: {"variant_id", "start": "YYYY-MM-DD", "y": [daily units], "holidays": [(name, "YYYY-MM-DD",
+    lower_window, upper_window)], "target_months": ["YYYY-MM"], "periods": days to forecast}
+    Returns (variant_id, model_json, {"YYYY-MM": units}, seconds, error).
+    """
+    started = time.monotonic()
+    try:
+        import pandas as pd
+        from prophet import Prophet
+        from prophet.serialize import model_to_json
+
+        # cmdstanpy logs every optimisation at INFO and resets its own level on first use
+        logging.getLogger("cmdstanpy").disabled = True
+        logging.getLogger("prophet").setLevel(logging.WARNING)
+
+        history = pd.DataFrame({
+            "ds": pd.date_range(task["start"], periods=len(task["y"]), freq="D"),
+            "y": task["y"],
+        })
+        holidays = None
+        if task["holidays"]:
+            holidays = pd.DataFrame(task["holidays"], columns=["holiday", "ds", "lower_window", "upper_window"])
+            holidays["ds"] = pd.to_datetime(holidays["ds"])
+
+        model = Prophet(
+            holidays=holidays,
+            yearly_seasonality=True,
+            weekly_seasonality=True,
+            daily_seasonality=False,
+        )
+        model.fit(history)
+        future = model.make_future_dataframe(periods=task["periods"], freq="D", include_history=False)
+        predicted = model.predict(future)[["ds", "yhat"]]
+
+        predicted["month"] = predicted["ds"].dt.strftime("%Y-%m")
+        monthly = predicted[predicted["month"].isin(task["target_months"])].groupby("month")["yhat"].sum()
+        forecast = {month: max(0, int(round(monthly.get(month, 0)))) for month in task["target_months"]}
+        return task["variant_id"], model_to_json(model), forecast, time.monotonic() - started, None
+    except Exception as e:
+        return task["variant_id"], None, None, time.monotonic() - started, str(e)
@@ -0,0 +1,203 @@
+import os
+
+import requests
+from django.utils.dateparse import parse_datetime
+
+from .instrumentation import measure
+from .models import Location, Customer, Product, ProductVariant, Order, OrderLineItem
+
+SHOPIFY_STORE = os.getenv('SHOPIFY_STORE')
+SHOPIFY_API_VERSION = os.getenv('SHOPIFY_API_VERSION')
+SHOPIFY_ACCESS_TOKEN = os.getenv('SHOPIFY_ACCESS_TOKEN')
+
+HEADERS = {
+    'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN,
+    'Content-Type': 'application/json'
+}
+
+def log(msg):
+    print(f"[Shopify Fetch] {msg}")
+
+def get_next_page_url(link_header):
+    # Link header example:
+    # <https://{store}/admin/api/2025-04/customers.json?limit=250&page_info=xyz>; rel="next"
+    if not link_header:
+        return None
+    parts = link_header.split(',')
+    for part in parts:
+        if 'rel="next"' in part:
+            url_part = part.split(';')[0].strip().strip('<>')
+            return url_part
+    return None
+
+def fetch_shopify_data_all(endpoint):
+    url = f"https://{SHOPIFY_STORE}/admin/api/{SHOPIFY_API_VERSION}/{endpoint}?limit=250"
+    all_items = []
+    while url:
+        log(f"Fetching: {url}")
+        with measure("http"):
+            response = requests.get(url, headers=HEADERS)
+        if response.status_code != 200:
+            log(f"Failed to fetch {url}: {response.status_code} - {response.text}")
+            break
+        data = response.json()
+        # Extract main list key from endpoint, e.g. 'customers', 'orders', 'products', 'locations'
+        key = endpoint.split('.')[0]  # crude way: 'customers.json' -> 'customers'
+        items = data.get(key, [])
+        log(f"Fetched {len(items)} items from current page.")
+        all_items.extend(items)
+
+        link_header = response.headers.get('Link')
+        next_url = get_next_page_url(link_header)
+        url = next_url  # if no next page, will be None and loop stops
+
+    log(f"Total fetched from {endpoint}: {len(all_items)}")
+    return all_items
+
+
+def sync_shopify_data(progress=None):
+    """Pulls locations, customers, products and orders from Shopify into the local tables."""
+    progress = progress or (lambda fraction, message="": None)
+
+    # Locations
+    progress(0.0, "Locations")
+    locations = fetch_shopify_data_all('locations.json')
+    for loc in locations:
+        loc_obj, created = Location.objects.update_or_create(
+            shopify_id=loc['id'],
+            defaults={
+                'name': loc['name'],
+                'address': loc.get('address1') or '',
+                'city': loc.get('city'),
+                'region': loc.get('province'),
+                'country': loc.get('country'),
+            }
+        )
+        log(f"{'Created' if created else 'Updated'} Location: {loc_obj.name}")
+
+    # Customers
+    progress(0.1, "Customers")
+    customers = fetch_shopify_data_all('customers.json')
+    for cust in customers:
+        name = (cust.get('first_name') or '') + ' ' + (cust.get('last_name') or '')
+        cust_obj, created = Customer.objects.update_or_create(
+            shopify_id=cust['id'],
+            defaults={
+                'email': cust.get('email'),
+                'name': name.strip() or cust.get('email') or 'Unknown',
+                'created_at': parse_datetime(cust['created_at']),
+                'city': (cust.get('default_address') or {}).get('city'),
+                'region': (cust.get('default_address') or {}).get('province'),
+                'country': (cust.get('default_address') or {}).get('country'),
+                'tags': cust.get('tags', '')
+            }
+        )
+        log(f"{'Created' if created else 'Updated'} Customer: {cust_obj.name}")
+
+    # Variants whose features (customer.features) need recomputing: new or changed variants and products,
+    # and variants on new or changed orders
+    changed_variants = set()
+
+    # Products and Variants
+    progress(0.3, "Products and variants")
+    products = fetch_shopify_data_all('products.json')
+    known_products = {
+        row[0]: row[1:] for row in Product.objects.values_list('shopify_id', 'title', 'product_type', 'vendor')
+    }
+    known_variants = {
+        row[0]: row[1:] for row in ProductVariant.objects.values_list('shopify_id', 'product__shopify_id', 'title', 'sku', 'price')
+    }
+    for prod in products:
+        prod_obj, created = Product.objects.update_or_create(
+            shopify_id=prod['id'],
+            defaults={
+                'title': prod['title'],
+                'product_type': prod.get('product_type'),
+                'vendor': prod.get('vendor'),
+                'tags': ','.join(prod.get('tags', [])) if isinstance(prod.get('tags'), list) else prod.get('tags', '')
+            }
+        )
+        log(f"{'Created' if created else 'Updated'} Product: {prod_obj.title}")
+        product_changed = known_products.get(prod_obj.shopify_id) != (prod_obj.title, prod_obj.product_type, prod_obj.vendor)
+
+        for variant in prod.get('variants', []):
+            var_obj, v_created = ProductVariant.objects.update_or_create(
+                shopify_id=variant['id'],
+                defaults={
+                    'product': prod_obj,
+                    'title': variant.get('title'),
+                    'sku': variant.get('sku'),
+                    'price': float(variant.get('price') or 0),
+                }
+            )
+            log(f"  {'Created' if v_created else 'Updated'} Variant: {var_obj.title}")
+            if product_changed or known_variants.get(var_obj.shopify_id) != (
+                prod_obj.shopify_id, var_obj.title, var_obj.sku, var_obj.price
+            ):
+                changed_variants.add(var_obj.id)
+
+    # Orders and Line Items
+    progress(0.5, "Orders and line items")
+    orders = fetch_shopify_data_all('orders.json')
+    for index, order in enumerate(orders):
+        if index % 100 == 0:
+            progress(0.5 + 0.5 * index / len(orders), f"Orders {index}/{len(orders)}")
+        cust_obj = None
+        if order.get('customer'):
+            cust_obj = Customer.objects.filter(shopify_id=order['customer']['id']).first()
+
+        location_obj = None
+        if order.get('location_id'):
+            location_obj = Location.objects.filter(shopify_id=order['location_id']).first()
+        else:
+            ship_addr = order.get('shipping_address')
+            if ship_addr:
+                location_obj = Location.objects.filter(city=ship_addr.get('city'), country=ship_addr.get('country')).first()
+
+        previous = Order.objects.filter(shopify_id=order['id']).values_list('id', 'order_date').first()
+        previous_lines = (
+            dict(OrderLineItem.objects.filter(order_id=previous[0]).values_list('variant_id', 'quantity'))
+            if previous else {}
+        )
+
+        order_obj, created = Order.objects.update_or_create(
+            shopify_id=order['id'],
+            defaults={
+                'customer': cust_obj,
+                'location': location_obj,
+                'order_date': parse_datetime(order['created_at']),
+                'day_of_week': parse_datetime(order['created_at']).strftime('%A') if order.get('created_at') else '',
+                'season': '',  # optional logic here
+                'time_slot': '', # optional logic here
+                'total_price': float(order.get('total_price') or 0),
+            }
+        )
+        log(f"{'Created' if created else 'Updated'} Order: {order_obj.shopify_id}")
+
+        for item in order.get('line_items', []):
+            prod_obj = Product.objects.filter(shopify_id=item['product_id']).first()
+            var_obj = ProductVariant.objects.filter(shopify_id=item['variant_id']).first()
+            OrderLineItem.objects.update_or_create(
+                order=order_obj,
+                variant=var_obj,
+                defaults={
+                    'product': prod_obj,
+                    'quantity': item['quantity'],
+                    'price': float(item['price']),
+                    'product_type': item.get('product_type', ''),
+                }
+            )
+            log(f"  Stored OrderLineItem for product {prod_obj.title if prod_obj else 'Unknown'}")
+            if var_obj and (
+                created or previous[1] != order_obj.order_date or previous_lines.get(var_obj.id) != item['quantity']
+            ):
+                changed_variants.add(var_obj.id)
+
+    progress(1.0, "Done")
+    return {
+        "locations": len(locations),
+        "customers": len(customers),
+        "products": len(products),
+        "orders": len(orders),
+        "changed_variant_ids": sorted(changed_variants),
+    }
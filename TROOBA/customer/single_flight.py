@@ -0,0 +1,72 @@
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Waiters poll the shared cache with exponential backoff: quick answers for short computations,
+# a handful of cache reads per waiter for long ones
+POLL_SECONDS = 0.05
+MAX_POLL_SECONDS = 1.0
+_MISSING = object()
+
+
+def _lock_key(key):
+    return f"single_flight:{key}:lock"
+
+
+def _result_key(key, token):
+    return f"single_flight:{key}:result:{token}"
+
+
+def single_flight(key, compute):
+    """Runs compute() once for concurrent callers with the same key, across threads and processes.
+
+    The first caller takes a lock in the shared cache and computes; everyone arriving while it
+    runs waits and gets the same result (it must be picklable). Results are only handed to those
+    waiters, never to later callers, so nothing goes stale here. If the leader fails or takes longer
+    than SINGLE_FLIGHT_WAIT_SECONDS, a waiter computes the value itself.
+    """
+    lock_key = _lock_key(key)
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT_SECONDS
+
+    while True:
+        # Step 1: become the leader if nobody is computing this key
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, settings.SINGLE_FLIGHT_LOCK_SECONDS):
+            try:
+                value = compute()
+                cache.set(_result_key(key, token), value, settings.SINGLE_FLIGHT_RESULT_SECONDS)
+                return value
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        # Step 2: wait for the current leader's result
+        leader = cache.get(lock_key)
+        delay = POLL_SECONDS
+        while leader is not None and time.monotonic() < deadline:
+            time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, MAX_POLL_SECONDS)
+            result_key = _result_key(key, leader)
+            # Result and lock in one cache read
+            found = cache.get_many([result_key, lock_key])
+            if result_key in found:
+                return found[result_key]
+            current = found.get(lock_key)
+            if current != leader:
+                # Released: either it stored a result just now or it failed
+                value = cache.get(result_key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                leader = current
+                delay = POLL_SECONDS
+
+        # Step 3: the leader failed (try to take over) or is too slow (compute alongside it)
+        if time.monotonic() >= deadline:
+            logger.warning(f"Single-flight wait for {key} timed out, computing without the lock")
+            return compute()
+
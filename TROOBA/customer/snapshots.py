@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import ItemSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Session key holding the current workflow's snapshot id (the items themselves never go in the session)
+SESSION_KEY = "snapshot_id"
+
+# Held in the cache while a purge job is due, so saves enqueue at most one per interval
+PURGE_KEY = "snapshots:purge_scheduled"
+
+
+def _ttl():
+    return timedelta(seconds=settings.ITEM_SNAPSHOT_TTL_SECONDS)
+
+
+def encode_items(items):
+    """(digest, compressed payload) of an item list; the digest is over the canonical JSON."""
+    payload = json.dumps(items, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest(), zlib.compress(payload)
+
+
+def decode_items(data):
+    return json.loads(zlib.decompress(bytes(data)).decode("utf-8"))
+
+
+def save_snapshot(items):
+    """Stores an item set and returns its ItemSnapshot; identical sets reuse (and extend) the same row."""
+    digest, data = encode_items(items)
+    expires_at = timezone.now() + _ttl()
+    try:
+        snapshot, created = ItemSnapshot.objects.get_or_create(
+            digest=digest, defaults={"data": data, "item_count": len(items), "expires_at": expires_at}
+        )
+    except IntegrityError:
+        # Same set saved concurrently by another request
+        snapshot, created = ItemSnapshot.objects.get(digest=digest), False
+    if not created:
+        ItemSnapshot.objects.filter(id=snapshot.id).update(expires_at=expires_at)
+    _schedule_purge()
+    return snapshot
+
+
+def versioned_snapshot_id(version, build_items):
+    """Id of a snapshot of build_items(), reused without any query while `version` is unchanged.
+
+    For item sets derived from versioned data (a page reloaded over and over): the id is kept in
+    this process's fragment cache for half the snapshot lifetime, so a reused snapshot always has at
+    least half its lifetime left.
+    """
+    key = f"snapshot-id:{hashlib.sha256(version.encode()).hexdigest()}"
+    snapshot_id = caches["fragments"].get(key)
+    if snapshot_id is None:
+        snapshot_id = str(save_snapshot(build_items()).id)
+        caches["fragments"].set(key, snapshot_id, settings.ITEM_SNAPSHOT_TTL_SECONDS // 2)
+    return snapshot_id
+
+
+def load_snapshot(snapshot_id):
+    """The items of a live snapshot, or None for a missing, expired or malformed id.
+
+    Reading a snapshot in its second half-life extends it, so an open workflow does not expire.
+    """
+    if not snapshot_id:
+        return None
+    now = timezone.now()
+    try:
+        row = ItemSnapshot.objects.filter(id=snapshot_id, expires_at__gt=now).values_list("data", "expires_at").first()
+    except (ValidationError, ValueError):
+        return None
+    if row is None:
+        return None
+    data, expires_at = row
+    if expires_at - now < _ttl() / 2:
+        ItemSnapshot.objects.filter(id=snapshot_id).update(expires_at=now + _ttl())
+    return decode_items(data)
+
+
+def remember_snapshot(session, snapshot_id):
+    """Points the session at a snapshot; the session row is only rewritten when the id changes."""
+    if snapshot_id and session.get(SESSION_KEY) != str(snapshot_id):
+        session[SESSION_KEY] = str(snapshot_id)
+
+
+def session_snapshot(session):
+    """(snapshot id, items) the session points at; items is None once the snapshot expired."""
+    snapshot_id = session.get(SESSION_KEY)
+    return snapshot_id, load_snapshot(snapshot_id)
+
+
+def purge_expired_snapshots():
+    """Deletes expired snapshots and returns how many went."""
+    deleted, _ = ItemSnapshot.objects.filter(expires_at__lte=timezone.now()).delete()
+    if deleted:
+        logger.info(f"Purged {deleted} expired item snapshots")
+    return deleted
+
+
+def _schedule_purge():
+    if not cache.add(PURGE_KEY, 1, settings.ITEM_SNAPSHOT_PURGE_INTERVAL_SECONDS):
+        return
+    enqueue("purge_item_snapshots", unique=True)
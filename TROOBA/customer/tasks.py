@@ -0,0 +1,77 @@
+"""Background job handlers, run by `manage.py run_workers`.
+
+Each handler takes progress(fraction, message) plus the job's params and returns a JSON-able result.
+"""
+from .charts import purge_chart_cache
+from .features import features_ready, refresh_sku_features
+from .forecast_runs import run_catalog_forecast
+from .jobs import enqueue, task
+from .prompt_workflow import generate_prompt_text, predict_items
+from .prophet_backend import PROPHET_AVAILABLE, fit_prophet_models
+from .shopify_sync import sync_shopify_data
+from .snapshots import load_snapshot, purge_expired_snapshots
+from .top_skus import forecast_top_skus
+
+
+@task("sync_shopify")
+def sync_shopify_task(progress):
+    result = sync_shopify_data(progress)
+    changed = result.pop("changed_variant_ids")
+    result["changed_variants"] = len(changed)
+    if not features_ready():
+        # First sync: build the whole store, not just the variants this sync touched
+        result["features_job_id"] = enqueue("refresh_sku_features", unique=True).id
+    elif changed:
+        result["features_job_id"] = enqueue("refresh_sku_features", {"variant_ids": changed}).id
+    if changed and PROPHET_AVAILABLE:
+        # Refits only those of the changed variants whose fingerprint moved
+        result["prophet_job_id"] = enqueue("fit_prophet_models", {"variant_ids": changed}).id
+    return result
+
+
+@task("refresh_sku_features")
+def refresh_sku_features_task(progress, variant_ids=None):
+    progress(0.1, f"Refreshing features for {len(variant_ids) if variant_ids is not None else 'all'} variants")
+    return {"rows": refresh_sku_features(variant_ids)}
+
+
+@task("forecast_top_skus")
+def forecast_top_skus_task(progress):
+    run = forecast_top_skus(progress)
+    return {"run_id": run.id, "sku_count": run.sku_count}
+
+
+@task("save_forecasts")
+def save_forecasts_task(progress, method, horizon=1):
+    progress(0.1, f"Forecasting the catalog ({method})")
+    run = run_catalog_forecast(method, horizon=horizon)
+    return {"run_id": run.id, "sku_count": run.sku_count}
+
+
+@task("fit_prophet_models")
+def fit_prophet_models_task(progress, horizon=3, force=False, variant_ids=None):
+    progress(0.1, f"Fitting Prophet models for {len(variant_ids) if variant_ids is not None else 'all'} variants")
+    return fit_prophet_models(horizon=horizon, force=force, variant_ids=variant_ids)
+
+
+@task("generate_prompt")
+def generate_prompt_task(progress, full_prompt, **context):
+    progress(0.1, "Waiting for Gemini")
+    return {"generated_prompt": generate_prompt_text(full_prompt)}
+
+
+@task("predict_items")
+def predict_items_task(progress, base_prompt, snapshot_id=None, items_data=None):
+    if snapshot_id:
+        items_data = load_snapshot(snapshot_id)
+    return {"predictions": predict_items(base_prompt, items_data or [], progress)}
+
+
+@task("purge_item_snapshots")
+def purge_item_snapshots_task(progress):
+    return {"deleted": purge_expired_snapshots()}
+
+
+@task("purge_chart_cache")
+def purge_chart_cache_task(progress):
+    return {"deleted": purge_chart_cache()}
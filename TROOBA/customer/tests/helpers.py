@@ -0,0 +1,32 @@
+"""Small builders for the catalog and order rows the tests need."""
+from datetime import datetime
+from itertools import count
+
+from django.utils.timezone import make_aware
+
+from customer.models import Order, OrderLineItem, Product, ProductVariant
+
+_ids = count(1000)
+
+
+def make_variant(sku, price=10.0, title="Default", product=None):
+    if product is None:
+        product = Product.objects.create(shopify_id=next(_ids), title=f"Product {sku}", product_type="Shirts", vendor="Trooba")
+    return ProductVariant.objects.create(shopify_id=next(_ids), product=product, title=title, sku=sku, price=price)
+
+
+def add_sale(variant, when, quantity=1, price=None):
+    """One order with one line item for `variant` on `when` (a date or datetime)."""
+    if not isinstance(when, datetime):
+        when = datetime(when.year, when.month, when.day, 12)
+    order = Order.objects.create(
+        shopify_id=next(_ids),
+        order_date=make_aware(when),
+        day_of_week=when.strftime("%A"),
+        season="Summer",
+        time_slot="Afternoon",
+        total_price=(price or variant.price) * quantity,
+    )
+    return OrderLineItem.objects.create(
+        order=order, product=variant.product, variant=variant, quantity=quantity, price=price or variant.price,
+    )
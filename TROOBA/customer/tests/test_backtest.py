@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from unittest import mock
+
+import numpy as np
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from customer import backtest
+from customer.backtest import accuracy_metrics, run_backtest
+
+from .helpers import add_sale, make_variant
+
+
+class AccuracyMetricsTests(SimpleTestCase):
+    def test_perfect_forecast_has_no_error(self):
+        actual = np.array([3.0, 0.0, 7.0])
+        metrics = accuracy_metrics(actual.copy(), actual)
+        self.assertEqual((metrics["mape"][0], metrics["wape"][0], metrics["bias"][0]), (0, 0, 0))
+
+    def test_known_over_forecast(self):
+        actual = np.array([10.0, 20.0, 0.0])
+        metrics = accuracy_metrics(np.array([12.0, 22.0, 6.0]), actual)
+        # MAPE over the cells that sold: (20% + 10%) / 2; WAPE and bias over the 30 units sold
+        self.assertAlmostEqual(metrics["mape"][0], 15.0)
+        self.assertAlmostEqual(metrics["wape"][0], 100 * 10 / 30)
+        self.assertAlmostEqual(metrics["bias"][0], 100 * 10 / 30)
+
+    def test_under_forecast_is_negative_bias_per_group(self):
+        metrics = accuracy_metrics(
+            np.array([5.0, 10.0, 4.0]), np.array([10.0, 10.0, 0.0]), groups=np.array([0, 0, 1]), n_groups=2,
+        )
+        self.assertEqual(list(metrics["bias"][:1]), [-25.0])
+        self.assertEqual(list(metrics["cells"]), [2, 1])
+        self.assertTrue(np.isnan(metrics["wape"][1]))  # nothing sold in group 1
+
+
+def _thread_pool(max_workers=None, mp_context=None):
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+
+@mock.patch.object(backtest, "ProcessPoolExecutor", _thread_pool)
+@mock.patch.object(backtest.connections, "close_all", lambda: None)
+class RunBacktestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Four units every month Jan-Jun 2025; July is incomplete and not scored
+        variant = make_variant("STEADY")
+        for month in range(1, 8):
+            add_sale(variant, date(2025, month, 10), quantity=4)
+
+    def test_steady_sales_are_forecast_without_error(self):
+        report = run_backtest(["moving_average"], horizon=1, first_cutoff="2025-04")
+        self.assertEqual(report["cutoffs"], ["2025-04", "2025-05", "2025-06"])
+        overall = report["results"]["moving_average"]["overall"][0]
+        self.assertEqual((overall["cells"], overall["wape"], overall["bias"]), (3, 0.0, 0.0))
+        self.assertEqual([row["key"] for row in report["results"]["moving_average"]["sku"]], ["STEADY"])
+
+    def test_cutoff_range_and_step(self):
+        report = run_backtest(["moving_average"], horizon=2, first_cutoff="2025-02", last_cutoff="2025-05", every=2)
+        self.assertEqual(report["cutoffs"], ["2025-02", "2025-04"])
+        self.assertEqual(run_backtest(["moving_average"], horizon=2)["cutoffs"][-1], "2025-05")
+
+    def test_cutoffs_outside_the_history_are_rejected(self):
+        for cutoffs in ({"first_cutoff": "2024-01"}, {"last_cutoff": "2025-5"}, {"last_cutoff": "2025-09"}):
+            with self.subTest(**cutoffs), self.assertRaises(ValueError):
+                run_backtest(["moving_average"], horizon=1, **cutoffs)
+        with self.assertRaisesMessage(CommandError, "Cutoff 2024-01"):
+            call_command("backtest_forecasts", "--from", "2024-01")
@@ -0,0 +1,80 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from customer import gemini
+from customer.gemini import estimate_tokens, pack_batches, predict_in_batches
+
+
+def _entries(count, size=40):
+    return [(f"S{i}", "x" * size) for i in range(count)]
+
+
+class PackBatchesTests(SimpleTestCase):
+    def test_token_budget_is_respected(self):
+        entries = _entries(10, size=400)  # 101 tokens each
+        batches = pack_batches(entries, overhead_tokens=100, token_budget=400, max_items=50)
+        self.assertEqual([len(b) for b in batches], [2, 2, 2, 2, 2])
+        for batch in batches:
+            self.assertLessEqual(100 + sum(estimate_tokens(text) for _, text in batch), 400)
+
+    def test_item_limit_is_respected(self):
+        batches = pack_batches(_entries(7), overhead_tokens=0, token_budget=10_000, max_items=3)
+        self.assertEqual([len(b) for b in batches], [3, 3, 1])
+
+    def test_order_is_kept_and_nothing_is_lost(self):
+        entries = _entries(9)
+        batches = pack_batches(entries, overhead_tokens=10, token_budget=60, max_items=4)
+        self.assertEqual([entry for batch in batches for entry in batch], entries)
+
+    def test_oversized_entry_goes_out_alone(self):
+        entries = [("small", "x"), ("huge", "x" * 10_000), ("small2", "x")]
+        batches = pack_batches(entries, overhead_tokens=0, token_budget=100, max_items=10)
+        self.assertEqual([[sku for sku, _ in b] for b in batches], [["small"], ["huge"], ["small2"]])
+
+    def test_no_entries(self):
+        self.assertEqual(pack_batches([], overhead_tokens=10), [])
+
+
+@override_settings(GEMINI_MAX_CONCURRENCY=1)
+class PredictInBatchesTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(gemini, "forget_response")
+        self.forget = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _predict(self, answer, entries, **kwargs):
+        def fake_call(prompt, api_key, generation_config=None):
+            return answer(json.loads(prompt))
+
+        with mock.patch.object(gemini, "call_gemini", side_effect=fake_call) as call:
+            results = predict_in_batches(
+                entries, json.dumps, "key", on_error=lambda sku, e: {"sku": sku, "error": str(e)}, **kwargs
+            )
+        return results, call
+
+    def test_one_request_per_batch(self):
+        entries = [(f"S{i}", f"S{i}") for i in range(6)]
+        with override_settings(GEMINI_BATCH_MAX_ITEMS=3):
+            results, call = self._predict(lambda skus: json.dumps([{"sku": s, "p": 1} for s in skus]), entries)
+        self.assertEqual(call.call_count, 2)
+        self.assertEqual(set(results), {sku for sku, _ in entries})
+
+    def test_dropped_skus_are_asked_for_again(self):
+        entries = [(f"S{i}", f"S{i}") for i in range(4)]
+        # The first answer leaves out S3
+        answer = lambda skus: json.dumps([{"sku": s, "p": 1} for s in skus if len(skus) == 1 or s != "S3"])
+        results, call = self._predict(answer, entries)
+        self.assertEqual(results["S3"], {"sku": "S3", "p": 1})
+        self.assertEqual([c.args[0] for c in call.call_args_list], [json.dumps(["S0", "S1", "S2", "S3"]), json.dumps(["S3"])])
+
+    def test_unparseable_batch_is_split_until_the_bad_sku_is_isolated(self):
+        entries = [(f"S{i}", f"S{i}") for i in range(4)]
+        answer = lambda skus: "oops" if "S2" in skus else "```json\n" + json.dumps([{"sku": s} for s in skus]) + "\n```"
+        with self.assertLogs("customer.gemini", "WARNING"):
+            results, _ = self._predict(answer, entries)
+        self.assertEqual(results["S0"], {"sku": "S0"})
+        self.assertEqual(results["S3"], {"sku": "S3"})
+        self.assertIn("error", results["S2"])
+        self.assertTrue(self.forget.called)
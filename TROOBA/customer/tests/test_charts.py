@@ -0,0 +1,104 @@
+import os
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from customer.charts import purge_chart_cache
+from customer.features import refresh_sku_features
+from customer.models import Job
+
+from .helpers import add_sale, make_variant
+
+
+class ChartViewTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CHART_RENDER_WORKERS=0, CHART_CACHE_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+        self.variant = make_variant("CHART1", price=20)
+        add_sale(self.variant, date(2025, 4, 10), quantity=3)
+        refresh_sku_features()
+
+    def _url(self, kind="history", fmt="svg"):
+        return reverse("sku_chart", args=["CHART1", kind, fmt])
+
+    def test_renders_and_answers_304_to_a_matching_etag(self):
+        response = self.client.get(self._url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertIn(b"<svg", response.content)
+
+        again = self.client.get(self._url(), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+
+    def test_etag_differs_per_range_and_format(self):
+        svg = self.client.get(self._url())["ETag"]
+        png = self.client.get(self._url(fmt="png"))
+        self.assertEqual(png["Content-Type"], "image/png")
+        self.assertNotEqual(png["ETag"], svg)
+        self.assertNotEqual(self.client.get(self._url(), {"months": 6})["ETag"], svg)
+
+    def test_etag_changes_when_the_sales_change(self):
+        etag = self.client.get(self._url())["ETag"]
+        add_sale(self.variant, date(2025, 4, 20), quantity=4)
+        refresh_sku_features()
+
+        response = self.client.get(self._url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_unknown_sku_and_bad_parameters(self):
+        self.assertEqual(self.client.get(reverse("sku_chart", args=["NOPE", "history", "svg"])).status_code, 404)
+        self.assertEqual(self.client.get(self._url(fmt="gif")).status_code, 404)
+        self.assertEqual(self.client.get(self._url(kind="pie")).status_code, 400)
+        self.assertEqual(self.client.get(self._url(), {"months": "x"}).status_code, 400)
+        self.assertEqual(self.client.get(self._url(kind="forecast"), {"method": "magic"}).status_code, 400)
+
+    def test_rendering_schedules_one_purge_per_interval(self):
+        self.client.get(self._url())
+        self.client.get(self._url(fmt="png"))
+        self.assertEqual(Job.objects.filter(kind="purge_chart_cache").count(), 1)
+
+
+class PurgeChartCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+
+    def _file(self, name, size, age_days):
+        path = self.root / name[:2] / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"x" * size)
+        mtime = time.time() - age_days * 86400
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_old_images_and_stale_temporary_files_go(self):
+        old = self._file("aa1.png", 10, age_days=8)
+        fresh = self._file("aa2.png", 10, age_days=1)
+        writing = self._file("bb1.png.123.tmp", 10, age_days=0)
+        abandoned = self._file("bb2.png.456.tmp", 10, age_days=9)
+        with override_settings(CHART_CACHE_DIR=str(self.root), CHART_CACHE_MAX_AGE_SECONDS=7 * 86400):
+            self.assertEqual(purge_chart_cache(), 2)
+        self.assertEqual([p.exists() for p in (old, fresh, writing, abandoned)], [False, True, True, False])
+
+    def test_oldest_images_go_until_the_rest_fits(self):
+        paths = [self._file(f"cc{i}.svg", 100, age_days=3 - i) for i in range(3)]
+        with override_settings(CHART_CACHE_DIR=str(self.root), CHART_CACHE_MAX_BYTES=150):
+            self.assertEqual(purge_chart_cache(), 2)
+        self.assertEqual([p.exists() for p in paths], [False, False, True])
+
+    def test_missing_directory(self):
+        with override_settings(CHART_CACHE_DIR=str(self.root / "nothing")):
+            self.assertEqual(purge_chart_cache(), 0)
@@ -0,0 +1,96 @@
+from datetime import date, datetime
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase
+from django.urls import reverse
+
+from customer.features import (
+    FEATURE_HISTORY_MONTHS, FeatureStoreNotReady, feature_for_sku, feature_history, refresh_sku_features,
+    sales_by_month, top_features,
+)
+from customer.forecasting import monthly_sales_cube
+from customer.models import Job, SkuFeature
+from customer.tasks import sync_shopify_task
+
+from .helpers import add_sale, make_variant
+
+
+def build_catalog():
+    """Three SKUs with different sales; returns {sku: variant}."""
+    variants = {sku: make_variant(sku, price=price) for sku, price in (("TEE", 20.0), ("CAP", 8.0), ("BAG", 45.0))}
+    for month in range(1, 7):
+        add_sale(variants["TEE"], date(2025, month, 3), quantity=10 * month)
+        add_sale(variants["CAP"], date(2025, month, 3), quantity=month)
+    add_sale(variants["BAG"], date(2024, 9, 1), quantity=4)
+    add_sale(variants["TEE"], date(2025, 6, 25), quantity=5)   # within the last 7 days
+    add_sale(variants["TEE"], date(2025, 7, 10), quantity=33)  # the reference month
+    return variants
+
+
+class RefreshSkuFeaturesTests(TestCase):
+    def setUp(self):
+        self.variants = build_catalog()
+        refresh_sku_features()
+
+    def test_rows_hold_the_forecasting_inputs(self):
+        tee = feature_for_sku("TEE")
+        self.assertEqual(len(tee.monthly_sales), FEATURE_HISTORY_MONTHS)
+        self.assertEqual(tee.history_start, "2023-07")
+        self.assertEqual(tee.monthly_sales[-6:], [10, 20, 30, 40, 50, 65])
+        self.assertEqual((tee.sales_12m, tee.sales_last_30_days, tee.sales_last_7_days), (215, 65, 5))
+        self.assertEqual(tee.reference_month_sales, 33)
+        self.assertEqual(sales_by_month(feature_for_sku("BAG")), {"2024-09": 4})
+
+    def test_top_features_are_ranked_by_twelve_month_sales(self):
+        self.assertEqual([f.sku for f in top_features(limit=2)], ["TEE", "CAP"])
+
+    def test_partial_refresh_only_touches_the_given_variants(self):
+        add_sale(self.variants["CAP"], date(2025, 6, 28), quantity=100)
+        tee_before = feature_for_sku("TEE").updated_at
+        refresh_sku_features([self.variants["CAP"].id])
+        self.assertEqual(feature_for_sku("CAP").sales_12m, 121)
+        self.assertEqual(feature_for_sku("TEE").updated_at, tee_before)
+
+    def test_history_matches_the_order_aggregate(self):
+        ids, months, matrix = feature_history(12)
+        expected_ids, expected_months, expected = monthly_sales_cube(datetime(2024, 7, 1), datetime(2025, 7, 1))
+        self.assertEqual(months, expected_months)
+        np.testing.assert_array_equal(ids, expected_ids)
+        np.testing.assert_array_equal(matrix, expected)
+        self.assertIsNone(feature_history(FEATURE_HISTORY_MONTHS + 1))
+
+
+class FeatureStoreNotReadyTests(TestCase):
+    def test_reads_queue_one_refresh_instead_of_building_inline(self):
+        build_catalog()
+        with self.assertRaises(FeatureStoreNotReady) as first:
+            top_features()
+        with self.assertRaises(FeatureStoreNotReady) as second:
+            feature_for_sku("TEE")
+        self.assertEqual(first.exception.job, second.exception.job)
+        self.assertEqual(Job.objects.filter(kind="refresh_sku_features").count(), 1)
+        self.assertFalse(SkuFeature.objects.exists())
+
+    def test_pages_wait_on_the_job_and_apis_answer_503(self):
+        response = self.client.get(reverse("fetching_items"))
+        job = Job.objects.get(kind="refresh_sku_features")
+        self.assertTrue(response["Location"].startswith(reverse("job_wait", args=[job.id])))
+
+        for url in (reverse("sku_api"), reverse("sku_chart", args=["TEE", "history", "png"])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.json()["job_id"], job.id)
+                self.assertIn("Retry-After", response)
+
+    @mock.patch("customer.tasks.sync_shopify_data", return_value={"changed_variant_ids": [1, 2]})
+    def test_first_sync_queues_a_full_build(self, sync):
+        result = sync_shopify_task(lambda *args: None)
+        self.assertEqual(Job.objects.get(id=result["features_job_id"]).params, {})
+
+        add_sale(make_variant("X"), date(2025, 6, 1))
+        refresh_sku_features()
+        sync.return_value = {"changed_variant_ids": [1, 2]}  # the task pops the ids off the previous one
+        result = sync_shopify_task(lambda *args: None)
+        self.assertEqual(Job.objects.get(id=result["features_job_id"]).params, {"variant_ids": [1, 2]})
@@ -0,0 +1,61 @@
+from datetime import date
+
+from django.test import TestCase
+
+from customer.forecast_runs import latest_run, run_catalog_forecast, run_predictions, save_forecast_run
+from customer.models import SalesPrediction
+from customer.prompt_workflow import save_item_predictions
+
+from .helpers import add_sale, make_variant
+
+
+class ForecastRunTests(TestCase):
+    def setUp(self):
+        self.shirt = make_variant("SHIRT")
+        self.cap = make_variant("CAP")
+
+    def _row(self, variant, month, units):
+        return {"variant_id": variant.id, "product_id": variant.product_id, "month": month,
+                "predicted_sales": units, "reason": "test"}
+
+    def test_saved_run_reads_back_per_variant_and_month(self):
+        run = save_forecast_run("test", [self._row(self.shirt, "2025-07", 5), self._row(self.shirt, "2025-08", 6)], horizon=2)
+        self.assertEqual(latest_run("test"), run)
+        self.assertEqual(
+            run_predictions(run),
+            {self.shirt.id: {"2025-07": {"predicted": 5, "reason": "test"}, "2025-08": {"predicted": 6, "reason": "test"}}},
+        )
+        self.assertEqual(SalesPrediction.objects.get(run=run, date=date(2025, 8, 1)).horizon, 2)
+
+    def test_latest_run_is_the_newest_of_its_method(self):
+        save_forecast_run("test", [self._row(self.shirt, "2025-07", 1)])
+        newest = save_forecast_run("test", [self._row(self.cap, "2025-07", 2)])
+        save_forecast_run("other", [self._row(self.cap, "2025-07", 3)])
+        self.assertEqual(latest_run("test"), newest)
+        self.assertEqual(run_predictions(newest, [self.shirt.id]), {})
+
+    def test_catalog_run(self):
+        for month in range(1, 7):
+            add_sale(self.shirt, date(2025, month, 5), quantity=3)
+        run = run_catalog_forecast("moving_average")
+        self.assertEqual(run_predictions(run)[self.shirt.id]["2025-07"]["predicted"], 3)
+        with self.assertRaises(ValueError):
+            run_catalog_forecast("crystal_ball")
+
+
+class SaveItemPredictionsTests(TestCase):
+    def test_bad_numbers_are_skipped_and_the_rest_saved(self):
+        for sku in ("A", "B", "C", "D"):
+            make_variant(sku)
+        with self.assertLogs("customer.prompt_workflow", "WARNING") as logs:
+            save_item_predictions([
+                {"sku": "A", "july_predicted": "12.5", "reason": "trend"},
+                {"sku": "B", "july_predicted": "~120"},
+                {"sku": "C", "july_predicted": "N/A"},
+                {"sku": "D", "july_predicted": None},
+                {"sku": "unknown", "july_predicted": 3},
+            ])
+        self.assertEqual(len(logs.records), 2)
+        predictions = dict(SalesPrediction.objects.values_list("variant__sku", "predicted_sales"))
+        self.assertEqual(predictions, {"A": 12.5, "D": 0.0})
+        self.assertEqual(latest_run("gemini_prompt").sku_count, 2)
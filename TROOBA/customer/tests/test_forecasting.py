@@ -0,0 +1,79 @@
+from datetime import date, datetime
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from customer.forecasting import (
+    add_months, baseline_forecast, exponential_smoothing, forecast_catalog, month_keys, monthly_sales_cube,
+    moving_average_trend, seasonal_naive,
+)
+
+from .helpers import add_sale, make_variant
+
+
+def _holt(series, horizon, alpha=0.3, beta=0.1):
+    """Textbook one-series Holt, to check the vectorised version against."""
+    level = series[0]
+    trend = series[1] - series[0] if len(series) > 1 else 0.0
+    for value in series[1:]:
+        previous = level
+        level = alpha * value + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous) + (1 - beta) * trend
+    return [level + trend * h for h in range(1, horizon + 1)]
+
+
+class ForecastMethodTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.history = rng.integers(0, 50, size=(5, 24)).astype(float)
+
+    def test_exponential_smoothing_matches_the_per_series_loop(self):
+        vectorised = exponential_smoothing(self.history, 3)
+        for row, forecast in zip(self.history, vectorised):
+            np.testing.assert_allclose(forecast, _holt(list(row), 3))
+
+    def test_seasonal_naive_repeats_last_year(self):
+        forecast = seasonal_naive(self.history, 14)
+        np.testing.assert_array_equal(forecast[:, :12], self.history[:, -12:])
+        np.testing.assert_array_equal(forecast[:, 12:], self.history[:, -12:-10])
+        # Less than a season of history: the last month, repeated
+        np.testing.assert_array_equal(seasonal_naive(self.history[:, :5], 2), self.history[:, [4, 4]])
+
+    def test_moving_average_trend_extends_a_straight_line(self):
+        history = np.array([[1.0, 2.0, 3.0, 4.0, 5.0], [10.0, 10.0, 10.0, 10.0, 10.0]])
+        np.testing.assert_allclose(moving_average_trend(history, 2, window=3), [[6.0, 7.0], [10.0, 10.0]])
+
+    def test_baseline_forecast_clips_and_validates(self):
+        falling = np.array([[30.0, 20.0, 10.0, 0.0]])
+        self.assertTrue((baseline_forecast(falling, 3, "moving_average") >= 0).all())
+        self.assertEqual(baseline_forecast(np.zeros((0, 0)), 2).shape, (0, 2))
+        with self.assertRaises(ValueError):
+            baseline_forecast(self.history, 1, "crystal_ball")
+
+    def test_month_helpers(self):
+        self.assertEqual(add_months("2024-11", 3), "2025-02")
+        self.assertEqual(add_months("2025-01", -1), "2024-12")
+        self.assertEqual(month_keys(datetime(2024, 11, 1), datetime(2025, 2, 1)), ["2024-11", "2024-12", "2025-01"])
+
+
+class CatalogForecastTests(TestCase):
+    def setUp(self):
+        self.shirt = make_variant("SHIRT")
+        self.cap = make_variant("CAP")
+        for month in range(1, 7):
+            add_sale(self.shirt, date(2025, month, 10), quantity=month)
+        add_sale(self.cap, date(2025, 3, 1), quantity=4)
+        add_sale(self.cap, date(2025, 3, 20), quantity=1)
+        add_sale(self.cap, date(2025, 7, 2), quantity=50)  # on/after the reference date, not history
+
+    def test_monthly_sales_cube(self):
+        ids, months, matrix = monthly_sales_cube(datetime(2025, 1, 1), datetime(2025, 7, 1))
+        self.assertEqual(months, ["2025-01", "2025-02", "2025-03", "2025-04", "2025-05", "2025-06"])
+        rows = dict(zip(ids.tolist(), matrix.tolist()))
+        self.assertEqual(rows[self.shirt.id], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(rows[self.cap.id], [0, 0, 5, 0, 0, 0])
+
+    def test_forecast_catalog_from_orders(self):
+        forecasts = forecast_catalog(horizon=2, method="moving_average", history_months=6)
+        self.assertEqual(forecasts["SHIRT"], {"2025-07": 7, "2025-08": 8})
+        self.assertEqual(set(forecasts["CAP"]), {"2025-07", "2025-08"})
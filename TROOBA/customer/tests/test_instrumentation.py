@@ -0,0 +1,84 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from customer.gemini import run_concurrently
+from customer.instrumentation import aggregate, collect, measure, summarize
+from customer.models import Job
+
+
+def _sample(total_ms, db_count=0):
+    return {"total_ms": total_ms, "db_count": db_count, "db_ms": 0.0}
+
+
+class CollectTests(TestCase):
+    def test_counts_queries_and_measured_sections(self):
+        with collect() as metrics:
+            list(Job.objects.all())
+            Job.objects.count()
+            with measure("http"):
+                pass
+        self.assertEqual(metrics.counts["db"], 2)
+        self.assertEqual(metrics.counts["http"], 1)
+        self.assertGreater(metrics.total, 0)
+
+    def test_measure_outside_collect_is_a_no_op(self):
+        with measure("http"):
+            pass
+        with collect() as metrics:
+            pass
+        self.assertEqual(metrics.counts["http"], 0)
+
+    def test_http_calls_in_pool_threads_count_for_the_caller(self):
+        def call(item):
+            with measure("http"):
+                return item * 2
+
+        with collect() as metrics:
+            results = run_concurrently(call, [1, 2, 3], on_error=lambda item, e: None, max_workers=3)
+        self.assertEqual(results, [2, 4, 6])
+        self.assertEqual(metrics.counts["http"], 3)
+
+    def test_summarize(self):
+        summary = summarize({"a": [_sample(10, 1), _sample(30, 5), _sample(20, 3)], "empty": []})
+        self.assertEqual(list(summary), ["a"])
+        self.assertEqual(summary["a"]["samples"], 3)
+        self.assertEqual(summary["a"]["total_ms"], {"mean": 20.0, "p50": 20, "p95": 30, "max": 30})
+        self.assertEqual(summary["a"]["db_count"], {"mean": 3.0, "max": 5})
+
+
+@override_settings(DEBUG=True)
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        aggregate.reset()
+
+    @override_settings(METRICS_HEADERS=True)
+    def test_headers_report_the_request(self):
+        response = self.client.get(reverse("job_status", args=[999]))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("total;dur=", response["Server-Timing"])
+        self.assertEqual(response["X-DB-Queries"], "1")
+        self.assertEqual(response["X-HTTP-Calls"], "0")
+
+    @override_settings(METRICS_HEADERS=False)
+    def test_headers_off(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("metrics")))
+
+    def test_views_and_jobs_are_summarized(self):
+        self.client.get(reverse("job_status", args=[999]))
+        Job.objects.create(
+            kind="refresh_sku_features", status=Job.DONE, finished_at=timezone.now(),
+            metrics={"total_ms": 12.0, "db_count": 4, "db_ms": 3.0},
+        )
+        Job.objects.create(kind="refresh_sku_features", status=Job.QUEUED)
+
+        body = self.client.get(reverse("metrics"), {"reset": "1"}).json()
+        self.assertEqual(body["views"]["job_status"]["samples"], 1)
+        self.assertEqual(body["jobs"]["job:refresh_sku_features"]["samples"], 1)
+        self.assertEqual(body["jobs"]["job:refresh_sku_features"]["db_count"], {"mean": 4.0, "max": 4})
+        # ?reset=1 started a fresh window; only the reset request itself was recorded after it
+        self.assertEqual(list(self.client.get(reverse("metrics")).json()["views"]), ["metrics"])
+
+    @override_settings(DEBUG=False)
+    def test_staff_only_outside_debug(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
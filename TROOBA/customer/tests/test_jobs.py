@@ -0,0 +1,177 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+import customer.tasks  # noqa: F401  (registers the real tasks before the test ones below)
+from customer import jobs
+from customer.jobs import claim_job, enqueue, requeue_stale_jobs, run_job, task, work
+from customer.models import Job
+
+CALLS = []
+
+
+@task("test_echo")
+def echo_task(progress, value):
+    progress(0.5, "halfway")
+    CALLS.append(value)
+    return {"value": value}
+
+
+@task("test_fail")
+def fail_task(progress):
+    raise RuntimeError("boom")
+
+
+@task("test_strand")
+def strand_task(progress):
+    # Leaves a job behind that looks like its worker died
+    Job.objects.create(
+        kind="test_echo", params={"value": "stranded"}, status=Job.RUNNING, attempts=1, max_attempts=2,
+        heartbeat_at=timezone.now() - timedelta(hours=1),
+    )
+
+
+@task("test_overtaken")
+def overtaken_task(progress):
+    # While this run is busy its heartbeat looks stale, and another worker takes the job over
+    Job.objects.filter(kind="test_overtaken").update(heartbeat_at=timezone.now() - timedelta(hours=1))
+    requeue_stale_jobs()
+    claim_job("w2")
+    progress(0.5, "still going")
+    return {"late": True}
+
+
+def _stale(kind="test_echo", attempts=1, max_attempts=2):
+    return Job.objects.create(
+        kind=kind, params={"value": "x"}, status=Job.RUNNING, attempts=attempts, max_attempts=max_attempts,
+        heartbeat_at=timezone.now() - timedelta(hours=1),
+    )
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_unique_enqueue_returns_the_pending_job(self):
+        first = enqueue("test_echo", {"value": 1}, unique=True)
+        self.assertEqual(enqueue("test_echo", {"value": 1}, unique=True), first)
+        self.assertNotEqual(enqueue("test_echo", {"value": 2}, unique=True), first)
+        self.assertNotEqual(enqueue("test_echo", {"value": 1}), first)
+
+    def test_unique_key_is_released_when_the_job_finishes(self):
+        first = enqueue("test_echo", {"value": 1}, unique=True)
+        run_job(claim_job("w"))
+        second = enqueue("test_echo", {"value": 1}, unique=True)
+        self.assertNotEqual(second, first)
+        self.assertIsNone(Job.objects.get(id=first.id).unique_key)
+
+    def test_unique_enqueue_racing_another_process_returns_its_job(self):
+        create = Job.objects.create
+        rival = []
+
+        def create_after_a_rival(**kwargs):
+            # The other process inserts between our lookup and our insert
+            if not rival:
+                rival.append(create(**kwargs))
+            return create(**kwargs)
+
+        with mock.patch.object(Job.objects, "create", create_after_a_rival):
+            job = enqueue("test_echo", {"value": 1}, unique=True)
+        self.assertEqual(job, rival[0])
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_unknown_kind_fails_when_enqueued(self):
+        with self.assertRaises(KeyError):
+            enqueue("no_such_task")
+
+    def test_claims_oldest_first_and_only_once(self):
+        first = enqueue("test_echo", {"value": 1})
+        second = enqueue("test_echo", {"value": 2})
+        claimed = claim_job("w1")
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts, claimed.worker), (first.id, Job.RUNNING, 1, "w1"))
+        self.assertEqual(claim_job("w2").id, second.id)
+        self.assertIsNone(claim_job("w3"))
+
+    def test_run_job_records_result_progress_and_metrics(self):
+        enqueue("test_echo", {"value": 7})
+        job = claim_job("w")
+        self.assertTrue(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.progress), (Job.DONE, {"value": 7}, 1.0))
+        self.assertEqual(job.metrics["db_count"], 1)  # the progress update
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job_is_retried_until_attempts_run_out(self):
+        enqueue("test_fail", max_attempts=2)
+        with self.assertLogs("customer.jobs", "ERROR"):
+            run_job(claim_job("w"))
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        with self.assertLogs("customer.jobs", "ERROR"):
+            run_job(claim_job("w"))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertTrue(job.error.startswith("boom"))
+        self.assertEqual(jobs.job_payload(job)["error"], "boom")
+
+    def test_run_overtaken_by_another_worker_does_not_record_its_outcome(self):
+        enqueue("test_overtaken", max_attempts=2)
+        with self.assertLogs("customer.jobs", "WARNING"):
+            self.assertFalse(run_job(claim_job("w1")))
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.worker, job.attempts, job.result), (Job.RUNNING, "w2", 2, None))
+        self.assertEqual(job.message, "Requeued after worker timeout")
+
+    def test_requeue_stale_jobs(self):
+        retry = _stale(attempts=1, max_attempts=2)
+        give_up = _stale(attempts=2, max_attempts=2)
+        alive = Job.objects.create(kind="test_echo", status=Job.RUNNING, attempts=1, heartbeat_at=timezone.now())
+        self.assertEqual(requeue_stale_jobs(), (1, 1))
+        statuses = dict(Job.objects.values_list("id", "status"))
+        self.assertEqual(statuses, {retry.id: Job.QUEUED, give_up.id: Job.FAILED, alive.id: Job.RUNNING})
+
+
+# work() closes the thread's connections between jobs; inside a TestCase that would end the test transaction
+@mock.patch.object(jobs, "close_old_connections", lambda: None)
+@mock.patch.object(jobs.connections, "close_all", lambda: None)
+class WorkerLoopTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_worker_requeues_and_runs_abandoned_jobs_on_start(self):
+        _stale()
+        work("w", threading.Event(), once=True)
+        self.assertEqual(CALLS, ["x"])
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    @override_settings(JOB_REQUEUE_INTERVAL=0)
+    def test_worker_keeps_requeueing_while_it_runs(self):
+        enqueue("test_strand")
+        work("w", threading.Event(), once=True)
+        self.assertEqual(CALLS, ["stranded"])
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+
+class JobViewTests(TestCase):
+    def test_status_payload(self):
+        job = enqueue("test_echo", {"value": 1})
+        response = self.client.get(reverse("job_status", args=[job.id]))
+        self.assertEqual(response.json()["status"], Job.QUEUED)
+        self.assertEqual(self.client.get(reverse("job_status", args=[job.id + 100])).status_code, 404)
+
+    def test_malformed_or_foreign_job_ids_are_404(self):
+        other = enqueue("test_echo", {"value": 1})
+        for url in (reverse("generate_prompt"), reverse("handle_prompt")):
+            for value in ("abc", "1.5", str(other.id), "999999"):
+                with self.subTest(url=url, job=value):
+                    self.assertEqual(self.client.get(url, {"job": value}).status_code, 404)
+
+    def test_unfinished_job_redirects_to_the_wait_page(self):
+        job = enqueue("generate_prompt", {"full_prompt": "p"})
+        response = self.client.get(reverse("generate_prompt"), {"job": job.id})
+        self.assertRedirects(response, f"{reverse('job_wait', args=[job.id])}?next=%2Fgenerate-prompt%2F%3Fjob%3D{job.id}",
+                             fetch_redirect_response=False)
@@ -0,0 +1,84 @@
+from datetime import timedelta
+from unittest import mock
+
+import requests
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from customer import gemini
+from customer.gemini import FORECAST_GENERATION_CONFIG, call_gemini, forget_response, prompt_cache_key
+from customer.models import LLMResponseCache, Prompt
+from customer.views import _compare_sku_page
+
+from .helpers import make_variant
+
+
+class LLMResponseCacheTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(gemini.client, "generate", side_effect=lambda prompt, *args: f"answer to {prompt}")
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_identical_prompts_call_gemini_once(self):
+        self.assertEqual(call_gemini("p1", "key"), "answer to p1")
+        self.assertEqual(call_gemini("p1", "key"), "answer to p1")
+        self.assertEqual(self.generate.call_count, 1)
+        self.assertEqual(LLMResponseCache.objects.get().hits, 1)
+
+    def test_model_and_generation_config_are_part_of_the_key(self):
+        call_gemini("p1", "key")
+        call_gemini("p1", "key", FORECAST_GENERATION_CONFIG)
+        call_gemini("p1", "key", model="gemini-other")
+        self.assertEqual(self.generate.call_count, 3)
+        self.assertNotEqual(
+            prompt_cache_key("m", {"temperature": 0}, "p"), prompt_cache_key("m", {"temperature": 1}, "p")
+        )
+
+    def test_use_cache_false_always_calls(self):
+        call_gemini("p1", "key", use_cache=False)
+        call_gemini("p1", "key", use_cache=False)
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertFalse(LLMResponseCache.objects.exists())
+
+    def test_failures_are_not_cached(self):
+        self.generate.side_effect = requests.exceptions.ConnectionError("down")
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            call_gemini("p1", "key")
+        self.assertFalse(LLMResponseCache.objects.exists())
+
+    def test_forget_response_drops_an_unusable_answer(self):
+        call_gemini("p1", "key", FORECAST_GENERATION_CONFIG)
+        forget_response("p1", FORECAST_GENERATION_CONFIG)
+        call_gemini("p1", "key", FORECAST_GENERATION_CONFIG)
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_expired_entries_are_not_served(self):
+        call_gemini("p1", "key")
+        LLMResponseCache.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_gemini("p1", "key")
+        self.assertEqual(self.generate.call_count, 2)
+
+    @override_settings(LLM_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        call_gemini("p1", "key")
+        call_gemini("p2", "key")
+        LLMResponseCache.objects.filter(key=prompt_cache_key(gemini.GEMINI_MODEL, None, "p1")).update(
+            last_used_at=timezone.now() - timedelta(hours=1)
+        )
+        call_gemini("p3", "key")
+        self.assertEqual(LLMResponseCache.objects.count(), 2)
+        self.assertFalse(LLMResponseCache.objects.filter(key=prompt_cache_key(gemini.GEMINI_MODEL, None, "p1")).exists())
+
+
+class CompareSkuPageTests(TestCase):
+    def test_unparseable_answer_is_not_replayed(self):
+        make_variant("SKU-C")
+        Prompt.objects.create(type="Header", prompt="Forecast 2024.")
+        Prompt.objects.create(type="MainPrompt", prompt="Predict monthly sales as JSON.")
+        with mock.patch.object(gemini.client, "generate", return_value="not json") as generate:
+            _, context = _compare_sku_page("SKU-C", "key")
+            _compare_sku_page("SKU-C", "key")
+        self.assertIn("Parsing Error", context["reasoning"])
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(generate.call_args.args[3], FORECAST_GENERATION_CONFIG)
+        self.assertFalse(LLMResponseCache.objects.exists())
@@ -0,0 +1,105 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Migrates the customer app back to `migrate_from` for setUp and forward again afterwards."""
+
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes("customer")
+        self.old_apps = self._migrate([("customer", self.migrate_from)])
+
+    def tearDown(self):
+        self._migrate(self.latest)
+
+    def _migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def migrate_forward(self):
+        return self._migrate([("customer", self.migrate_to)])
+
+
+class RollupBackfillMigrationTests(MigrationTestCase):
+    migrate_from = "0004_customerpromotion"
+    migrate_to = "0005_promotioncategoryrollup"
+
+    def test_rollups_are_built_for_existing_promotions(self):
+        CustomerPromotion = self.old_apps.get_model("customer", "CustomerPromotion")
+        for variant_id, month, clicks, category in [
+            (1, "2025-04", 5, "Shirts"), (2, "2025-04", 3, "Shirts"), (3, "2025-04", 1, "Caps"), (1, "2025-05", 7, "Shirts"),
+        ]:
+            CustomerPromotion.objects.create(
+                month=month, title="t", item_id=f"i{variant_id}", product_id=1, variant_id=variant_id,
+                clicks=clicks, impressions=100, cost=Decimal("10"), conv_value=Decimal("25"),
+                category_1st_level="Apparel", category_2nd_level=category,
+            )
+
+        apps = self.migrate_forward()
+        Rollup = apps.get_model("customer", "PromotionCategoryRollup")
+        rollups = {(r.month, r.level, r.category_2nd_level): r for r in Rollup.objects.all()}
+        self.assertEqual(rollups[("2025-04", 0, None)].clicks, 9)
+        self.assertEqual(rollups[("2025-04", 0, None)].roas, 2.5)
+        self.assertEqual(rollups[("2025-04", 2, "Shirts")].products, 2)
+        self.assertEqual(rollups[("2025-04", 2, "Caps")].spend, Decimal("10"))
+        self.assertEqual(rollups[("2025-05", 1, None)].clicks, 7)
+        # April: month total, Apparel, then Shirts and Caps on levels 2-5; May: one row per level
+        self.assertEqual(len(rollups), 16)
+
+
+class FoldMonthlyPromotionsMigrationTests(MigrationTestCase):
+    migrate_from = "0003_alter_productvariant_created_at"
+    migrate_to = "0004_customerpromotion"
+
+    def _row(self, model_name, variant_id, **fields):
+        model = self.old_apps.get_model("customer", model_name)
+        return model(title=f"Item {variant_id}", item_id=f"shopify_IN_1_{variant_id}", product_id=1, variant_id=variant_id, **fields)
+
+    def test_monthly_tables_are_folded_into_one(self):
+        April = self.old_apps.get_model("customer", "CustomerPromotion_April")
+        May = self.old_apps.get_model("customer", "CustomerPromotion_May")
+        June = self.old_apps.get_model("customer", "CustomerPromotion_June")
+        April.objects.bulk_create([
+            self._row("CustomerPromotion_April", 21, price="₹1,299.00", clicks=5, cost=Decimal("10.00")),
+            self._row("CustomerPromotion_April", 22, price="--", clicks=1, category_1st_level="Apparel"),
+            # Listed again later in the same report: the later row wins
+            self._row("CustomerPromotion_April", 21, price="₹1,199.00", clicks=8, cost=Decimal("12.00")),
+        ])
+        May.objects.create(title="Item 21", item_id="x", product_id=1, variant_id=21, clicks=3, ctr=Decimal("1.25"))
+        June.objects.create(
+            title="Item 21", item_id="x", product_id=1, variant_id=21, clicks=2, ctr="12.5%", conv_rate="",
+            cost_conv=Decimal("4.50"), value_all_conv=Decimal("7.25"), all_conv_rate="3%",
+        )
+
+        CustomerPromotion = self.migrate_forward().get_model("customer", "CustomerPromotion")
+        rows = {(p.variant_id, p.month): p for p in CustomerPromotion.objects.all()}
+        self.assertEqual(sorted(rows), [(21, "2025-04"), (21, "2025-05"), (21, "2025-06"), (22, "2025-04")])
+
+        april = rows[(21, "2025-04")]
+        self.assertEqual((april.clicks, april.cost, april.price), (8, Decimal("12.00"), Decimal("1199.00")))
+        self.assertIsNone(rows[(22, "2025-04")].price)
+        self.assertEqual(rows[(22, "2025-04")].category_1st_level, "Apparel")
+        self.assertEqual(rows[(21, "2025-05")].ctr, Decimal("1.25"))
+
+        june = rows[(21, "2025-06")]
+        self.assertEqual((june.cost_per_conv, june.value_per_all_conv), (Decimal("4.50"), Decimal("7.25")))
+        self.assertEqual((june.ctr, june.conv_rate, june.all_conv_rate), (Decimal("12.5"), None, Decimal("3")))
+
+    def test_duplicate_across_a_batch_boundary_keeps_the_latest(self):
+        April = self.old_apps.get_model("customer", "CustomerPromotion_April")
+        rows = [self._row("CustomerPromotion_April", variant_id, clicks=1) for variant_id in range(1, 2001)]
+        rows.append(self._row("CustomerPromotion_April", 2000, clicks=9))
+        April.objects.bulk_create(rows)
+
+        CustomerPromotion = self.migrate_forward().get_model("customer", "CustomerPromotion")
+        self.assertEqual(CustomerPromotion.objects.count(), 2000)
+        self.assertEqual(CustomerPromotion.objects.get(variant_id=2000).clicks, 9)
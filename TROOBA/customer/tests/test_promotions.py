@@ -0,0 +1,129 @@
+import io
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+
+from customer.models import CustomerPromotion, PromotionCategoryRollup
+from customer.promotions import (
+    import_promotion_report, normalize_numeric_column, parse_item_ids, promotion_summaries, promotions_version,
+)
+
+REPORT = """Products report
+1 April 2025 - 30 April 2025
+Item ID,Title,Product ID,Variant ID,Clicks,Cost,Impr.,CTR,Category (1st level),Category (2nd level)
+shopify_IN_11_21,Shirt,,,5,"₹1,299.50","1,000",0.50%,Apparel,Shirts
+shopify_IN_11_22,Shirt XL,,,3,--,200,1.50%,Apparel,Shirts
+shopify_IN_12_23,Cap,,,1,10,100,1.00%,Apparel,Caps
+Total: account,,,,9,1309.50,1300,,,
+"""
+
+
+def _import(text, month="2025-04"):
+    return import_promotion_report(io.StringIO(text), month)
+
+
+class ReportParsingTests(TestCase):
+    def test_numeric_columns_drop_symbols_and_separators(self):
+        self.assertEqual(
+            normalize_numeric_column(["₹1,299.50", "12.5%", "--", "", None, "₹1,299.50"]),
+            [Decimal("1299.50"), Decimal("12.5"), None, None, None, Decimal("1299.50")],
+        )
+        self.assertEqual(normalize_numeric_column(["1,000", "7.0"], as_int=True), [1000, 7])
+
+    def test_item_ids(self):
+        self.assertEqual(parse_item_ids("shopify_IN_8123456_4456789"), (8123456, 4456789))
+        self.assertEqual(parse_item_ids("manual-entry"), (None, None))
+
+
+class ImportPromotionReportTests(TestCase):
+    def test_imports_rows_and_skips_the_footer(self):
+        self.assertEqual(_import(REPORT), (3, 0))
+        shirt = CustomerPromotion.objects.get(variant_id=21, month="2025-04")
+        self.assertEqual((shirt.product_id, shirt.clicks, shirt.cost, shirt.impressions), (11, 5, Decimal("1299.50"), 1000))
+        # "--" in a NOT NULL column becomes 0
+        self.assertEqual(CustomerPromotion.objects.get(variant_id=22).cost, Decimal("0"))
+
+    def test_reimport_updates_in_place(self):
+        _import(REPORT)
+        _import(REPORT.replace("Shirt,,,5,", "Shirt,,,8,"))
+        self.assertEqual(CustomerPromotion.objects.filter(month="2025-04").count(), 3)
+        self.assertEqual(CustomerPromotion.objects.get(variant_id=21).clicks, 8)
+
+    def test_variant_listed_twice_keeps_the_last_row(self):
+        report = REPORT.replace("Total: account", "shopify_IN_11_21,Shirt again,,,7,1,1,,,\nTotal: account")
+        self.assertEqual(_import(report), (3, 0))
+        self.assertEqual(CustomerPromotion.objects.get(variant_id=21).title, "Shirt again")
+
+    def test_rows_with_bad_ids_are_skipped_not_fatal(self):
+        report = REPORT.replace("Total: account", "shopify_IN_13_24,Bag,,N/A,1,1,1,,,\nno-ids-here,Belt,,,1,1,1,,,\nTotal: account")
+        with self.assertLogs("customer.promotions", "WARNING"):
+            self.assertEqual(_import(report), (3, 2))
+        self.assertFalse(CustomerPromotion.objects.filter(variant_id=24).exists())
+
+    def test_explicit_id_columns_override_the_item_id(self):
+        report = REPORT.replace("shopify_IN_12_23,Cap,,,", "custom-cap,Cap,12,99,")
+        _import(report)
+        self.assertTrue(CustomerPromotion.objects.filter(variant_id=99, product_id=12).exists())
+
+    def test_rollups_fold_categories_per_level(self):
+        _import(REPORT)
+        rollups = {
+            (r.level, r.category_1st_level, r.category_2nd_level): r
+            for r in PromotionCategoryRollup.objects.filter(month="2025-04")
+        }
+        self.assertEqual(rollups[(0, None, None)].products, 3)
+        self.assertEqual(rollups[(0, None, None)].clicks, 9)
+        self.assertEqual(rollups[(1, "Apparel", None)].impressions, 1300)
+        self.assertEqual(rollups[(2, "Apparel", "Shirts")].products, 2)
+        self.assertEqual(rollups[(2, "Apparel", "Caps")].clicks, 1)
+
+    def test_bad_month_and_missing_header(self):
+        with self.assertRaises(ValueError):
+            _import(REPORT, month="2025-13")
+        with self.assertRaises(ValueError):
+            _import("just,some,columns\n1,2,3\n")
+
+
+class PromotionSummaryTests(TestCase):
+    def test_each_import_bumps_the_version_and_summaries_follow(self):
+        self.assertEqual(promotions_version(), 0)
+        _import(REPORT)
+        first = promotions_version()
+        self.assertEqual(promotion_summaries([21], months=["2025-04"], fields=["clicks"]), {21: {"2025-04": {"clicks": 5}}})
+
+        _import(REPORT.replace("Shirt,,,5,", "Shirt,,,8,"))
+        self.assertGreater(promotions_version(), first)
+        self.assertEqual(promotion_summaries([21], months=["2025-04"], fields=["clicks"]), {21: {"2025-04": {"clicks": 8}}})
+
+    def test_summaries_are_served_from_the_cache(self):
+        _import(REPORT)
+        promotion_summaries([21, 404], months=["2025-04"], fields=["clicks", "cost"])
+        with self.assertNumQueries(2):  # the version and one cache read, no promotion query
+            summaries = promotion_summaries([21, 404], months=["2025-04"], fields=["clicks", "cost"])
+        self.assertEqual(summaries, {21: {"2025-04": {"clicks": 5, "cost": 1299.5}}})
+
+    def test_variants_without_promotions(self):
+        self.assertEqual(promotion_summaries([404], months=["2025-04"], fields=["clicks", "cost"]), {})
+
+
+class RollupViewTests(TestCase):
+    def test_serves_the_requested_level_by_spend(self):
+        _import(REPORT)
+        _import(REPORT.replace("Shirt,,,5,", "Shirt,,,2,"), month="2025-05")
+
+        body = self.client.get(reverse("promotion_category_rollup"), {"level": 2, "month": "2025-04"}).json()
+        self.assertEqual(body["level"], 2)
+        self.assertEqual([row["category"] for row in body["rows"]], ["Apparel > Shirts", "Apparel > Caps"])
+        shirts = body["rows"][0]
+        self.assertEqual((shirts["products"], shirts["clicks"], shirts["spend"]), (2, 8, 1299.5))
+        self.assertEqual(shirts["ctr"], 0.6667)
+
+        totals = self.client.get(reverse("promotion_category_rollup"), {"level": 0}).json()["rows"]
+        self.assertEqual([(row["month"], row["clicks"]) for row in totals], [("2025-04", 9), ("2025-05", 6)])
+
+    def test_bad_level(self):
+        for level in ("x", "6", "-1"):
+            with self.subTest(level=level):
+                response = self.client.get(reverse("promotion_category_rollup"), {"level": level})
+                self.assertEqual(response.status_code, 400)
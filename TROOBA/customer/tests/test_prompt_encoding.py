@@ -0,0 +1,95 @@
+import json
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from customer.forecasting import add_months
+from customer.prompt_encoding import PayloadReport, compact, encode, month_series, month_table
+
+
+def expand_series(series):
+    """month_series output back to {month: value}."""
+    if "start" in series:
+        return {add_months(series["start"], i): v for i, v in enumerate(series["values"])}
+    return dict(zip(series.get("months", []), series.get("values", [])))
+
+
+def expand_table(table):
+    """month_table output back to {month: {field: value}}."""
+    table = dict(table)
+    columns, rows = table.pop("columns", ["month"]), table.pop("rows", [])
+    return {
+        row[0]: {**table, **{f: v for f, v in zip(columns[1:], row[1:]) if v is not None}}
+        for row in rows
+    }
+
+
+class CompactTests(SimpleTestCase):
+    def test_numbers_text_and_empty_fields(self):
+        self.assertEqual(
+            compact({
+                "id": 7, "sku": "00123", "price": "1299.00", "units": "4", "cost": Decimal("10.456"),
+                "ratio": 0.33333, "note": " ", "missing": "None", "tags": [], "flag": False,
+            }),
+            {"sku": "00123", "price": 1299, "units": 4, "cost": 10.46, "ratio": 0.33, "flag": False},
+        )
+
+    def test_nan_and_infinity_become_null(self):
+        self.assertEqual(compact([float("nan"), Decimal("Infinity"), float("-inf"), 1.5]), [None, None, None, 1.5])
+        self.assertEqual(compact({"ctr": float("nan"), "clicks": 3}), {"clicks": 3})
+        json.loads(encode({"values": [float("nan")]}), parse_constant=self.fail)  # valid JSON, no NaN literal
+
+    def test_list_positions_are_kept(self):
+        self.assertEqual(compact([1, None, "", "2.50"]), [1, None, "", 2.5])
+
+
+class MonthEncodingTests(SimpleTestCase):
+    def test_consecutive_months_become_a_start_and_values(self):
+        self.assertEqual(month_series({"2025-01": 3, "2024-12": 1}), {"start": "2024-12", "values": [1, 3]})
+        self.assertEqual(month_series({}), {})
+
+    def test_gaps_are_filled_or_listed(self):
+        by_month = {"2024-11": 1, "2025-01": 3}
+        self.assertEqual(month_series(by_month, fill=0), {"start": "2024-11", "values": [1, 0, 3]})
+        self.assertEqual(month_series(by_month), {"months": ["2024-11", "2025-01"], "values": [1, 3]})
+
+    def test_table_states_constant_fields_once(self):
+        table = month_table({
+            "2025-05": {"clicks": 4, "category": "Shirts", "cost": Decimal("2.50")},
+            "2025-04": {"clicks": 2, "category": "Shirts", "cost": Decimal("2.50")},
+        })
+        self.assertEqual(table, {
+            "category": "Shirts", "cost": 2.5,
+            "columns": ["month", "clicks"], "rows": [["2025-04", 2], ["2025-05", 4]],
+        })
+
+    def test_round_trip(self):
+        sales = {"2024-12": 5, "2025-01": 0, "2025-02": 12, "2025-04": 1}
+        self.assertEqual(expand_series(json.loads(encode(month_series(sales)))), sales)
+
+        promos = {
+            "2025-04": {"clicks": 5, "cost": Decimal("1299.50"), "category": "Apparel", "ctr": "0.50"},
+            "2025-05": {"clicks": 3, "cost": Decimal("0"), "category": "Apparel"},
+            "2025-06": {"clicks": 3, "cost": Decimal("12.345"), "category": "Apparel", "ctr": "1.25"},
+        }
+        decoded = expand_table(json.loads(encode(month_table(promos))))
+        expected = {
+            month: {k: float(v) if isinstance(v, (Decimal, str)) and k != "category" else v for k, v in row.items()}
+            for month, row in promos.items()
+        }
+        expected["2025-06"]["cost"] = 12.35  # two decimals kept
+        self.assertEqual(decoded, expected)
+
+
+class PayloadReportTests(SimpleTestCase):
+    def test_reports_the_saving(self):
+        report = PayloadReport("Test")
+        item = {"sku": "A1", "past_sales": [{"month": "2025-01", "value": 1}, {"month": "2025-02", "value": 2}]}
+        verbose = json.dumps(item, indent=2)
+        compact_text = encode({"sku": "A1", "past_sales": month_series({"2025-01": 1, "2025-02": 2})})
+        self.assertEqual(report.add(verbose, compact_text), compact_text)
+        with self.assertLogs("customer.prompt_encoding", "INFO"):
+            stats = report.log()
+        self.assertGreater(stats["verbose_tokens"], stats["compact_tokens"])
+        self.assertGreater(stats["saved_pct"], 0)
+        self.assertEqual(PayloadReport("Empty").as_dict(), {"verbose_tokens": 0, "compact_tokens": 0, "saved_pct": 0.0})
@@ -0,0 +1,36 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from customer import prompt_workflow
+from customer.gemini import FORECAST_GENERATION_CONFIG
+from customer.prompt_workflow import predict_items, stream_item_predictions
+
+ITEMS = [{"sku": "A1", "past_sales": [{"month": "2025-05", "value": 3}], "promo_summary": {}}]
+
+
+def _predictions(entries, build_prompt, api_key, on_error, **kwargs):
+    return {sku: {"sku": sku, "july_predicted": 1} for sku, _ in entries}
+
+
+def _streamed(entries, build_prompt, api_key, on_error, **kwargs):
+    for sku, _ in entries:
+        yield sku, {"sku": sku, "july_predicted": 1}
+
+
+@override_settings(GEMINI_API_KEY="settings-key")
+@mock.patch.object(prompt_workflow, "save_item_predictions")
+class PromptPageForecastTests(SimpleTestCase):
+    def test_batch_forecast_uses_the_key_and_deterministic_config(self, save):
+        with mock.patch.object(prompt_workflow, "predict_in_batches", side_effect=_predictions) as batches:
+            self.assertEqual(predict_items("Forecast well.", ITEMS), [{"sku": "A1", "july_predicted": 1}])
+        self.assertEqual(batches.call_args.args[2], "settings-key")
+        self.assertEqual(batches.call_args.kwargs["generation_config"], FORECAST_GENERATION_CONFIG)
+        save.assert_called_once()
+
+    def test_streamed_forecast_uses_the_key_and_deterministic_config(self, save):
+        with mock.patch.object(prompt_workflow, "stream_predictions", side_effect=_streamed) as stream:
+            self.assertEqual(list(stream_item_predictions("Forecast well.", ITEMS)), [{"sku": "A1", "july_predicted": 1}])
+        self.assertEqual(stream.call_args.args[2], "settings-key")
+        self.assertEqual(stream.call_args.kwargs["generation_config"], FORECAST_GENERATION_CONFIG)
+        save.assert_called_once()
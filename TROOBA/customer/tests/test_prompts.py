@@ -0,0 +1,62 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from customer.models import Prompt
+from customer.prompts import PromptRegistry, PromptTemplate, prompts
+
+LAYOUT = "$prompt\n\nSKU: $sku"
+
+
+class PromptTemplateTests(SimpleTestCase):
+    def test_render_and_partial(self):
+        template = PromptTemplate("Forecast $sku for $month.")
+        self.assertEqual(template.fields, {"sku", "month"})
+        self.assertEqual(template.render(sku="A1", month="July"), "Forecast A1 for July.")
+
+        july = template.partial(month="July")
+        self.assertEqual(july.fields, {"sku"})
+        self.assertEqual(july.render(sku="B2"), "Forecast B2 for July.")
+        self.assertEqual(template.render(sku="A1", month="June"), "Forecast A1 for June.")  # unchanged
+
+    def test_dollar_signs_in_values_are_not_placeholders(self):
+        template = PromptTemplate("$prompt / $sku").partial(prompt="Costs in $USD")
+        self.assertEqual(template.render(sku="$sku"), "Costs in $USD / $sku")
+
+    def test_missing_placeholder_names_it(self):
+        with self.assertRaisesMessage(ValueError, "No value for prompt placeholder(s) $month, $sku"):
+            PromptTemplate("Forecast $sku for $month.").render()
+
+
+class PromptRegistryTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prompt = Prompt.objects.create(type="MainPrompt", prompt="  Be careful.  ")
+
+    def test_saved_prompt_is_picked_up_on_the_next_call(self):
+        self.assertEqual(prompts.template("MainPrompt", LAYOUT, strip=True).render(sku="A1"), "Be careful.\n\nSKU: A1")
+        with self.assertNumQueries(0):  # served from this process until the next version check
+            prompts.template("MainPrompt", LAYOUT, strip=True)
+
+        self.prompt.prompt = "Be bold."
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prompt.save()
+        self.assertEqual(prompts.template("MainPrompt", LAYOUT).render(sku="A1"), "Be bold.\n\nSKU: A1")
+
+    def test_deleted_prompt_is_gone_on_the_next_call(self):
+        self.assertIsNotNone(prompts.template("MainPrompt", LAYOUT))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prompt.delete()
+        self.assertIsNone(prompts.template("MainPrompt", LAYOUT))
+        self.assertIsNone(prompts.text("MainPrompt"))
+
+    @override_settings(PROMPT_REGISTRY_CHECK_SECONDS=60)
+    def test_other_processes_notice_after_the_check_interval(self):
+        other = PromptRegistry()  # another server process
+        self.assertEqual(other.text("MainPrompt"), "  Be careful.  ")
+
+        self.prompt.prompt = "Be bold."
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prompt.save()
+        self.assertEqual(other.text("MainPrompt"), "  Be careful.  ")
+
+        other.checked_at -= 61
+        self.assertEqual(other.text("MainPrompt"), "Be bold.")
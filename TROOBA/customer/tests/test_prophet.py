@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from customer import prophet_backend
+from customer.models import Event, Job, ProphetModel
+from customer.prophet_backend import fit_prophet_models, series_fingerprint, sku_holidays
+from customer.tasks import sync_shopify_task
+
+from .helpers import add_sale, make_variant
+
+FITTED = []
+
+
+def fake_fit(task):
+    FITTED.append(task)
+    return task["variant_id"], "{}", {month: 1 for month in task["target_months"]}, 0.01, None
+
+
+def _sell_daily(variant, first_day, days=15):
+    for offset in range(days):
+        add_sale(variant, first_day + timedelta(days=offset))
+
+
+class FingerprintTests(SimpleTestCase):
+    def test_stable_for_the_same_inputs_and_sensitive_to_each(self):
+        y = np.array([0.0, 2.0, 1.0])
+        base = series_fingerprint(date(2025, 1, 1), y, {"holidays": [("Diwali", "2024-11-01", 0, 0)]})
+        self.assertEqual(series_fingerprint(date(2025, 1, 1), y.copy(), {"holidays": [("Diwali", "2024-11-01", 0, 0)]}), base)
+        self.assertNotEqual(series_fingerprint(date(2025, 1, 2), y, {"holidays": [("Diwali", "2024-11-01", 0, 0)]}), base)
+        self.assertNotEqual(series_fingerprint(date(2025, 1, 1), y + 1, {"holidays": [("Diwali", "2024-11-01", 0, 0)]}), base)
+        self.assertNotEqual(series_fingerprint(date(2025, 1, 1), y, {"holidays": []}), base)
+
+    def test_only_holidays_seen_in_the_history_apply(self):
+        holidays = [
+            ("Diwali", "2023-11-12", 0, 0), ("Diwali", "2024-11-01", 0, 0), ("Diwali", "2025-10-20", 0, 0),
+            ("Launch sale", "2025-09-01", 0, 2),
+            ("Holi", "2024-03-25", 0, 0),
+        ]
+        self.assertEqual(
+            sku_holidays(holidays, date(2024, 6, 1), date(2025, 7, 1)),
+            [("Diwali", "2024-11-01", 0, 0), ("Diwali", "2025-10-20", 0, 0)],
+        )
+
+
+@mock.patch.object(prophet_backend, "PROPHET_AVAILABLE", True)
+@mock.patch.object(prophet_backend, "ProcessPoolExecutor", ThreadPoolExecutor)
+@mock.patch.object(prophet_backend, "fit_series", fake_fit)
+@mock.patch.object(prophet_backend.connections, "close_all", lambda: None)
+@mock.patch.object(prophet_backend, "holidays_lib", None)
+class FitProphetModelsTests(TestCase):
+    def setUp(self):
+        FITTED.clear()
+        self.old = make_variant("OLD")
+        _sell_daily(self.old, date(2024, 1, 10))
+        self.new = make_variant("NEW")
+        _sell_daily(self.new, date(2025, 3, 1))
+        self.short = make_variant("SHORT")
+        _sell_daily(self.short, date(2025, 3, 1), days=3)
+
+    def test_fits_then_skips_unchanged_skus(self):
+        self.assertEqual(fit_prophet_models(), {"fitted": 2, "unchanged": 0, "too_short": 1, "failed": 0})
+        self.assertEqual(set(ProphetModel.objects.values_list("variant_id", flat=True)), {self.old.id, self.new.id})
+        # Each series starts at the SKU's first sale
+        self.assertEqual({t["variant_id"]: t["start"] for t in FITTED}, {self.old.id: "2024-01-10", self.new.id: "2025-03-01"})
+
+        FITTED.clear()
+        self.assertEqual(fit_prophet_models(), {"fitted": 0, "unchanged": 2, "too_short": 1, "failed": 0})
+        self.assertEqual(FITTED, [])
+
+    def test_refits_only_the_sku_whose_sales_changed(self):
+        fit_prophet_models()
+        FITTED.clear()
+        add_sale(self.new, date(2025, 5, 5), quantity=4)
+        self.assertEqual(fit_prophet_models()["fitted"], 1)
+        self.assertEqual([t["variant_id"] for t in FITTED], [self.new.id])
+
+    def test_event_refits_only_skus_whose_history_it_falls_in(self):
+        fit_prophet_models()
+        FITTED.clear()
+        Event.objects.create(name="Warehouse sale", start_date=date(2024, 6, 1), end_date=date(2024, 6, 3))
+        self.assertEqual(fit_prophet_models()["fitted"], 1)
+        self.assertEqual([t["variant_id"] for t in FITTED], [self.old.id])
+        self.assertEqual(FITTED[0]["holidays"], [("Warehouse sale", "2024-06-01", 0, 2)])
+
+    def test_force_and_variant_filter(self):
+        fit_prophet_models()
+        FITTED.clear()
+        self.assertEqual(fit_prophet_models(variant_ids=[self.old.id], force=True)["fitted"], 1)
+        self.assertEqual([t["variant_id"] for t in FITTED], [self.old.id])
+
+
+class SyncRefitTests(TestCase):
+    @mock.patch("customer.tasks.PROPHET_AVAILABLE", True)
+    @mock.patch("customer.tasks.sync_shopify_data")
+    def test_sync_queues_a_refit_of_the_changed_variants(self, sync):
+        sync.return_value = {"changed_variant_ids": [1, 2]}
+        job = Job.objects.get(id=sync_shopify_task(lambda *args: None)["prophet_job_id"])
+        self.assertEqual((job.kind, job.params), ("fit_prophet_models", {"variant_ids": [1, 2]}))
+
+        sync.return_value = {"changed_variant_ids": []}
+        self.assertNotIn("prophet_job_id", sync_shopify_task(lambda *args: None))
@@ -0,0 +1,79 @@
+import json
+from datetime import date, timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from customer import views
+
+from .helpers import add_sale, make_variant
+
+
+def _ndjson(response):
+    return [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+
+class SkuSalesHistoryTests(TestCase):
+    def setUp(self):
+        self.variant = make_variant("SKU-A", price=5.0)
+        self.days = [date(2023, 1, 1) + timedelta(days=3 * i) for i in range(10)]
+        for i, day in enumerate(self.days):
+            add_sale(self.variant, day, quantity=i + 1)
+            if i % 2:
+                add_sale(self.variant, day, quantity=1)  # second order the same day is summed
+        add_sale(self.variant, date(2024, 2, 1), quantity=99)  # after the cutoff
+
+    def test_pages_follow_the_cursor_without_gaps_or_repeats(self):
+        url = reverse("sku_sales_history", args=["SKU-A"])
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(url, {"limit": 3, **({"cursor": cursor} if cursor else {})})
+            body = response.json()
+            seen += [row["date"] for row in body["history"]]
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [day.isoformat() for day in self.days])
+
+    def test_stream_is_the_same_across_chunk_boundaries(self):
+        url = reverse("sku_sales_history", args=["SKU-A"])
+        with mock.patch.object(views, "SKU_HISTORY_CHUNK_SIZE", 1000):
+            whole = _ndjson(self.client.get(url, {"format": "ndjson"}))
+        with mock.patch.object(views, "SKU_HISTORY_CHUNK_SIZE", 3):
+            chunked = _ndjson(self.client.get(url, {"format": "ndjson"}))
+        self.assertEqual(chunked, whole)
+        self.assertEqual(len(whole), len(self.days))
+        self.assertEqual(whole[1], {"date": self.days[1].isoformat(), "quantity": 3, "total_amount": 15.0})
+
+    def test_stream_starts_after_the_cursor(self):
+        url = reverse("sku_sales_history", args=["SKU-A"])
+        with mock.patch.object(views, "SKU_HISTORY_CHUNK_SIZE", 2):
+            rows = _ndjson(self.client.get(url, {"format": "ndjson", "cursor": self.days[6].isoformat()}))
+        self.assertEqual([row["date"] for row in rows], [day.isoformat() for day in self.days[7:]])
+
+    def test_unknown_sku_and_bad_cursor(self):
+        self.assertEqual(self.client.get(reverse("sku_sales_history", args=["NOPE"])).status_code, 404)
+        response = self.client.get(reverse("sku_sales_history", args=["SKU-A"]), {"cursor": "soon"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportSalesHistoryTests(TestCase):
+    def test_export_walks_every_sku_in_keyset_chunks(self):
+        for sku in ("B", "A", "C"):
+            variant = make_variant(sku)
+            for day in (date(2023, 5, 1), date(2023, 5, 2), date(2023, 6, 9)):
+                add_sale(variant, day, quantity=2)
+        with mock.patch.object(views, "SKU_HISTORY_CHUNK_SIZE", 2):
+            rows = _ndjson(self.client.get(reverse("export_sku_sales_history")))
+        self.assertEqual(
+            [(row["sku"], row["date"]) for row in rows],
+            [(sku, day) for sku in "ABC" for day in ("2023-05-01", "2023-05-02", "2023-06-09")],
+        )
+
+    def test_csv_export(self):
+        add_sale(make_variant("A"), date(2023, 5, 1), quantity=2, price=1.5)
+        response = self.client.get(reverse("export_sku_sales_history"), {"format": "csv"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ["sku,date,quantity,total_amount", "A,2023-05-01,2,3.0"])
+        self.assertIn("sku_sales_history.csv", response["Content-Disposition"])
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from customer.single_flight import _lock_key, single_flight
+
+LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "single-flight-tests"}}
+
+
+def _run_together(count, fn):
+    results, barrier = [None] * count, threading.Barrier(count)
+
+    def run(i):
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# The lock protocol is the same on any shared cache; locmem keeps the threads off the test database
+@override_settings(CACHES=LOCMEM, SINGLE_FLIGHT_WAIT_SECONDS=5)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_callers_share_one_computation(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.3)
+            return {"answer": 42}
+
+        results = _run_together(6, lambda: single_flight("k", compute))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"answer": 42}] * 6)
+        self.assertIsNone(cache.get(_lock_key("k")))
+
+    def test_later_callers_compute_again(self):
+        values = iter([1, 2])
+        self.assertEqual(single_flight("k", lambda: next(values)), 1)
+        self.assertEqual(single_flight("k", lambda: next(values)), 2)
+
+    def test_a_failed_leader_hands_over_to_a_waiter(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            if len(calls) == 1:
+                raise RuntimeError("leader failed")
+            return "ok"
+
+        def call():
+            try:
+                return single_flight("k", compute)
+            except RuntimeError as e:
+                return str(e)
+
+        results = _run_together(3, call)
+        self.assertEqual(sorted(results), ["leader failed", "ok", "ok"])
+        self.assertEqual(len(calls), 2)
+
+    @override_settings(SINGLE_FLIGHT_WAIT_SECONDS=0.3)
+    def test_waiters_give_up_on_a_slow_leader(self):
+        cache.set(_lock_key("k"), "someone-else", 60)
+        started = time.monotonic()
+        with self.assertLogs("customer.single_flight", "WARNING"):
+            self.assertEqual(single_flight("k", lambda: "mine"), "mine")
+        self.assertLess(time.monotonic() - started, 2)
@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.test import TestCase
+from django.urls import reverse
+
+from customer.features import refresh_sku_features
+
+from .helpers import add_sale, make_variant
+
+
+class SkuApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Equal sales for some SKUs, so pages must break ties on variant_id
+        for i, quantity in enumerate([5, 9, 5, 1, 9, 5, 3]):
+            add_sale(make_variant(f"SKU{i}", price=10 + i), date(2025, 5, 1), quantity=quantity)
+        refresh_sku_features()
+
+    def _walk(self, **params):
+        items, cursor = [], None
+        while True:
+            query = dict(params, **({"cursor": cursor} if cursor else {}))
+            body = self.client.get(reverse("sku_api"), query).json()
+            items += body["items"]
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return items
+
+    def test_pages_cover_the_ranking_once_in_order(self):
+        whole = self.client.get(reverse("sku_api"), {"section": "sales", "limit": 100}).json()["items"]
+        paged = self._walk(section="sales", limit=2)
+        self.assertEqual(paged, whole)
+        self.assertEqual([row["rank"] for row in paged], list(range(1, 8)))
+        self.assertEqual([row["sales_12m"] for row in paged], [9, 9, 5, 5, 5, 3, 1])
+
+    def test_any_sort_column_and_direction(self):
+        for sort in ("price", "-price", "sku", "sales_last_30_days"):
+            with self.subTest(sort=sort):
+                rows = self._walk(sort=sort, limit=3, section="catalog")
+                keys = [(row[sort.lstrip("-")], row["variant_id"]) for row in rows]
+                self.assertEqual(len(rows), 7)
+                if sort.startswith("-"):
+                    self.assertEqual([k[0] for k in keys], sorted((k[0] for k in keys), reverse=True))
+                else:
+                    self.assertEqual(keys, sorted(keys))
+
+    def test_sections_select_their_fields(self):
+        row = self.client.get(reverse("sku_api"), {"section": "promo", "limit": 1}).json()["items"][0]
+        self.assertEqual(set(row), {"rank", "variant_id", "sales_12m", "sku", "product_title", "promo_summary"})
+
+    def test_bad_parameters(self):
+        for params in ({"section": "secrets"}, {"sort": "password"}, {"limit": "0"}, {"limit": "x"}, {"cursor": "%%%"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse("sku_api"), params).status_code, 400)
@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from customer.features import refresh_sku_features
+from customer.models import ItemSnapshot, Job
+from customer.snapshots import (
+    PURGE_KEY, load_snapshot, purge_expired_snapshots, save_snapshot, versioned_snapshot_id,
+)
+
+from .helpers import add_sale, make_variant
+
+ITEMS = [{"sku": "A", "past_sales": [{"month": "2025-06", "value": 3}]}, {"sku": "B", "price": 9.5}]
+
+
+@override_settings(ITEM_SNAPSHOT_TTL_SECONDS=3600)
+class SnapshotTests(TestCase):
+    def setUp(self):
+        caches["fragments"].clear()
+
+    def test_round_trip_and_identical_sets_share_a_row(self):
+        snapshot = save_snapshot(ITEMS)
+        self.assertEqual(load_snapshot(snapshot.id), ITEMS)
+        self.assertEqual(save_snapshot([dict(item) for item in ITEMS]).id, snapshot.id)
+        self.assertEqual(ItemSnapshot.objects.count(), 1)
+
+    def test_missing_expired_and_malformed_ids(self):
+        snapshot = save_snapshot(ITEMS)
+        ItemSnapshot.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        for snapshot_id in (snapshot.id, None, "", "not-a-uuid"):
+            with self.subTest(snapshot_id=snapshot_id):
+                self.assertIsNone(load_snapshot(snapshot_id))
+
+    def test_reading_late_in_its_life_extends_a_snapshot(self):
+        snapshot = save_snapshot(ITEMS)
+        ItemSnapshot.objects.update(expires_at=timezone.now() + timedelta(minutes=10))
+        load_snapshot(snapshot.id)
+        snapshot.refresh_from_db()
+        self.assertGreater(snapshot.expires_at, timezone.now() + timedelta(minutes=55))
+
+    def test_purge_deletes_only_expired_snapshots_and_is_scheduled_once(self):
+        save_snapshot(ITEMS)
+        old = save_snapshot([{"sku": "old"}])
+        ItemSnapshot.objects.filter(id=old.id).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purge_expired_snapshots(), 1)
+        self.assertEqual(ItemSnapshot.objects.count(), 1)
+        self.assertEqual(Job.objects.filter(kind="purge_item_snapshots").count(), 1)
+        self.assertIsNotNone(caches["default"].get(PURGE_KEY))
+
+    def test_versioned_snapshot_is_reused_until_the_version_changes(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return ITEMS
+
+        first = versioned_snapshot_id("v1", build)
+        with self.assertNumQueries(0):
+            self.assertEqual(versioned_snapshot_id("v1", build), first)
+        self.assertEqual(len(builds), 1)
+        versioned_snapshot_id("v2", lambda: ITEMS + [{"sku": "C"}])
+        self.assertEqual(ItemSnapshot.objects.count(), 2)
+
+
+class TopItemsSnapshotTests(TestCase):
+    def setUp(self):
+        caches["fragments"].clear()
+        for sku, quantity in (("TEE", 5), ("CAP", 2)):
+            add_sale(make_variant(sku), date(2025, 6, 1), quantity=quantity)
+        refresh_sku_features()
+
+    def test_reloads_reuse_the_snapshot_until_features_change(self):
+        first = self.client.get(reverse("fetching_items")).context["snapshot_id"]
+        self.assertEqual(self.client.get(reverse("fetching_items")).context["snapshot_id"], first)
+        self.assertEqual([item["sku"] for item in load_snapshot(first)], ["TEE", "CAP"])
+
+        add_sale(make_variant("BAG"), date(2025, 6, 2), quantity=9)
+        refresh_sku_features()
+        second = self.client.get(reverse("fetching_items")).context["snapshot_id"]
+        self.assertNotEqual(second, first)
+        self.assertEqual([item["sku"] for item in load_snapshot(second)], ["BAG", "TEE", "CAP"])
+
+    def test_prompt_form_posts_the_snapshot_id(self):
+        snapshot_id = self.client.get(reverse("fetching_items")).context["snapshot_id"]
+        with self.assertLogs("customer.views", "DEBUG") as logs:
+            self.client.post(reverse("handle_prompt"), {"action": "save", "prompt_text": "p", "snapshot": snapshot_id})
+        self.assertEqual(self.client.session["snapshot_id"], str(snapshot_id))
+        self.assertIn(str(snapshot_id), logs.output[0])
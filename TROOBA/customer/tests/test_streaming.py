@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from customer import gemini
+from customer.gemini import iter_json_objects, stream_predictions
+
+
+def _pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class IterJsonObjectsTests(SimpleTestCase):
+    ROWS = [
+        {"sku": "A", "reason": 'braces } and { inside "quotes"', "july_predicted": 3},
+        {"sku": "B", "nested": {"x": [1, {"y": 2}]}, "reason": "back\\slash"},
+    ]
+
+    def test_objects_split_across_any_chunk_boundary(self):
+        text = "```json\n" + json.dumps(self.ROWS, indent=2) + "\n```"
+        for size in (1, 2, 3, 7, 64, len(text)):
+            with self.subTest(chunk_size=size):
+                self.assertEqual(list(iter_json_objects(_pieces(text, size))), self.ROWS)
+
+    def test_each_object_is_yielded_before_the_stream_ends(self):
+        def chunks():
+            yield '[{"sku": "A"}, {"sk'
+            raise AssertionError("read past the first complete object")
+
+        self.assertEqual(next(iter_json_objects(chunks())), {"sku": "A"})
+
+    def test_unparseable_objects_are_skipped(self):
+        with self.assertLogs("customer.gemini", "WARNING"):
+            rows = list(iter_json_objects(['[{"sku": "A"}, {"sku": B}, {"sku": "C"}]']))
+        self.assertEqual(rows, [{"sku": "A"}, {"sku": "C"}])
+
+
+def _answer(prompt):
+    return json.dumps([{"sku": sku, "july_predicted": 1} for sku in json.loads(prompt)])
+
+
+@override_settings(GEMINI_MAX_CONCURRENCY=2, GEMINI_BATCH_MAX_ITEMS=2)
+class StreamPredictionsTests(SimpleTestCase):
+    def _stream(self, fake_stream, entries, fake_call=None):
+        with mock.patch.object(gemini, "stream_gemini", side_effect=fake_stream), \
+                mock.patch.object(gemini, "call_gemini", side_effect=fake_call or (lambda prompt, *a: _answer(prompt))) as call:
+            rows = dict(stream_predictions(entries, json.dumps, "key", on_error=lambda sku, e: {"sku": sku, "error": str(e)}))
+        return rows, call
+
+    def test_every_sku_arrives_once(self):
+        entries = [(f"S{i}", f"S{i}") for i in range(5)]
+        def chunked(prompt, *args):
+            yield from _pieces(_answer(prompt), 5)
+
+        rows, call = self._stream(chunked, entries)
+        self.assertEqual(sorted(rows), [sku for sku, _ in entries])
+        self.assertFalse(call.called)
+
+    def test_skus_missing_from_the_stream_are_retried(self):
+        entries = [("A", "A"), ("B", "B")]
+
+        def partial(prompt, *args):
+            yield json.dumps([{"sku": "A"}])
+
+        rows, call = self._stream(partial, entries)
+        self.assertEqual(rows, {"A": {"sku": "A"}, "B": {"sku": "B", "july_predicted": 1}})
+        self.assertEqual(call.call_count, 1)
+
+    def test_closing_the_generator_stops_the_remaining_batches(self):
+        started = []
+        entries = [(f"S{i}", f"S{i}") for i in range(20)]
+
+        def slow_stream(prompt, *args):
+            started.append(prompt)
+            for sku in json.loads(prompt):
+                time.sleep(0.05)
+                yield json.dumps({"sku": sku})
+
+        with mock.patch.object(gemini, "stream_gemini", side_effect=slow_stream), \
+                mock.patch.object(gemini, "call_gemini") as call:
+            stream = stream_predictions(entries, json.dumps, "key", on_error=lambda sku, e: {})
+            next(stream)
+            stream.close()
+            deadline = time.monotonic() + 5
+            while any(t.name == "gemini-stream" for t in threading.enumerate()) and time.monotonic() < deadline:
+                time.sleep(0.02)
+        self.assertFalse(any(t.name == "gemini-stream" for t in threading.enumerate()))
+        self.assertLess(len(started), 10)  # of 10 batches, only those already streaming ran
+        self.assertFalse(call.called)  # and nothing retried what the cancelled batches left out
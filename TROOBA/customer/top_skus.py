@@ -0,0 +1,225 @@
+import json
+import logging
+from datetime import datetime
+
+from django.conf import settings
+
+from .features import sales_by_month, top_features
+from .forecast_runs import save_forecast_run
+from .forecasting import DEFAULT_METHOD, forecast_catalog, month_keys
+from .gemini import FORECAST_GENERATION_CONFIG, estimate_tokens, predict_in_batches
+from .prompt_encoding import PayloadReport, encode, month_series, month_table
+from .prompts import prompts
+from .prophet_backend import stored_forecasts
+
+logger = logging.getLogger(__name__)
+
+
+def top_sku_context():
+    """Top-selling SKUs (Jul 2024–Jun 2025) with monthly history, July actuals and promotion summaries.
+
+    Everything comes from the SKU feature store in one query.
+    """
+    features = top_features(limit=10)
+    variant_objs = [f.variant for f in features]
+    sku_to_variant = {f.sku: f.variant for f in features}
+    variant_skus = [f.sku for f in features]
+
+    return {
+        "variant_objs": variant_objs,
+        "variant_id_map": {v.id: v for v in variant_objs},
+        "variant_skus": variant_skus,
+        "sku_to_variant": sku_to_variant,
+        "display_skus": variant_skus,
+        "monthly_sales": {f.sku: sales_by_month(f) for f in features},
+        "actual_july_sales": {f.sku: f.reference_month_sales for f in features},
+        "promo_data_by_sku": {f.sku: f.promo_summary for f in features},
+    }
+
+
+def baseline_july_forecasts(variant_ids):
+    """{sku: (July units, method)} from the local forecasters.
+
+    Fitted Prophet models win over exponential smoothing when manage.py fit_prophet_models has run.
+    """
+    baseline_july = {
+        sku: (by_month.get("2025-07", 0), DEFAULT_METHOD.replace('_', ' '))
+        for sku, by_month in forecast_catalog(horizon=1, variant_ids=variant_ids).items()
+    }
+    for sku, by_month in stored_forecasts(variant_ids).items():
+        if "2025-07" in by_month:
+            baseline_july[sku] = (by_month["2025-07"], "prophet")
+    return baseline_july
+
+
+def baseline_response(baseline_july, sku, note):
+    units, method = baseline_july.get(sku, (0, DEFAULT_METHOD.replace('_', ' ')))
+    return {
+        "Predicted July Sales": units,
+        "reason": f"Statistical baseline ({method}), {note}",
+    }
+
+
+# Multi-SKU forecast request; $prompt is the stored MainPrompt
+TOP_SKUS_PROMPT_LAYOUT = """$prompt
+
+Q: Based on the data below and market patterns, provide a demand forecast for EACH of the following $count SKUs.
+
+Your output should include, per SKU:
+- Daily sales forecasts for 7, 14, and 30 days
+- Predicted total units for July 2025
+- A confidence score
+- A clear reasoning summary
+
+Output Format (strict JSON array only, one object per SKU — no markdown, no comments):
+
+[
+  {
+    "sku": string,
+    "confidence_score": float,
+    "reason": string,
+    "Predicted July Sales": int
+  }
+]
+
+Guidelines:
+- Use promotional signals, past sales, and seasonality to generate forecasts.
+- Avoid defaulting to 30 unless data shows strong evidence of consistent 1-unit/day demand.
+- Provide a conservative but diverse forecast when data is limited.
+- Forecast each SKU from its own data only.
+
+IMPORTANT:
+- Output must be a valid JSON array only. No extra text.
+
+$sku_data
+"""
+
+
+def gemini_setup():
+    """(api_key, compiled MainPrompt template, error); error says why Gemini can't be used."""
+    api_key = settings.GEMINI_API_KEY
+    if not api_key:
+        return None, None, "GEMINI_API_KEY missing"
+    prompt_template = prompts.template("MainPrompt", TOP_SKUS_PROMPT_LAYOUT, strip=True)
+    if prompt_template is None:
+        return api_key, None, "Prompt with type=MainPrompt not found"
+    return api_key, prompt_template, None
+
+
+def forecast_top_skus(progress=None):
+    """Gemini July forecast for the top SKUs, saved as a "gemini" ForecastRun. Runs as a background job."""
+    progress = progress or (lambda fraction, message="": None)
+
+    # Step 1: sales history, promotions and the local baseline for fallbacks
+    progress(0.05, "Loading sales history")
+    ctx = top_sku_context()
+    sku_to_variant = ctx["sku_to_variant"]
+    monthly_sales = ctx["monthly_sales"]
+    promo_data_by_sku = ctx["promo_data_by_sku"]
+    variant_skus = ctx["variant_skus"]
+    baseline_july = baseline_july_forecasts(list(ctx["variant_id_map"]))
+
+    GEMINI_API_KEY, prompt_template, gemini_error = gemini_setup()
+    if gemini_error:
+        raise RuntimeError(gemini_error)
+
+    # Step 2: prompts
+    progress(0.2, "Building prompts")
+    # One data block per SKU; blocks are packed into as few Gemini requests as the token budget allows
+    payload = PayloadReport("Top SKUs")
+    history_months = month_keys(datetime(2024, 7, 1), datetime(2025, 7, 1))
+    sku_blocks = []
+    for sku in variant_skus:
+        variant = sku_to_variant.get(sku)
+        if not variant:
+            continue
+        product = variant.product
+        sales_data = monthly_sales.get(sku, {})
+        promo_data = promo_data_by_sku.get(sku, {})
+        # Compact tables instead of indented JSON; the report compares both
+        sales_text = payload.add(
+            json.dumps(sales_data, indent=2), encode(month_series({m: sales_data.get(m, 0) for m in history_months}))
+        )
+        promo_text = payload.add(json.dumps(promo_data, indent=2), encode(month_table(promo_data)))
+
+        sku_blocks.append((sku, f"""### PRODUCT DETAILS
+Title: {product.title}
+SKU: {sku}
+Type: {product.product_type}
+Vendor: {product.vendor}
+
+### HISTORICAL SALES (Jul 2024–Jun 2025, units per month)
+{sales_text}
+
+### PROMOTION SUMMARY (Apr–Jun 2025)
+{promo_text}
+"""))
+    payload_stats = payload.log()
+
+    def build_prompt(blocks):
+        return prompt_template.render(count=len(blocks), sku_data="\n---\n\n".join(blocks))
+
+    # Step 3: Gemini, with per-SKU fallback to the baseline
+    progress(0.3, f"Forecasting {len(sku_blocks)} SKUs with Gemini "
+                  f"(data ~{payload_stats['compact_tokens']} tokens, {payload_stats['saved_pct']}% smaller)")
+    responses = predict_in_batches(
+        sku_blocks,
+        build_prompt,
+        GEMINI_API_KEY,
+        on_error=lambda sku, e: baseline_response(baseline_july, sku, f"Gemini unavailable: {e}"),
+        generation_config=FORECAST_GENERATION_CONFIG,
+        overhead_tokens=estimate_tokens(build_prompt([])),
+    )
+    predictions = july_prediction_rows(
+        [sku for sku, _ in sku_blocks], sku_to_variant, monthly_sales, ctx["actual_july_sales"], responses
+    )
+
+    # Step 4: store; per-SKU fallbacks are stored too (their reason says so), ?refresh=1 retries them
+    progress(0.9, "Saving forecast run")
+    return save_forecast_run("gemini", [
+        {
+            "variant_id": sku_to_variant[p["SKU"]].id,
+            "product_id": sku_to_variant[p["SKU"]].product_id,
+            "month": "2025-07",
+            "predicted_sales": p["Predicted July Sales"],
+            "reason": p["Reason"],
+        }
+        for p in predictions
+    ])
+
+
+def july_prediction_rows(skus, sku_to_variant, monthly_sales, actual_july_sales, responses):
+    """Rows for predictions.html from per-SKU Gemini-style responses."""
+    predictions = []
+    for sku in skus:
+        product = sku_to_variant[sku].product
+        sales_data = monthly_sales.get(sku, {})
+        actual_qty = actual_july_sales.get(sku, 0)
+        response_data = responses.get(sku) or {}
+
+        try:
+            predicted_qty_raw = response_data.get("Predicted July Sales") or \
+                (response_data.get("forecast") or {}).get("predicted_july_total", 0)
+            predicted_qty = int(float(predicted_qty_raw))
+            reason = response_data.get("reason", "N/A")
+        except Exception as e:
+            predicted_qty = 0
+            reason = f"Parsing error: {str(e)}"
+            logger.error(f"Parsing failed for SKU {sku}. Gemini response:\n{response_data}")
+
+        predictions.append({
+            "SKU": sku,
+            "Product": product.title,
+            "Past Sales": {
+                month: sales_data.get(month, 0) for month in [
+                    "2024-07", "2024-08", "2024-09", "2024-10", "2024-11", "2024-12",
+                    "2025-01", "2025-02", "2025-03", "2025-04", "2025-05", "2025-06"
+                ]
+            },
+            "Predicted July Sales": predicted_qty,
+            "Actual July Sales": actual_qty,
+            "Reason": reason,
+        })
+    return predictions
+
+
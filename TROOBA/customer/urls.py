@@ -1,8 +1,10 @@
 from django.urls import path
 from .views import fetch_and_store_all ,  top_20_selling_products_till_2024_view 
 # ,top_20_selling_products_2024_onward_view
-from .views import compare_sku_prediction_view,sku_sales_history 
+from .views import compare_sku_prediction_view,sku_sales_history,export_sku_sales_history
 from .views import Fetching_items,generate_prompt_view,Fetching_items,handle_prompt
+from .views import promotion_category_rollup_view, baseline_forecast_view
+from .views import job_status_view, job_wait_view, stream_predictions_view, sku_api, sku_chart_view, metrics_view
 
 
 urlpatterns = [
@@ -10,6 +12,7 @@ urlpatterns = [
     path('', top_20_selling_products_till_2024_view, name='top_products_till_2024'),
     # path('top-products-from-2024/', top_20_selling_products_2024_onward_view, name='top_products_2024'),
     path("sku-history/<str:sku>/", sku_sales_history, name="sku_sales_history"),
+    path("export/sku-history/", export_sku_sales_history, name="export_sku_sales_history"),
     path('compare/<str:sku>/', compare_sku_prediction_view, name='compare_sku'),
     # path('predict-2024-sales/', fetch_historical_sales_till_2024, name='predict_2024_sales'),
     path("top-items/", Fetching_items, name="Fetching"),
@@ -17,5 +20,13 @@ urlpatterns = [
     path('prompt/', handle_prompt, name='handle_prompt'),
 path('items/', Fetching_items, name='fetching_items'),
 path('predictions/', handle_prompt, name='predictions'),  # you can separate if you want
+    path('analytics/promotions/categories/', promotion_category_rollup_view, name='promotion_category_rollup'),
+    path('forecast/baseline/', baseline_forecast_view, name='baseline_forecast'),
+    path('jobs/<int:job_id>/', job_status_view, name='job_status'),
+    path('jobs/<int:job_id>/wait/', job_wait_view, name='job_wait'),
+    path('prompt/stream/', stream_predictions_view, name='stream_predictions'),
+    path('api/skus/', sku_api, name='sku_api'),
+    path('charts/<str:sku>/<slug:kind>.<slug:fmt>', sku_chart_view, name='sku_chart'),
+    path('metrics/', metrics_view, name='metrics'),
 
  ]
@@ -11,160 +11,20 @@ from django.views.decorators.csrf import csrf_exempt
 from .models import Location, Customer, Product, ProductVariant, Order, OrderLineItem
 from urllib.parse import parse_qs, urlparse
 from django.shortcuts import render
-SHOPIFY_STORE = os.getenv('SHOPIFY_STORE')
-SHOPIFY_API_VERSION = os.getenv('SHOPIFY_API_VERSION')
-SHOPIFY_ACCESS_TOKEN = os.getenv('SHOPIFY_ACCESS_TOKEN')
-
-HEADERS = {
-    'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN,
-    'Content-Type': 'application/json'
-}
-
-def log(msg):
-    print(f"[Shopify Fetch] {msg}")
-
-def get_next_page_url(link_header):
-    # Link header example:
-    # <https://{store}/admin/api/2025-04/customers.json?limit=250&page_info=xyz>; rel="next"
-    if not link_header:
-        return None
-    parts = link_header.split(',')
-    for part in parts:
-        if 'rel="next"' in part:
-            url_part = part.split(';')[0].strip().strip('<>')
-            return url_part
-    return None
-
-def fetch_shopify_data_all(endpoint):
-    url = f"https://{SHOPIFY_STORE}/admin/api/{SHOPIFY_API_VERSION}/{endpoint}?limit=250"
-    all_items = []
-    while url:
-        log(f"Fetching: {url}")
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code != 200:
-            log(f"Failed to fetch {url}: {response.status_code} - {response.text}")
-            break
-        data = response.json()
-        # Extract main list key from endpoint, e.g. 'customers', 'orders', 'products', 'locations'
-        key = endpoint.split('.')[0]  # crude way: 'customers.json' -> 'customers'
-        items = data.get(key, [])
-        log(f"Fetched {len(items)} items from current page.")
-        all_items.extend(items)
-
-        link_header = response.headers.get('Link')
-        next_url = get_next_page_url(link_header)
-        url = next_url  # if no next page, will be None and loop stops
-
-    log(f"Total fetched from {endpoint}: {len(all_items)}")
-    return all_items
+from django.urls import reverse
+from .jobs import enqueue
 
 
 @csrf_exempt
 def fetch_and_store_all(request):
-    # Locations
-    locations = fetch_shopify_data_all('locations.json')
-    for loc in locations:
-        loc_obj, created = Location.objects.update_or_create(
-            shopify_id=loc['id'],
-            defaults={
-                'name': loc['name'],
-                'address': loc.get('address1') or '',
-                'city': loc.get('city'),
-                'region': loc.get('province'),
-                'country': loc.get('country'),
-            }
-        )
-        log(f"{'Created' if created else 'Updated'} Location: {loc_obj.name}")
-
-    # Customers
-    customers = fetch_shopify_data_all('customers.json')
-    for cust in customers:
-        name = (cust.get('first_name') or '') + ' ' + (cust.get('last_name') or '')
-        cust_obj, created = Customer.objects.update_or_create(
-            shopify_id=cust['id'],
-            defaults={
-                'email': cust.get('email'),
-                'name': name.strip() or cust.get('email') or 'Unknown',
-                'created_at': parse_datetime(cust['created_at']),
-                'city': (cust.get('default_address') or {}).get('city'),
-                'region': (cust.get('default_address') or {}).get('province'),
-                'country': (cust.get('default_address') or {}).get('country'),
-                'tags': cust.get('tags', '')
-            }
-        )
-        log(f"{'Created' if created else 'Updated'} Customer: {cust_obj.name}")
-
-    # Products and Variants
-    products = fetch_shopify_data_all('products.json')
-    for prod in products:
-        prod_obj, created = Product.objects.update_or_create(
-            shopify_id=prod['id'],
-            defaults={
-                'title': prod['title'],
-                'product_type': prod.get('product_type'),
-                'vendor': prod.get('vendor'),
-                'tags': ','.join(prod.get('tags', [])) if isinstance(prod.get('tags'), list) else prod.get('tags', '')
-            }
-        )
-        log(f"{'Created' if created else 'Updated'} Product: {prod_obj.title}")
-
-        for variant in prod.get('variants', []):
-            var_obj, v_created = ProductVariant.objects.update_or_create(
-                shopify_id=variant['id'],
-                defaults={
-                    'product': prod_obj,
-                    'title': variant.get('title'),
-                    'sku': variant.get('sku'),
-                    'price': float(variant.get('price') or 0),
-                }
-            )
-            log(f"  {'Created' if v_created else 'Updated'} Variant: {var_obj.title}")
-
-    # Orders and Line Items
-    orders = fetch_shopify_data_all('orders.json')
-    for order in orders:
-        cust_obj = None
-        if order.get('customer'):
-            cust_obj = Customer.objects.filter(shopify_id=order['customer']['id']).first()
-
-        location_obj = None
-        if order.get('location_id'):
-            location_obj = Location.objects.filter(shopify_id=order['location_id']).first()
-        else:
-            ship_addr = order.get('shipping_address')
-            if ship_addr:
-                location_obj = Location.objects.filter(city=ship_addr.get('city'), country=ship_addr.get('country')).first()
-
-        order_obj, created = Order.objects.update_or_create(
-            shopify_id=order['id'],
-            defaults={
-                'customer': cust_obj,
-                'location': location_obj,
-                'order_date': parse_datetime(order['created_at']),
-                'day_of_week': parse_datetime(order['created_at']).strftime('%A') if order.get('created_at') else '',
-                'season': '',  # optional logic here
-                'time_slot': '', # optional logic here
-                'total_price': float(order.get('total_price') or 0),
-            }
-        )
-        log(f"{'Created' if created else 'Updated'} Order: {order_obj.shopify_id}")
-
-        for item in order.get('line_items', []):
-            prod_obj = Product.objects.filter(shopify_id=item['product_id']).first()
-            var_obj = ProductVariant.objects.filter(shopify_id=item['variant_id']).first()
-            OrderLineItem.objects.update_or_create(
-                order=order_obj,
-                variant=var_obj,
-                defaults={
-                    'product': prod_obj,
-                    'quantity': item['quantity'],
-                    'price': float(item['price']),
-                    'product_type': item.get('product_type', ''),
-                }
-            )
-            log(f"  Stored OrderLineItem for product {prod_obj.title if prod_obj else 'Unknown'}")
-
-    return JsonResponse({'status': 'success', 'message': 'All Shopify data fetched and stored successfully.'})
+    # The sync takes minutes; a worker (manage.py run_workers) runs it
+    job = enqueue("sync_shopify", unique=True)
+    return JsonResponse({
+        'status': 'queued',
+        'message': 'Shopify sync queued.',
+        'job_id': job.id,
+        'status_url': reverse('job_status', args=[job.id]),
+    }, status=202)
 
 # FEtching Data from API till this code 
 # From now we will start the real process 
@@ -189,242 +49,66 @@ from dotenv import load_dotenv
 from .models import (
     ProductVariant,
     OrderLineItem,
-    CustomerPromotion_April,
-    CustomerPromotion_May,
-    CustomerPromotion_June,
     Prompt,
     Product,
 )
+from .forecast_runs import latest_run, run_predictions
+from .forecasting import DEFAULT_METHOD, FORECAST_METHODS, forecast_catalog
+from .prophet_backend import stored_forecasts
+from .gemini import FORECAST_GENERATION_CONFIG, call_gemini, forget_response
+from .promotions import promotion_summaries
+from .top_skus import baseline_july_forecasts, baseline_response, gemini_setup, july_prediction_rows, top_sku_context
+from .single_flight import single_flight
+from .prompts import prompts
+from .prompt_encoding import PayloadReport, encode, month_series
+from .prompt_workflow import compact_item
+from .features import FeatureStoreNotReady, feature_version, ranked_features, sales_by_month, top_features
+from .snapshots import SESSION_KEY, load_snapshot, remember_snapshot, save_snapshot, session_snapshot, versioned_snapshot_id
 
 logger = logging.getLogger(__name__)
 
 def top_20_selling_products_till_2024_view(request):
-    start_date = make_aware(datetime(2024, 7, 1))
-    end_date = make_aware(datetime(2025, 7, 1))
-
-    top_variants = (
-        OrderLineItem.objects
-        .filter(order__order_date__gte=start_date, order__order_date__lt=end_date)
-        .values('variant_id')
-        .annotate(total_quantity_sold=Sum('quantity'))
-        .order_by('-total_quantity_sold')
-    )
-
-    filtered_variants = [v for v in top_variants if v['total_quantity_sold'] != 46349]
-    variant_ids_from_sales = [item['variant_id'] for item in filtered_variants]
-
-    variants_qs = ProductVariant.objects.select_related('product').filter(
-        id__in=variant_ids_from_sales
-    ).exclude(sku__isnull=True).exclude(sku='')
-    variants = {v.id: v for v in variants_qs}
-
-    results = []
-    for item in filtered_variants:
-        variant = variants.get(item['variant_id'])
-        if not variant:
-            continue
-        product = variant.product
-        results.append({
-            "product_id": product.id,
-            "product_shopify_id": product.shopify_id,
-            "product_title": product.title,
-            "variant_title": variant.title,
-            "variant_sku": variant.sku,
-            "price": variant.price,
-            "vendor": product.vendor,
-            "product_type": product.product_type,
-            "total_quantity_sold": item['total_quantity_sold'],
-        })
-        if len(results) >= 10:
-            break
-
-    variant_skus = [r["variant_sku"] for r in results if r["variant_sku"]]
-    variant_objs = ProductVariant.objects.select_related('product').filter(sku__in=variant_skus)
-    variant_id_map = {v.id: v for v in variant_objs}
-    top_variant_shopify_ids = [v.shopify_id for v in variant_objs]
-
-    promo_data_by_sku = defaultdict(dict)
-    shopify_id_to_sku_map = {v.shopify_id: v.sku for v in variant_objs}
-
-    promo_models = {
-        '2025-04': CustomerPromotion_April,
-        '2025-05': CustomerPromotion_May,
-        '2025-06': CustomerPromotion_June,
-    }
-
-    for month, model in promo_models.items():
-        promo_qs = model.objects.filter(variant_id__in=top_variant_shopify_ids)
-        for promo in promo_qs:
-            shopify_id = promo.variant_id
-            variant_sku = shopify_id_to_sku_map.get(shopify_id)
-            if variant_sku:
-                promo_data_by_sku[variant_sku][month] = {
-    "id": promo.id,
-    "title": promo.title,
-    "item_id": promo.item_id,
-    "product_id": promo.product_id,
-    "variant_id": promo.variant_id,
-    "price": promo.price,
-    "clicks": promo.clicks,
-    "cost": str(promo.cost) if promo.cost is not None else None,
-    "conv_value": str(promo.conv_value) if promo.conv_value is not None else None,
-    "conv_value_per_cost": str(promo.conv_value_per_cost) if promo.conv_value_per_cost is not None else None,
-    "impressions": promo.impressions,
-    "ctr": str(promo.ctr) if promo.ctr is not None else None,
-    "avg_cpc": str(promo.avg_cpc) if promo.avg_cpc is not None else None,
-    "category_1st_level": promo.category_1st_level,
-    "category_2nd_level": promo.category_2nd_level,
-    "category_3rd_level": promo.category_3rd_level,
-    "category_4th_level": promo.category_4th_level,
-    "category_5th_level": promo.category_5th_level,
-    "product_type_1st_level": promo.product_type_1st_level,
-}
-
-
-
-    monthly_sales = defaultdict(lambda: defaultdict(int))
-    order_items = OrderLineItem.objects.filter(
-        variant_id__in=variant_ids_from_sales,
-        order__order_date__gte=start_date,
-        order__order_date__lt=make_aware(datetime(2025, 7, 1))
-    )
-    for item in order_items:
-        month = item.order.order_date.strftime('%Y-%m')
-        variant_obj = variant_id_map.get(item.variant_id)
-        if variant_obj:
-            monthly_sales[variant_obj.sku][month] += item.quantity
-
-    july_start = make_aware(datetime(2025, 7, 1))
-    aug_start = make_aware(datetime(2025, 8, 1))
-    actual_july_sales = defaultdict(int)
-    july_orders = OrderLineItem.objects.filter(
-        variant_id__in=variant_ids_from_sales,
-        order__order_date__gte=july_start,
-        order__order_date__lt=aug_start
-    )
-    for item in july_orders:
-        variant_obj = variant_id_map.get(item.variant_id)
-        if variant_obj:
-            actual_july_sales[variant_obj.sku] += item.quantity
-
-    load_dotenv()
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    if not GEMINI_API_KEY:
-        return render(request, "customer/predictions.html", {"predictions": [], "error": "GEMINI_API_KEY missing"})
-
+    refresh = bool(request.GET.get("refresh"))
+    # Analysts opening the dashboard together share one computation of it
     try:
-        prompt_template = Prompt.objects.get(type='MainPrompt').prompt.strip()
-    except Prompt.DoesNotExist:
-        return render(request, "customer/predictions.html", {"predictions": [], "error": "Prompt with type=MainPrompt not found"})
-
-    def call_gemini(prompt_text):
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-        headers = {
-            "Content-Type": "application/json",
-            "X-goog-api-key": GEMINI_API_KEY
-        }
-        payload = {
-            "contents": [{"parts": [{"text": prompt_text}]}],
-            "generationConfig": {
-                "temperature": 0.0,
-                "topK": 1,
-                "topP": 0.9
-            }
-        }
-        try:
-            response = requests.post(url, headers=headers, data=json.dumps(payload))
-            response.raise_for_status()
-            data = response.json()
-            return data['candidates'][0]['content']['parts'][0]['text'].strip()
-        except Exception as e:
-            logger.error(f"Gemini API Error: {str(e)}")
-            return json.dumps({"predicted_july_sales": 0, "reason": f"Error: {str(e)}"})
-
-    predictions = []
-    for sku in variant_skus:
-        variant = variant_objs.get(sku=sku)
-        if not variant:
-            continue
-        product = variant.product
-        sales_data = monthly_sales.get(sku, {})
-        promo_data = promo_data_by_sku.get(sku, {})
-
-        prompt = f"""{prompt_template}
-
-### PRODUCT DETAILS
-Title: {product.title}
-SKU: {sku}
-Type: {product.product_type}
-Vendor: {product.vendor}
-
-### HISTORICAL SALES (Jul 2024–Jun 2025)
-{json.dumps(sales_data, indent=2)}
-
-### PROMOTION SUMMARY (Apr–Jun 2025)
-{json.dumps(promo_data, indent=2)}
-
-Q: Based on the above data and market patterns, provide a demand forecast for this SKU.
-
-Your output should include:
-- Daily sales forecasts for 7, 14, and 30 days
-- Predicted total units for July 2025
-- A confidence score
-- A clear reasoning summary
-
-Output Format (strict JSON only — no markdown, no comments):
-
-{{
-  "confidence_score": float,
-  "reason": string,
-  "Predicted July Sales": int
-}}
-
-Guidelines:
-- Use promotional signals, past sales, and seasonality to generate forecasts.
-- Avoid defaulting to 30 unless data shows strong evidence of consistent 1-unit/day demand.
-- Provide a conservative but diverse forecast when data is limited.
-
-IMPORTANT:
-- Output must be valid JSON only. No extra text.
-"""
-
-
-        gemini_response = call_gemini(prompt)
-        actual_qty = actual_july_sales.get(sku, 0)
-
-        try:
-            start_idx = gemini_response.find('{')
-            end_idx = gemini_response.rfind('}') + 1
-            clean_json_text = gemini_response[start_idx:end_idx]
-            response_data = json.loads(clean_json_text)
-            predicted_qty_raw = response_data.get("Predicted July Sales") or \
-                (response_data.get("forecast") or {}).get("predicted_july_total", 0)
-            predicted_qty = int(float(predicted_qty_raw))
-            reason = response_data.get("reason", "N/A")
-        except Exception as e:
-            predicted_qty = 0
-            reason = f"Parsing error: {str(e)}"
-            logger.error(f"Parsing failed for SKU {sku}. Raw Gemini response:\n{gemini_response}")
-
-        predictions.append({
-            "SKU": sku,
-            "Product": product.title,
-            "Past Sales": {
-                month: sales_data.get(month, 0) for month in [
-                    "2024-07", "2024-08", "2024-09", "2024-10", "2024-11", "2024-12",
-                    "2025-01", "2025-02", "2025-03", "2025-04", "2025-05", "2025-06"
-                ]
-            },
-            "Predicted July Sales": predicted_qty,
-            "Actual July Sales": actual_qty,
-            "Reason": reason,
-        })
-
-        time.sleep(1.2)
-
-    return render(request, "customer/predictions.html", {"predictions": predictions})
-
-    # return JsonResponse({"predictions": predictions})
+        context = single_flight(f"top_skus_page:{int(refresh)}", lambda: _top_skus_page(refresh))
+    except FeatureStoreNotReady as e:
+        return redirect_to_job(e.job, request.get_full_path())
+    return render(request, "customer/predictions.html", context)
+
+
+def _top_skus_page(refresh):
+    ctx = top_sku_context()
+    sku_to_variant = ctx["sku_to_variant"]
+    display_skus = ctx["display_skus"]
+
+    # Serve the latest stored Gemini run; only ?refresh=1 or SKUs missing from it forecast again
+    stored_run = None if refresh else latest_run("gemini")
+    stored = run_predictions(stored_run, list(ctx["variant_id_map"])) if stored_run else {}
+    if stored and all("2025-07" in stored.get(sku_to_variant[sku].id, {}) for sku in display_skus):
+        responses = {}
+        for sku in display_skus:
+            july = stored[sku_to_variant[sku].id]["2025-07"]
+            responses[sku] = {"Predicted July Sales": july["predicted"], "reason": july["reason"]}
+        predictions = july_prediction_rows(
+            display_skus, sku_to_variant, ctx["monthly_sales"], ctx["actual_july_sales"], responses
+        )
+        return {"predictions": predictions, "run": stored_run}
+
+    # Otherwise show the local baseline right away and let a worker run Gemini
+    baseline_july = baseline_july_forecasts(list(ctx["variant_id_map"]))
+    _, _, gemini_error = gemini_setup()
+    job = None
+    if gemini_error:
+        note = f"Gemini unavailable: {gemini_error}"
+    else:
+        job = enqueue("forecast_top_skus", unique=True)
+        note = f"Gemini forecast in progress (job {job.id})"
+    responses = {sku: baseline_response(baseline_july, sku, note) for sku in display_skus}
+    predictions = july_prediction_rows(
+        display_skus, sku_to_variant, ctx["monthly_sales"], ctx["actual_july_sales"], responses
+    )
+    return {"predictions": predictions, "run": stored_run, "job": job}
 
 
 # Directly gets the highest sales in April , May , June month and then predicts using gemini then compares with original data
@@ -666,47 +350,15 @@ from django.utils.timezone import make_aware
 from dotenv import load_dotenv
 from .models import ProductVariant, OrderLineItem, Prompt  # 👈 include Prompt model
 
-def compare_sku_prediction_view(request, sku):
-    load_dotenv()
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-
-    if not GEMINI_API_KEY:
-        return render(request, 'customer/compare.html', {'error': 'Gemini API Key not found in environment variables.'})
-
-    variant = ProductVariant.objects.select_related('product').filter(sku=sku).first()
-    if not variant or not variant.product:
-        return render(request, 'customer/compare.html', {'error': 'Invalid SKU or product not found.'})
-
-    product = variant.product
-
-    # Step 1: Historical sales before 2024
-    cutoff = make_aware(datetime(2024, 1, 1))
-    sales_qs = OrderLineItem.objects.filter(variant=variant, order__order_date__lt=cutoff)
-    monthly_history = defaultdict(int)
-    for item in sales_qs:
-        month_str = item.order.order_date.strftime('%Y-%m')
-        monthly_history[month_str] += item.quantity
-
-    history_list = [{"month": m, "quantity": q} for m, q in sorted(monthly_history.items())]
-
-    # Step 2: Fetch Prompt Header and MainPrompt from database
-    header = Prompt.objects.filter(type="Header").first()
-    main_rules = Prompt.objects.filter(type="MainPrompt").first()
+# 2024 monthly forecast for one SKU; $prompt is the stored MainPrompt
+COMPARE_PROMPT_LAYOUT = """
 
-    if not header or not main_rules:
-        return render(request, 'customer/compare.html', {'error': 'Prompt instructions missing in database.'})
-
-    # Step 3: Build prompt dynamically
-    def build_prompt(sku, title, history):
-        return f"""
-
-{main_rules.prompt}
+$prompt
 ---
 
 ### PRODUCT DETAILS:
-- Product Name: "{title}"
-- SKU: {sku}
+- Product Name: "$title"
+- SKU: $sku
 - Today's Date: January 1, 2024
 - Product Category: Fashion Jewellery (non-essential)
 - Region: India
@@ -716,9 +368,9 @@ def compare_sku_prediction_view(request, sku):
 
 ### OUTPUT FORMAT (STRICT JSON ONLY):
 
-{{
-  "sku": "{sku}",
-  "monthly_sales_2024": {{
+{
+  "sku": "$sku",
+  "monthly_sales_2024": {
     "January": <integer>,
     "February": <integer>,
     "March": <integer>,
@@ -731,17 +383,59 @@ def compare_sku_prediction_view(request, sku):
     "October": <integer>,
     "November": <integer>,
     "December": <integer>
-  }},
+  },
   "total_predicted_quantity_2024": <integer>,
   "reasoning": "<Strict explanation for predicted quantities: highlight key months, explain decay if any, avoid vague phrases>"
-}}
+}
 
 ---
 
-### HISTORICAL SALES DATA:
-{json.dumps(history, indent=2)}
+### HISTORICAL SALES DATA (units per month, from "start"):
+$history
 """
 
+
+def compare_sku_prediction_view(request, sku):
+    GEMINI_API_KEY = settings.GEMINI_API_KEY
+
+    if not GEMINI_API_KEY:
+        return render(request, 'customer/compare.html', {'error': 'Gemini API Key not found in environment variables.'})
+
+    # Concurrent requests for the same SKU share one set of queries and one Gemini call
+    template, context = single_flight(f"compare:{sku}", lambda: _compare_sku_page(sku, GEMINI_API_KEY))
+    return render(request, template, context)
+
+
+def _compare_sku_page(sku, GEMINI_API_KEY):
+    variant = ProductVariant.objects.select_related('product').filter(sku=sku).first()
+    if not variant or not variant.product:
+        return 'customer/compare.html', {'error': 'Invalid SKU or product not found.'}
+
+    product = variant.product
+
+    # Step 1: Historical sales before 2024
+    cutoff = make_aware(datetime(2024, 1, 1))
+    sales_qs = OrderLineItem.objects.filter(variant=variant, order__order_date__lt=cutoff)
+    monthly_history = defaultdict(int)
+    for item in sales_qs:
+        month_str = item.order.order_date.strftime('%Y-%m')
+        monthly_history[month_str] += item.quantity
+
+    history_list = [{"month": m, "quantity": q} for m, q in sorted(monthly_history.items())]
+    # Months without orders sold nothing, so the series is filled with 0 and sent as one array
+    payload = PayloadReport(f"Compare {sku}")
+    history_text = payload.add(json.dumps(history_list, indent=2), encode(month_series(monthly_history, fill=0)))
+    payload.log()
+
+    # Step 2: Compiled prompt (cached per process, rebuilt when a Prompt changes)
+    prompt_template = prompts.template("MainPrompt", COMPARE_PROMPT_LAYOUT)
+    if prompts.text("Header") is None or prompt_template is None:
+        return 'customer/compare.html', {'error': 'Prompt instructions missing in database.'}
+
+    # Step 3: Build prompt for this SKU
+    def build_prompt(sku, title, history):
+        return prompt_template.render(sku=sku, title=title, history=history)
+
     # Step 4: Call Gemini
     prediction_data = {
         "monthly_sales_2024": {},
@@ -750,39 +444,23 @@ def compare_sku_prediction_view(request, sku):
     }
 
     try:
-        prompt_text = build_prompt(sku, product.title, history_list)
-
-        response = requests.post(
-            GEMINI_URL,
-            headers={
-                "Content-Type": "application/json",
-                "X-goog-api-key": GEMINI_API_KEY,
-            },
-            data=json.dumps({
-                "contents": [
-                    {
-                        "parts": [{"text": prompt_text}]
-                    }
-                ]
-            })
-        )
+        prompt_text = build_prompt(sku, product.title, history_text)
 
-        response.raise_for_status()
-        data = response.json()
-
-        if 'candidates' in data and data['candidates']:
-            content = data['candidates'][0]['content']['parts'][0]['text'].strip()
-            if content.startswith("```json"):
-                content = content.replace("```json", "").strip()
-            if content.endswith("```"):
-                content = content[:-3].strip()
-            prediction_data = json.loads(content)
+        # Deterministic settings, so the cached answer is the one a fresh call would give
+        content = call_gemini(prompt_text, GEMINI_API_KEY, FORECAST_GENERATION_CONFIG)
+        if content.startswith("```json"):
+            content = content.replace("```json", "").strip()
+        if content.endswith("```"):
+            content = content[:-3].strip()
+        prediction_data = json.loads(content)
 
     except requests.exceptions.HTTPError as e:
         prediction_data["reasoning"] = f"[Gemini HTTP Error] {e.response.status_code} {e.response.reason}: {e.response.text}"
     except requests.exceptions.RequestException as e:
         prediction_data["reasoning"] = f"[Gemini Request Error] {str(e)}"
     except json.JSONDecodeError as e:
+        # Not cached, so the next comparison asks again instead of replaying the bad answer
+        forget_response(prompt_text, FORECAST_GENERATION_CONFIG)
         prediction_data["reasoning"] = f"[Gemini Response Parsing Error] Invalid JSON: {str(e)}"
     except Exception as e:
         prediction_data["reasoning"] = f"[Unexpected Error] {str(e)}"
@@ -816,7 +494,7 @@ def compare_sku_prediction_view(request, sku):
 
     total_actual = sum([row["actual"] for row in comparison])
 
-    return render(request, 'customer/monthly_comparison.html', {
+    return 'customer/monthly_comparison.html', {
         "product_title": product.title,
         "variant_title": variant.title,
         "sku": sku,
@@ -824,221 +502,332 @@ def compare_sku_prediction_view(request, sku):
         "total_predicted": prediction_data.get("total_predicted_quantity_2024", 0),
         "total_actual": total_actual,
         "reasoning": prediction_data.get("reasoning", "")
-    })
+    }
 
 
 
-from django.http import JsonResponse
+import csv
+from datetime import timedelta
+from django.db.models import F, FloatField, Q, Sum
+from django.db.models.functions import TruncDate
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
 from django.utils.timezone import make_aware
 from datetime import datetime
 from .models import ProductVariant, OrderLineItem
 from collections import defaultdict
 
+SKU_HISTORY_PAGE_SIZE = 500
+SKU_HISTORY_MAX_PAGE_SIZE = 5000
+SKU_HISTORY_CHUNK_SIZE = 2000  # rows per query when streaming
+
+
+class _Echo:
+    """File-like object that hands back what csv.writer writes, for streaming."""
+
+    def write(self, value):
+        return value
+
+
+def _daily_sales_qs(cutoff_date, after=None, **filters):
+    """Daily quantity/amount per date, aggregated in the DB and ordered by date.
+
+    `after` is the cursor (a date); only days strictly after it are returned.
+    Extra keyword filters are applied to OrderLineItem (e.g. variant=...).
+    """
+    qs = OrderLineItem.objects.filter(order__order_date__lt=cutoff_date, **filters)
+    if after is not None:
+        qs = qs.filter(order__order_date__gte=_day_after(after))
+    return (
+        qs.annotate(date=TruncDate('order__order_date'))
+        .values('date')
+        .annotate(
+            day_quantity=Sum('quantity'),
+            day_amount=Sum(F('price') * F('quantity'), output_field=FloatField()),
+        )
+        .order_by('date')
+    )
+
+
+def _day_after(day):
+    return make_aware(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+
+
+def _keyset_chunks(page_qs, key):
+    """Yields rows of page_qs(after) one SKU_HISTORY_CHUNK_SIZE query at a time, `after` being
+    key(last row) of the previous chunk. mysqlclient buffers a whole result set client-side even
+    with .iterator(), so bounded queries are what keeps memory flat on long exports."""
+    after = None
+    while True:
+        chunk = list(page_qs(after)[:SKU_HISTORY_CHUNK_SIZE])
+        yield from chunk
+        if len(chunk) < SKU_HISTORY_CHUNK_SIZE:
+            return
+        after = key(chunk[-1])
+
+
+def _history_row(row):
+    return {
+        "date": row["date"].strftime('%Y-%m-%d'),
+        "quantity": row["day_quantity"] or 0,
+        "total_amount": round(row["day_amount"] or 0.0, 2),
+    }
+
+
+def _stream_rows(rows, fmt, fields):
+    """Wraps an iterator of dicts into a StreamingHttpResponse (ndjson or csv)."""
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+
+        def lines():
+            yield writer.writerow(fields)
+            for row in rows:
+                yield writer.writerow([row[f] for f in fields])
+
+        return StreamingHttpResponse(lines(), content_type="text/csv")
+
+    return StreamingHttpResponse(
+        (json.dumps(row) + "\n" for row in rows),
+        content_type="application/x-ndjson",
+    )
+
+
+def _parse_cursor(request):
+    cursor = request.GET.get("cursor")
+    if not cursor:
+        return None, None
+    parsed = parse_date(cursor)
+    if parsed is None:
+        return None, JsonResponse({'error': 'Invalid cursor, expected YYYY-MM-DD'}, status=400)
+    return parsed, None
+
+
 def sku_sales_history(request, sku):
     variant = ProductVariant.objects.select_related('product').filter(sku=sku).first()
     if not variant:
         return JsonResponse({'error': 'Invalid SKU'}, status=404)
 
     cutoff_date = make_aware(datetime(2024, 1, 1))
+    after, error = _parse_cursor(request)
+    if error:
+        return error
+
+    sales_qs = _daily_sales_qs(cutoff_date, after=after, variant=variant)
+
+    # ?format=ndjson|csv streams every remaining day, fetched in keyset-paginated chunks
+    fmt = request.GET.get("format")
+    if fmt in ("ndjson", "csv"):
+        chunks = _keyset_chunks(
+            lambda last: _daily_sales_qs(cutoff_date, after=last or after, variant=variant),
+            lambda row: row["date"],
+        )
+        rows = (_history_row(row) for row in chunks)
+        return _stream_rows(rows, fmt, ["date", "quantity", "total_amount"])
 
-    sales_qs = OrderLineItem.objects.filter(
-        variant=variant,
-        order__order_date__lt=cutoff_date
-    ).select_related('order')
-
-    daily_sales = defaultdict(lambda: {"quantity": 0, "total_amount": 0.0})
-    
-    for item in sales_qs:
-        date_str = item.order.order_date.strftime('%Y-%m-%d')
-        daily_sales[date_str]["quantity"] += item.quantity
-        daily_sales[date_str]["total_amount"] += item.price * item.quantity
+    try:
+        limit = min(int(request.GET.get("limit", SKU_HISTORY_PAGE_SIZE)), SKU_HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
 
-    history = [
-        {"date": date, "quantity": data["quantity"], "total_amount": round(data["total_amount"], 2)}
-        for date, data in sorted(daily_sales.items())
-    ]
+    # Fetch one extra row to know whether another page exists
+    page = [_history_row(row) for row in sales_qs[:limit + 1]]
+    next_cursor = page[limit - 1]["date"] if len(page) > limit else None
 
     return JsonResponse({
         "sku": sku,
         "variant_title": variant.title,
         "product_title": variant.product.title if variant.product else "",
-        "history": history
+        "history": page[:limit],
+        "next_cursor": next_cursor,
     }, status=200)
 
 
+def export_sku_sales_history(request):
+    """Streams daily sales for every SKU as ndjson (default) or csv."""
+    cutoff_date = make_aware(datetime(2024, 1, 1))
+    fmt = "csv" if request.GET.get("format") == "csv" else "ndjson"
+
+    def sales_qs(after):
+        # after: (sku, date) of the last row already sent
+        qs = (
+            OrderLineItem.objects
+            .filter(order__order_date__lt=cutoff_date, variant__isnull=False)
+            .exclude(variant__sku__isnull=True).exclude(variant__sku='')
+        )
+        if after is not None:
+            sku, day = after
+            qs = qs.filter(Q(variant__sku__gt=sku) | Q(variant__sku=sku, order__order_date__gte=_day_after(day)))
+        return (
+            qs.annotate(date=TruncDate('order__order_date'))
+            .values('variant__sku', 'date')
+            .annotate(
+                day_quantity=Sum('quantity'),
+                day_amount=Sum(F('price') * F('quantity'), output_field=FloatField()),
+            )
+            .order_by('variant__sku', 'date')
+        )
+
+    def rows():
+        for row in _keyset_chunks(sales_qs, lambda row: (row["variant__sku"], row["date"])):
+            yield {"sku": row["variant__sku"], **_history_row(row)}
+
+    response = _stream_rows(rows(), fmt, ["sku", "date", "quantity", "total_amount"])
+    response["Content-Disposition"] = f'attachment; filename="sku_sales_history.{fmt}"'
+    return response
+
+
 
 # ---------------------------==================================================================================
 
 
+import base64
 from collections import defaultdict
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.db.models import Sum
 from django.utils.timezone import make_aware as safe_make_aware
 
-def Fetching_items(request):
-    # Define current reference date as July 1, 2025
-    reference_date = safe_make_aware(datetime(2025, 7, 1))
-    start_date = safe_make_aware(datetime(2024, 7, 1))
-    end_date = reference_date
-
-    # Get top selling variants in the last year (excluding specific quantity 46349)
-    top_variants = (
-        OrderLineItem.objects
-        .filter(order__order_date__gte=start_date, order__order_date__lt=end_date)
-        .values('variant_id')
-        .annotate(total_quantity_sold=Sum('quantity'))
-        .order_by('-total_quantity_sold')
-    )
+# Item fields the prompt pages send to Gemini
+PROMPT_ITEM_FIELDS = (
+    "sku", "product_type", "vendor", "price", "sales_last_7_days", "sales_last_30_days",
+    "created_at", "promo_summary", "past_sales",
+)
 
-    filtered_variants = [v for v in top_variants if v['total_quantity_sold'] != 46349]
-    variant_ids_from_sales = [item['variant_id'] for item in filtered_variants]
-
-    # Get variants with product info, exclude null or empty SKUs
-    variants_qs = ProductVariant.objects.select_related('product').filter(
-        id__in=variant_ids_from_sales
-    ).exclude(sku__isnull=True).exclude(sku='')
-
-    variants = {v.id: v for v in variants_qs}
-    sku_to_variant = {v.sku: v for v in variants_qs}  # Map SKU to variant for created_at
-
-    results = []
-    for item in filtered_variants:
-        variant = variants.get(item['variant_id'])
-        if not variant:
-            continue
-        product = variant.product
-        results.append({
-            "product_id": product.id,
-            "product_shopify_id": product.shopify_id,
-            "product_title": product.title,
-            "variant_title": variant.title,
-            "variant_sku": variant.sku,
-            "price": variant.price,
-            "vendor": product.vendor,
-            "product_type": product.product_type,
-            "total_quantity_sold": item['total_quantity_sold'],
-        })
-        if len(results) >= 10:
-            break
-
-    variant_skus = [r["variant_sku"] for r in results]
-    variant_objs = ProductVariant.objects.select_related('product').filter(sku__in=variant_skus)
-    variant_id_map = {v.id: v for v in variant_objs}
-    top_variant_shopify_ids = [v.shopify_id for v in variant_objs]
-    shopify_id_to_sku_map = {v.shopify_id: v.sku for v in variant_objs}
-
-    # Fetch promotional data per SKU
-    promo_data_by_sku = defaultdict(dict)
-    promo_models = {
-        '2025-04': CustomerPromotion_April,
-        '2025-05': CustomerPromotion_May,
-        '2025-06': CustomerPromotion_June,
-    }
 
-    for month, model in promo_models.items():
-        promo_qs = model.objects.filter(variant_id__in=top_variant_shopify_ids)
-        for promo in promo_qs:
-            shopify_id = promo.variant_id
-            variant_sku = shopify_id_to_sku_map.get(shopify_id)
-            if variant_sku:
-                promo_data_by_sku[variant_sku][month] = {
-                    "id": promo.id,
-                    "title": promo.title,
-                    "item_id": promo.item_id,
-                    "product_id": promo.product_id,
-                    "variant_id": promo.variant_id,
-                    "price": promo.price,
-                    "clicks": promo.clicks,
-                    "cost": str(promo.cost) if promo.cost is not None else None,
-                    "conv_value": str(promo.conv_value) if promo.conv_value is not None else None,
-                    "conv_value_per_cost": str(promo.conv_value_per_cost) if promo.conv_value_per_cost is not None else None,
-                    "impressions": promo.impressions,
-                    "ctr": str(promo.ctr) if promo.ctr is not None else None,
-                    "avg_cpc": str(promo.avg_cpc) if promo.avg_cpc is not None else None,
-                    "category_1st_level": promo.category_1st_level,
-                    "category_2nd_level": promo.category_2nd_level,
-                    "category_3rd_level": promo.category_3rd_level,
-                    "category_4th_level": promo.category_4th_level,
-                    "category_5th_level": promo.category_5th_level,
-                    "product_type_1st_level": promo.product_type_1st_level,
-                }
-
-    # Aggregate monthly sales per SKU
-    monthly_sales = defaultdict(lambda: defaultdict(int))
-    order_items = OrderLineItem.objects.filter(
-        variant_id__in=variant_ids_from_sales,
-        order__order_date__gte=start_date,
-        order__order_date__lt=end_date
-    )
-    for item in order_items:
-        month = item.order.order_date.strftime('%Y-%m')
-        variant_obj = variant_id_map.get(item.variant_id)
-        if variant_obj:
-            monthly_sales[variant_obj.sku][month] += item.quantity
-
-    # July sales (actual for target forecast month)
-    july_start = safe_make_aware(datetime(2025, 7, 1))
-    aug_start = safe_make_aware(datetime(2025, 8, 1))
-    actual_july_sales = defaultdict(int)
-    july_orders = OrderLineItem.objects.filter(
-        variant_id__in=variant_ids_from_sales,
-        order__order_date__gte=july_start,
-        order__order_date__lt=aug_start
-    )
-    for item in july_orders:
-        variant_obj = variant_id_map.get(item.variant_id)
-        if variant_obj:
-            actual_july_sales[variant_obj.sku] += item.quantity
-
-    # Last 7 and 30 days sales before July 1, 2025
-    last_7_start = reference_date - timedelta(days=7)
-    last_30_start = reference_date - timedelta(days=30)
-
-    last_7_sales = defaultdict(int)
-    last_30_sales = defaultdict(int)
-
-    recent_orders = OrderLineItem.objects.filter(
-        variant_id__in=variant_ids_from_sales,
-        order__order_date__gte=last_30_start,
-        order__order_date__lt=reference_date
-    )
+def _top_items_options(request):
+    """(top N, lean) from the query string: ?top= is capped at TOP_ITEMS_MAX, and lean mode (no per-SKU
+    detail blocks) switches on by itself past TOP_ITEMS_LEAN_AFTER unless ?lean=0/1 says otherwise."""
+    try:
+        top = int(request.GET.get("top", 10))
+    except ValueError:
+        top = 10
+    top = min(max(top, 1), settings.TOP_ITEMS_MAX)
+    lean = request.GET.get("lean")
+    lean = top > settings.TOP_ITEMS_LEAN_AFTER if lean is None else lean == "1"
+    return top, lean
 
-    for item in recent_orders:
-        variant_obj = variant_id_map.get(item.variant_id)
-        if not variant_obj:
-            continue
-        sku = variant_obj.sku
-        if item.order.order_date >= last_7_start:
-            last_7_sales[sku] += item.quantity
-        last_30_sales[sku] += item.quantity
 
-    # Prepare top_items with all needed fields including created_at
+def Fetching_items(request):
+    # Top N SKUs (10 by default) of Jul 2024–Jun 2025 with their features, read from the feature store in one query
+    top, lean = _top_items_options(request)
     top_items = []
-    for result in results:
-        sku = result["variant_sku"]
-        past_sales_dict = monthly_sales.get(sku, {})
-        past_sales_list = [{"month": k, "value": v} for k, v in sorted(past_sales_dict.items())]
-
-        variant_obj = sku_to_variant.get(sku)
-        created_at = None
-        if variant_obj and variant_obj.created_at:
-            created_at = variant_obj.created_at  # pass string as is or parse if needed
-
+    try:
+        features = top_features(limit=top)
+    except FeatureStoreNotReady as e:
+        # First build still running: wait on its progress page, then come back here
+        return redirect_to_job(e.job, request.get_full_path())
+    for feature in features:
         top_items.append({
-            "sku": sku,
-            "product": result["product_title"],
-            "past_sales": past_sales_list,
-            "actual_july": actual_july_sales.get(sku, 0),
-            "promo_summary": promo_data_by_sku.get(sku, {}),
-            "product_type": result["product_type"],
-            "vendor": result["vendor"],
-            "price": result["price"],
-            "sales_last_7_days": last_7_sales.get(sku, 0),
-            "sales_last_30_days": last_30_sales.get(sku, 0),
-            "created_at": created_at,
+            "sku": feature.sku,
+            "variant_id": feature.variant_id,
+            # Per-SKU fragments are cached under this, so a feature refresh renders them anew
+            "version": feature_version(feature),
+            "product": feature.product_title,
+            "past_sales": [{"month": k, "value": v} for k, v in sales_by_month(feature).items()],
+            "actual_july": feature.reference_month_sales,
+            "promo_summary": feature.promo_summary,
+            "product_type": feature.product_type,
+            "vendor": feature.vendor,
+            "price": feature.price,
+            "sales_last_7_days": feature.sales_last_7_days,
+            "sales_last_30_days": feature.sales_last_30_days,
+            "created_at": feature.created_at,
         })
+    # The generate-prompt form posts only the snapshot id; the items stay on the server. Reloads reuse
+    # the snapshot until a feature refresh changes the items
+    snapshot_id = versioned_snapshot_id(
+        "|".join(f"{item['variant_id']}:{item['version']}" for item in top_items),
+        lambda: [{field: item[field] for field in PROMPT_ITEM_FIELDS} for item in top_items],
+    )
     # return JsonResponse({"top_items": top_items})
-    return render(request, "customer/top_items.html", {"top_items": top_items})
+    # Further rows are loaded lazily from the SKU API, starting after the last one rendered here
+    last = features[-1] if len(features) == top else None
+    return render(request, "customer/top_items.html", {
+        "top_items": top_items,
+        "snapshot_id": snapshot_id,
+        "lean": lean,
+        "fragment_seconds": settings.TOP_ITEM_FRAGMENT_SECONDS,
+        "next_url": last and f"{reverse('sku_api')}?section=sales&cursor={_encode_rank_cursor(last.sales_12m, last.variant_id, top)}",
+    })
+
+
+# Fields each section of the SKU API returns, besides rank, variant_id, sku and product title
+SKU_API_SECTIONS = {
+    "catalog": ["variant_title", "product_type", "vendor", "price", "created_at"],
+    "sales": ["sales_12m", "sales_last_7_days", "sales_last_30_days", "reference_month_sales", "history_start", "monthly_sales"],
+    "promo": ["promo_summary"],
+}
+SKU_API_PAGE_SIZE = 50
+SKU_API_MAX_PAGE_SIZE = 500
+# Retry-After (s) for API and chart requests that arrive before the first feature build has finished
+FEATURES_RETRY_SECONDS = 30
+
+
+def _features_not_ready(error):
+    response = JsonResponse({"error": str(error), "job_id": error.job.id}, status=503)
+    response["Retry-After"] = FEATURES_RETRY_SECONDS
+    return response
+
+
+def _encode_rank_cursor(value, variant_id, rank):
+    """Opaque cursor: the last row's sort value and variant id, plus its rank to number the next page."""
+    payload = json.dumps([value, variant_id, rank], default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_rank_cursor(cursor):
+    try:
+        value, variant_id, rank = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return (value, int(variant_id)), int(rank)
+    except (ValueError, TypeError):
+        return None
+
+
+def sku_api(request):
+    """Ranked SKUs from the feature store, one keyset page at a time.
+
+    ?section=catalog|sales|promo picks the fields, ?sort= a column (default -sales_12m),
+    ?limit= the page size; pass the returned next_cursor as ?cursor= for the following page.
+    """
+    section = request.GET.get("section", "catalog")
+    if section not in SKU_API_SECTIONS:
+        return JsonResponse({"error": f"section must be one of {', '.join(SKU_API_SECTIONS)}"}, status=400)
+    sort = request.GET.get("sort", "-sales_12m")
+
+    try:
+        limit = min(int(request.GET.get("limit", SKU_API_PAGE_SIZE)), SKU_API_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    if limit < 1:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+
+    after, rank = None, 0
+    if request.GET.get("cursor"):
+        decoded = _decode_rank_cursor(request.GET["cursor"])
+        if decoded is None:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+        after, rank = decoded
+
+    fields = ["sku", "product_title", *SKU_API_SECTIONS[section]]
+    try:
+        # Fetch one extra row to know whether another page exists
+        rows = ranked_features(fields, sort=sort, after=after, limit=limit + 1)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except FeatureStoreNotReady as e:
+        return _features_not_ready(e)
+
+    page = rows[:limit]
+    for i, row in enumerate(page, start=rank + 1):
+        row["rank"] = i
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = _encode_rank_cursor(last[sort.lstrip("-")], last["variant_id"], rank + limit)
+
+    return JsonResponse({"section": section, "sort": sort, "items": page, "next_cursor": next_cursor})
 
 
 
@@ -1060,83 +849,50 @@ from django.http import JsonResponse
 from django.shortcuts import render
 from django.conf import settings
 from .models import Prompt
-import google.generativeai as genai
 
 
 def generate_prompt_view(request):
+    if request.method == "GET" and request.GET.get("job"):
+        return _generated_prompt_result(request, request.GET["job"])
     if request.method != "POST":
         return JsonResponse({"error": "Invalid request method"}, status=400)
 
-    try:
-        # ✅ Get prompt from DB where type = 'MainPrompt'
-        prompt_obj = Prompt.objects.get(type='MainPrompt')
-        prompt_template = prompt_obj.prompt
-    except Prompt.DoesNotExist:
+    # ✅ Get prompt from the registry where type = 'MainPrompt'
+    prompt_template = prompts.text('MainPrompt')
+    if prompt_template is None:
         return JsonResponse({"error": "MainPrompt not found."}, status=500)
 
-    total_items = int(request.POST.get("total_items", 0))
-    items_data = []
-
-    for i in range(1, total_items + 1):
-        sku = request.POST.get(f"sku_{i}")
-        product_type = request.POST.get(f"product_type_{i}")
-        vendor = request.POST.get(f"vendor_{i}")
-        price = request.POST.get(f"price_{i}")
-        sales_last_7_days = request.POST.get(f"sales_last_7_days_{i}")
-        sales_last_30_days = request.POST.get(f"sales_last_30_days_{i}")
-        created_at = request.POST.get(f"created_at_{i}")
-
-        # Promotions
-        promo_summary = {}
-        for key in request.POST.keys():
-            if key.startswith(f"promo_{i}_"):
-                parts = key.split("_")
-                if len(parts) >= 4:
-                    month = parts[2]
-                    field = "_".join(parts[3:])
-                    val = request.POST.get(key)
-                    promo_summary.setdefault(month, {})[field] = val
-
-        # Past sales
-        sales_history = {}
-        for key in request.POST.keys():
-            if key.startswith(f"sales_history_{i}_"):
-                month = key[len(f"sales_history_{i}_"):]
-                try:
-                    value = int(request.POST.get(key))
-                except (TypeError, ValueError):
-                    value = 0
-                sales_history[month] = value
-
-        past_sales = [{"month": m, "value": sales_history[m]} for m in sorted(sales_history.keys())]
-
-        items_data.append({
-            "sku": sku,
-            "product_type": product_type,
-            "vendor": vendor,
-            "price": price,
-            "sales_last_7_days": sales_last_7_days,
-            "sales_last_30_days": sales_last_30_days,
-            "created_at": created_at,
-            "promo_summary": promo_summary,
-            "past_sales": past_sales,
-        })
+    snapshot_id, items_data = _posted_items(request)
+    total_items = len(items_data)
 
-    # 📝 Store in session so handle_prompt can retrieve it later
-    request.session["top_items"] = items_data
-    request.session["total_items"] = total_items
+    # 📝 Remember the snapshot so handle_prompt can retrieve it later (only its id goes in the session)
+    remember_snapshot(request.session, snapshot_id)
 
     # 🧠 Final prompt + data
-    full_prompt = prompt_template + "\n\nItems Data (JSON):\n" + json.dumps(items_data, indent=2)
+    payload = PayloadReport("Prompt generation")
+    items_json = payload.add(json.dumps(items_data, indent=2), encode([compact_item(item) for item in items_data]))
+    payload.log()
+    full_prompt = prompt_template + "\n\nItems Data (JSON):\n" + items_json
+
+    # Gemini can take a while; a worker writes the prompt and the page polls for it
+    job = enqueue("generate_prompt", {
+        "full_prompt": full_prompt,
+        "prompt_template": prompt_template,
+        "snapshot_id": snapshot_id,
+        "total_items": total_items,
+    })
+    return redirect_to_job(job, f"{reverse('generate_prompt')}?job={job.id}")
 
-    try:
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel("models/gemini-1.5-flash")  # ✅ Use correct model
-        response = model.generate_content(full_prompt)
-        generated_prompt = response.text
-    except Exception as e:
-        return JsonResponse({"error": "Failed to call Gemini", "details": str(e)}, status=500)
 
+def _generated_prompt_result(request, job_id):
+    """Renders the page for a finished generate_prompt job."""
+    job = job_or_404(job_id, kind="generate_prompt")
+    if job.status == Job.FAILED:
+        return JsonResponse({"error": "Failed to call Gemini", "details": job.error.split("\n\n", 1)[0]}, status=500)
+    if job.status != Job.DONE:
+        return redirect_to_job(job, request.get_full_path())
+
+    items_data = _job_items(job)
 #     return JsonResponse({
 #     "prompt_from_db": str(prompt_template),
 #     "sent_data": items_data,
@@ -1145,11 +901,11 @@ def generate_prompt_view(request):
 #     "total_items": total_items
 # })
     return render(request, "customer/generated_prompt.html", {
-        "prompt_from_db": prompt_template,
+        "prompt_from_db": job.params["prompt_template"],
         "sent_data": items_data,
-        "generated_prompt": generated_prompt,
-        "top_items": items_data,   # ✅ So hidden inputs are populated
-        "total_items": total_items
+        "generated_prompt": job.result["generated_prompt"],
+        "snapshot_id": job.params.get("snapshot_id"),   # ✅ So the form carries the items
+        "total_items": job.params["total_items"]
     })
 
 
@@ -1171,173 +927,353 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-def clean_gemini_output(raw_text):
-    """Cleans Gemini output to extract JSON even if wrapped in markdown or extra text."""
-    text = raw_text.strip()
-
-    if text.startswith("```"):
-        text = text.strip("`")
-        lines = text.splitlines()
-        if lines and lines[0].strip().lower() == "json":
-            lines = lines[1:]
-        text = "\n".join(lines).strip()
-
-    start_idx = text.find("[")
-    end_idx = text.rfind("]")
-    if start_idx != -1 and end_idx != -1:
-        text = text[start_idx:end_idx + 1]
-
-    return text
-
-
 def _extract_items_from_post(request, total_items):
-    """Extracts SKU data from POST request into list of dicts."""
+    """Extracts SKU data from the per-field POST inputs of older pages into a list of dicts.
+
+    One pass over the keys: promo_<i>_<month>_<field> and sales_history_<i>_<month> are grouped by item.
+    """
+    promo_by_item = {}
+    sales_by_item = {}
+    for key in request.POST.keys():
+        if key.startswith("promo_"):
+            parts = key.split("_")
+            if len(parts) >= 4:
+                month = parts[2]
+                promo_key = "_".join(parts[3:])
+                promo_by_item.setdefault(parts[1], {}).setdefault(month, {})[promo_key] = request.POST.get(key)
+        elif key.startswith("sales_history_"):
+            index, _, month = key[len("sales_history_"):].partition("_")
+            try:
+                value = int(request.POST.get(key))
+            except (TypeError, ValueError):
+                value = 0
+            sales_by_item.setdefault(index, {})[month] = value
+
     items_data = []
     for i in range(1, total_items + 1):
-        sku = request.POST.get(f"sku_{i}")
-        product_type = request.POST.get(f"product_type_{i}")
-        vendor = request.POST.get(f"vendor_{i}")
-        price = request.POST.get(f"price_{i}")
-        sales_last_7_days = request.POST.get(f"sales_last_7_days_{i}")
-        sales_last_30_days = request.POST.get(f"sales_last_30_days_{i}")
-        created_at = request.POST.get(f"created_at_{i}")
-
-        promo_summary = {}
-        for key in request.POST.keys():
-            if key.startswith(f"promo_{i}_"):
-                parts = key.split("_")
-                if len(parts) >= 4:
-                    month = parts[2]
-                    promo_key = "_".join(parts[3:])
-                    val = request.POST.get(key)
-                    promo_summary.setdefault(month, {})[promo_key] = val
-
-        sales_history = {}
-        for key in request.POST.keys():
-            if key.startswith(f"sales_history_{i}_"):
-                month = key[len(f"sales_history_{i}_"):]
-                try:
-                    value = int(request.POST.get(key))
-                except (TypeError, ValueError):
-                    value = 0
-                sales_history[month] = value
-
-        past_sales = [{"month": m, "value": sales_history[m]} for m in sorted(sales_history.keys())]
-
+        sales_history = sales_by_item.get(str(i), {})
         items_data.append({
-            "sku": sku,
-            "product_type": product_type,
-            "vendor": vendor,
-            "price": price,
-            "sales_last_7_days": sales_last_7_days,
-            "sales_last_30_days": sales_last_30_days,
-            "created_at": created_at,
-            "promo_summary": promo_summary,
-            "past_sales": past_sales
+            "sku": request.POST.get(f"sku_{i}"),
+            "product_type": request.POST.get(f"product_type_{i}"),
+            "vendor": request.POST.get(f"vendor_{i}"),
+            "price": request.POST.get(f"price_{i}"),
+            "sales_last_7_days": request.POST.get(f"sales_last_7_days_{i}"),
+            "sales_last_30_days": request.POST.get(f"sales_last_30_days_{i}"),
+            "created_at": request.POST.get(f"created_at_{i}"),
+            "promo_summary": promo_by_item.get(str(i), {}),
+            "past_sales": [{"month": m, "value": sales_history[m]} for m in sorted(sales_history)],
         })
 
     return items_data
 
 
+def _posted_items(request):
+    """(snapshot id, items) for a form post: the snapshot it names, else a new one from its per-field inputs."""
+    snapshot_id = request.POST.get("snapshot")
+    items_data = load_snapshot(snapshot_id)
+    if items_data is not None:
+        return snapshot_id, items_data
+    total_items = int(request.POST.get("total_items", 0))
+    if total_items <= 0:
+        return None, []
+    items_data = _extract_items_from_post(request, total_items)
+    return str(save_snapshot(items_data).id), items_data
+
+
+def _job_items(job):
+    """Items of a generate_prompt / predict_items job (older jobs carry them inline)."""
+    return load_snapshot(job.params.get("snapshot_id")) or job.params.get("items_data", [])
+
+
 def handle_prompt(request):
     if request.method == "POST":
         action = request.POST.get("action")
         prompt_text = request.POST.get("prompt_text", "").strip()
 
-        # Get or create prompt object
-        prompt_obj, _ = Prompt.objects.get_or_create(type="Generated_Prompt")
-
         if action == "save":
-            prompt_obj.prompt = prompt_text
-            prompt_obj.save()
+            Prompt.objects.update_or_create(type="Generated_Prompt", defaults={"prompt": prompt_text})
             messages.success(request, "Prompt saved successfully.")
 
-            total_items = int(request.POST.get("total_items", 0))
-            if total_items > 0:
-                request.session["items_data"] = _extract_items_from_post(request, total_items)
-                print("Saved to session (save action):", request.session["items_data"])
+            snapshot_id, _ = _posted_items(request)
+            if snapshot_id:
+                remember_snapshot(request.session, snapshot_id)
+                logger.debug(f"Saved snapshot {snapshot_id} to the session (save action)")
             return redirect("handle_prompt")
 
-        elif action == "predict":
-            base_prompt = prompt_obj.prompt or ""
+        elif action in ("predict", "stream"):
+            base_prompt = prompts.text("Generated_Prompt") or ""
             if not base_prompt:
                 return JsonResponse({"error": "Please save the prompt before predicting."}, status=400)
 
-            total_items = int(request.POST.get("total_items", 0))
-            if total_items > 0:
-                items_data = _extract_items_from_post(request, total_items)
-                request.session["items_data"] = items_data
-                print("Updated session (predict action):", request.session["items_data"])  # DEBUG
+            snapshot_id, items_data = _posted_items(request)
+            if snapshot_id:
+                remember_snapshot(request.session, snapshot_id)
+                logger.debug(f"Saved snapshot {snapshot_id} to the session (predict action)")
             else:
-                items_data = request.session.get("items_data", [])
-                print("Loaded from session (predict action):", items_data)  # DEBUG
+                snapshot_id, items_data = session_snapshot(request.session)
+                items_data = items_data or []
+                logger.debug(f"Loaded snapshot {snapshot_id} from the session (predict action)")
             if not items_data:
                 return JsonResponse({"error": "No items data found to predict."}, status=400)
 
-            # Build final prompt
-            items_json = json.dumps(items_data, indent=2)
-            full_prompt = f"""
-{base_prompt}
-
-For each SKU in the following list, please predict total sales quantity for July 2025.
-
-Return ONLY a valid JSON array (no markdown).  
-Each element must have:
-- "sku" (string)
-- "july_predicted" (integer)
-- "reason" (brief explanation with algorithm and adjustments)
-
-Input SKUs data:
-{items_json}
-"""
-
-            # Call Gemini REST API directly
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                predictions = {"error": "GEMINI_API_KEY missing in .env"}
-            else:
-                url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-                headers = {"Content-Type": "application/json"}
-                payload = {
-                    "contents": [
-                        {
-                            "parts": [{"text": full_prompt}]
-                        }
-                    ]
-                }
-                try:
-                    r = requests.post(f"{url}?key={api_key}", headers=headers, json=payload, timeout=60)
-                    r.raise_for_status()
-                    result = r.json()
-
-                    # Extract text from Gemini response
-                    raw_output = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-                    cleaned_output = clean_gemini_output(raw_output)
-
-                    try:
-                        predictions = json.loads(cleaned_output)
-                    except json.JSONDecodeError:
-                        predictions = {
-                            "raw_output": raw_output,
-                            "note": "Gemini response was not valid JSON. Showing raw output instead."
-                        }
-
-                except Exception as e:
-                    predictions = {"error": "Gemini API request failed", "details": str(e)}
+            if not settings.GEMINI_API_KEY:
+                return render(request, "customer/predictions_results.html", {
+                    "predictions": {"error": "GEMINI_API_KEY missing in .env"},
+                    "items": items_data,
+                    "prompt_used": base_prompt
+                })
+
+            if action == "stream":
+                # The page opens an event stream and fills in each SKU as Gemini writes it
+                return render(request, "customer/predictions_results.html", {
+                    "predictions": [],
+                    "items": items_data,
+                    "prompt_used": base_prompt,
+                    "stream_url": reverse("stream_predictions"),
+                })
+
+            # Forecasting many SKUs takes minutes; a worker runs it and the page polls
+            job = enqueue("predict_items", {"base_prompt": base_prompt, "snapshot_id": snapshot_id})
+            return redirect_to_job(job, f"{reverse('handle_prompt')}?job={job.id}")
+
+    elif request.GET.get("job"):
+        job = job_or_404(request.GET["job"], kind="predict_items")
+        if job.status not in (Job.DONE, Job.FAILED):
+            return redirect_to_job(job, request.get_full_path())
+        if job.status == Job.FAILED:
+            predictions = {"error": job.error.split("\n\n", 1)[0]}
+        else:
+            predictions = job.result["predictions"]
 #             return JsonResponse({
 #     "predictions": predictions,
 #     "items_sent": items_data,
 #     "prompt_used": base_prompt
 # }, json_dumps_params={"indent": 2})
 
-            return render(request, "customer/predictions_results.html", {
-                "predictions": predictions,
-                "items": items_data,
-                "prompt_used": base_prompt
-            })
+        return render(request, "customer/predictions_results.html", {
+            "predictions": predictions,
+            "items": _job_items(job),
+            "prompt_used": job.params["base_prompt"]
+        })
 
     else:
-        prompt_obj = Prompt.objects.filter(type="Generated_Prompt").first()
         return render(request, "customer/generated_prompt.html", {
-            "generated_prompt": prompt_obj.prompt if prompt_obj else "",
+            "generated_prompt": prompts.text("Generated_Prompt") or "",
+            "snapshot_id": request.session.get(SESSION_KEY),
         })
+
+
+# =====================================================================================================
+# Promotion ROI per category level, served from the PromotionCategoryRollup table
+
+from .models import CATEGORY_LEVEL_FIELDS, PromotionCategoryRollup
+
+
+def promotion_category_rollup_view(request):
+    """?month=YYYY-MM (repeatable) &level=0..5 -> spend, ROAS, CTR, conv. rate per category."""
+    try:
+        level = int(request.GET.get("level", 1))
+    except ValueError:
+        return JsonResponse({"error": "level must be an integer"}, status=400)
+    if not 0 <= level <= len(CATEGORY_LEVEL_FIELDS):
+        return JsonResponse({"error": f"level must be between 0 and {len(CATEGORY_LEVEL_FIELDS)}"}, status=400)
+
+    rollups = PromotionCategoryRollup.objects.filter(level=level)
+    months = request.GET.getlist("month")
+    if months:
+        rollups = rollups.filter(month__in=months)
+
+    rows = []
+    for r in rollups.order_by("month", "-spend"):
+        rows.append({
+            "month": r.month,
+            "category": r.category_path,
+            "categories": [getattr(r, f) for f in CATEGORY_LEVEL_FIELDS[:level]],
+            "products": r.products,
+            "impressions": r.impressions,
+            "clicks": r.clicks,
+            "spend": float(r.spend),
+            "conversions": float(r.conversions),
+            "conv_value": float(r.conv_value),
+            "revenue": float(r.revenue),
+            "gross_profit": float(r.gross_profit),
+            "roas": r.roas,
+            "ctr": r.ctr,
+            "conv_rate": r.conv_rate,
+        })
+    return JsonResponse({"level": level, "rows": rows})
+
+
+# =====================================================================================================
+# Local statistical baseline for the whole catalog (no Gemini round trip)
+
+def baseline_forecast_view(request):
+    """?method=exponential_smoothing|seasonal_naive|moving_average|prophet &horizon=N &history=months
+
+    method=prophet returns the stored fits from manage.py fit_prophet_models as-is.
+    """
+    method = request.GET.get("method", DEFAULT_METHOD)
+    if method == "prophet":
+        forecasts = stored_forecasts()
+        return JsonResponse({"method": method, "sku_count": len(forecasts), "forecasts": forecasts})
+    if method not in FORECAST_METHODS:
+        return JsonResponse({"error": f"method must be one of {sorted(FORECAST_METHODS) + ['prophet']}"}, status=400)
+    try:
+        horizon = max(1, min(int(request.GET.get("horizon", 1)), 24))
+        history_months = max(1, min(int(request.GET.get("history", 24)), 120))
+    except ValueError:
+        return JsonResponse({"error": "horizon and history must be integers"}, status=400)
+
+    started = time.monotonic()
+    forecasts = forecast_catalog(horizon=horizon, method=method, history_months=history_months)
+    return JsonResponse({
+        "method": method,
+        "horizon": horizon,
+        "sku_count": len(forecasts),
+        "seconds": round(time.monotonic() - started, 3),
+        "forecasts": forecasts,
+    })
+
+
+
+# =====================================================================================================
+# Server-rendered charts, cached on disk per SKU, range and data version
+
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from .chart_render import CONTENT_TYPES
+from .charts import cached_chart, chart_spec
+
+
+def sku_chart_view(request, sku, kind, fmt):
+    """/charts/<sku>/history.png|svg ?months=N, /charts/<sku>/forecast.png|svg ?months=N&method=...
+
+    Answers 304 to a matching If-None-Match without touching the image.
+    """
+    if fmt not in CONTENT_TYPES:
+        raise Http404("Unknown chart format")
+    try:
+        months = int(request.GET.get("months", 12))
+    except ValueError:
+        return JsonResponse({"error": "months must be an integer"}, status=400)
+    try:
+        chart = chart_spec(kind, sku, months, request.GET.get("method"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except FeatureStoreNotReady as e:
+        return _features_not_ready(e)
+    if chart is None:
+        raise Http404("No chart data for this SKU")
+
+    key, spec = chart
+    etag = f'"{key}-{fmt}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(cached_chart(key, spec, fmt), content_type=CONTENT_TYPES[fmt])
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"  # always revalidate; a 304 costs one indexed query
+    return response
+
+
+# =====================================================================================================
+# Background jobs: status polling for pages that enqueue work (see customer/jobs.py)
+
+from urllib.parse import urlencode
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.http import url_has_allowed_host_and_scheme
+from .jobs import job_payload
+from .models import Job
+
+
+def job_or_404(job_id, **filters):
+    """The Job with this id (and filters); 404 for a missing or malformed id such as ?job=abc."""
+    try:
+        job_id = int(job_id)
+    except (TypeError, ValueError):
+        raise Http404("No such job")
+    return get_object_or_404(Job, id=job_id, **filters)
+
+
+def redirect_to_job(job, next_url):
+    """Sends the browser to the progress page, which moves on to next_url once the job finishes."""
+    return redirect(f"{reverse('job_wait', args=[job.id])}?{urlencode({'next': next_url})}")
+
+
+def job_status_view(request, job_id):
+    job = job_or_404(job_id)
+    return JsonResponse(job_payload(job))
+
+
+def job_wait_view(request, job_id):
+    job = job_or_404(job_id)
+    next_url = request.GET.get("next", "")
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = ""
+    return render(request, "customer/job_wait.html", {"job": job, "next_url": next_url})
+
+
+# =====================================================================================================
+# Live predictions: server-sent events, one "prediction" event per SKU as Gemini streams it
+
+from contextlib import closing
+
+from django.http import StreamingHttpResponse
+from .prompt_workflow import stream_item_predictions
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_predictions_view(request):
+    """Streams predictions for the items handle_prompt stored in the session."""
+    base_prompt = prompts.text("Generated_Prompt") or ""
+    items_data = session_snapshot(request.session)[1] or []
+
+    def events():
+        if not base_prompt or not items_data:
+            yield _sse("failed", {"error": "Save the prompt and select items before predicting."})
+            return
+        # Padding pushes the first bytes through proxy buffers straight away
+        yield ":" + " " * 2048 + "\n\n"
+        count = 0
+        try:
+            # Django closes events() when the client disconnects; that closes the Gemini stream too
+            with closing(stream_item_predictions(base_prompt, items_data)) as rows:
+                for row in rows:
+                    count += 1
+                    yield _sse("prediction", row)
+        except Exception as e:
+            logger.error(f"Prediction stream failed: {e}")
+            yield _sse("failed", {"error": str(e)})
+            return
+        yield _sse("done", {"count": count})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# =====================================================================================================
+# Rolling request / job metrics of this process (queries, HTTP calls, render time per view)
+
+from django.http import HttpResponseForbidden
+from .instrumentation import aggregate
+from .jobs import job_metrics_summary
+
+
+def metrics_view(request):
+    """Per-view aggregate of the last METRICS_WINDOW requests and per-kind summary of the last
+    METRICS_WINDOW finished jobs; ?reset=1 starts a fresh window for the views.
+
+    Open in DEBUG, otherwise staff only. Each server process keeps its own view numbers; job numbers
+    come from the Job rows, so they cover every worker.
+    """
+    if not (settings.DEBUG or request.user.is_staff):
+        return HttpResponseForbidden("Staff only")
+    summary = aggregate.summary()
+    if request.GET.get("reset") == "1":
+        aggregate.reset()
+    return JsonResponse({"views": summary, "jobs": job_metrics_summary()})